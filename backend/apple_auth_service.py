@@ -11,20 +11,147 @@ Date: 2024
 """
 
 import json
-import base64
+import asyncio
 import logging
+import os
+import re
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Any, List
+from typing import Dict, Optional, Any
 import httpx
 import jwt
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
 from jose import jwt as jose_jwt
 import secrets
 import string
 
+from http_clients import get_async_client, register_async_client
+
 logger = logging.getLogger(__name__)
 
+APPLE_PUBLIC_KEYS_URL = "https://appleid.apple.com/auth/keys"
+
+# Used when Apple's response carries no Cache-Control max-age
+APPLE_JWKS_DEFAULT_TTL_SECONDS = int(os.getenv("APPLE_JWKS_DEFAULT_TTL_SECONDS", "3600"))
+# Minimum time between refreshes triggered by an unknown kid or expiry
+APPLE_JWKS_MIN_REFRESH_SECONDS = int(os.getenv("APPLE_JWKS_MIN_REFRESH_SECONDS", "60"))
+
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+register_async_client("apple_auth", provider="apple", timeout=10.0)
+
+
+class AppleJWKSCache:
+    """
+    Process-wide cache of Apple's Sign in with Apple signing keys.
+    
+    Keys are parsed once into RSA public key objects and indexed by ``kid``.
+    The key set is refetched when its Cache-Control lifetime runs out or a
+    token names a kid that is not cached, at most once per
+    APPLE_JWKS_MIN_REFRESH_SECONDS. If a refresh fails the previous keys stay
+    in use. Fetches go through the shared "apple_auth" HTTP client.
+    """
+    
+    def __init__(self, url: str = APPLE_PUBLIC_KEYS_URL):
+        self.url = url
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._last_fetch_attempt: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+    
+    async def get_key(self, kid: str) -> Optional[Any]:
+        """
+        Return the public key for a kid, refreshing the key set if needed.
+        
+        Args:
+            kid (str): Key ID from the token header
+            
+        Returns:
+            Optional[Any]: RSA public key object, None if Apple has no such key
+        """
+        now = time.monotonic()
+        if kid in self._keys and now < self._expires_at:
+            return self._keys[kid]
+        
+        if self._last_fetch_attempt is None or now - self._last_fetch_attempt >= APPLE_JWKS_MIN_REFRESH_SECONDS:
+            await self.refresh()
+        else:
+            logger.debug(f"Apple JWKS refresh for kid {kid} skipped (rate limited)")
+        
+        return self._keys.get(kid)
+    
+    async def refresh(self) -> bool:
+        """
+        Fetch Apple's key set, coalescing concurrent refreshes into one request.
+        
+        Returns:
+            bool: True if the cache holds a freshly fetched key set
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        
+        attempt_seen = self._last_fetch_attempt
+        async with self._lock:
+            # Another caller refreshed while we waited for the lock
+            if self._last_fetch_attempt != attempt_seen:
+                return bool(self._keys)
+            self._last_fetch_attempt = time.monotonic()
+            
+            try:
+                response = await get_async_client("apple_auth").get(self.url)
+                if response.status_code != 200:
+                    logger.error(f"Failed to fetch Apple public keys: {response.status_code}")
+                    return False
+                
+                keys = {}
+                for key_data in response.json().get('keys', []):
+                    try:
+                        keys[key_data['kid']] = RSAAlgorithm.from_jwk(json.dumps(key_data))
+                    except Exception as e:
+                        logger.error(f"Error constructing public key {key_data.get('kid')}: {str(e)}")
+                
+                if not keys:
+                    logger.error("Apple public key response contained no usable keys")
+                    return False
+                
+                self._keys = keys
+                self._expires_at = time.monotonic() + self._ttl_seconds(response)
+                logger.info(f"Loaded {len(keys)} Apple public keys")
+                return True
+                
+            except Exception as e:
+                logger.error(f"Error fetching Apple public keys: {str(e)}")
+                return False
+    
+    def _ttl_seconds(self, response: httpx.Response) -> float:
+        """
+        Key set lifetime from Cache-Control (max-age minus Age).
+        """
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control or 'no-cache' in cache_control:
+            return 0.0
+        
+        match = _MAX_AGE_PATTERN.search(cache_control)
+        if not match:
+            return float(APPLE_JWKS_DEFAULT_TTL_SECONDS)
+        
+        try:
+            age = int(response.headers.get('Age', '0'))
+        except ValueError:
+            age = 0
+        return float(max(int(match.group(1)) - age, 0))
+
+
+apple_jwks_cache = AppleJWKSCache()
+
+
+async def prewarm_apple_jwks():
+    """
+    Load Apple's public keys before the first sign-in (called on startup).
+    """
+    await apple_jwks_cache.refresh()
+
+
 class AppleAuthService:
     """
     Service class for Sign in with Apple authentication.
@@ -50,7 +177,7 @@ class AppleAuthService:
         self.client_id = client_id
         self.key_id = key_id
         self.private_key = private_key
-        self.apple_public_keys_url = "https://appleid.apple.com/auth/keys"
+        self.apple_public_keys_url = APPLE_PUBLIC_KEYS_URL
         self.apple_token_url = "https://appleid.apple.com/auth/token"
         
     async def validate_apple_token(self, identity_token: str) -> Optional[Dict[str, Any]]:
@@ -64,9 +191,6 @@ class AppleAuthService:
             Optional[Dict]: User information if valid, None otherwise
         """
         try:
-            # Get Apple's public keys
-            public_keys = await self._get_apple_public_keys()
-            
             # Decode token header to get key ID
             header = jwt.get_unverified_header(identity_token)
             key_id = header.get('kid')
@@ -76,11 +200,7 @@ class AppleAuthService:
                 return None
             
             # Find the correct public key
-            public_key = None
-            for key in public_keys:
-                if key['kid'] == key_id:
-                    public_key = self._construct_public_key(key)
-                    break
+            public_key = await apple_jwks_cache.get_key(key_id)
             
             if not public_key:
                 logger.error(f"Public key not found for key ID: {key_id}")
@@ -172,91 +292,35 @@ class AppleAuthService:
                 'grant_type': 'refresh_token'
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.apple_token_url,
-                    data=data,
-                    headers={'Content-Type': 'application/x-www-form-urlencoded'}
-                )
+            client = get_async_client("apple_auth")
+            response = await client.post(
+                self.apple_token_url,
+                data=data,
+                headers={'Content-Type': 'application/x-www-form-urlencoded'}
+            )
+            
+            if response.status_code == 200:
+                token_data = response.json()
                 
-                if response.status_code == 200:
-                    token_data = response.json()
-                    
-                    # Validate the new identity token
-                    user_info = await self.validate_apple_token(token_data.get('id_token'))
-                    
-                    if user_info:
-                        return {
-                            'access_token': token_data.get('access_token'),
-                            'refresh_token': token_data.get('refresh_token'),
-                            'id_token': token_data.get('id_token'),
-                            'expires_in': token_data.get('expires_in'),
-                            'user_info': user_info
-                        }
+                # Validate the new identity token
+                user_info = await self.validate_apple_token(token_data.get('id_token'))
                 
-                logger.error(f"Token refresh failed: {response.status_code} - {response.text}")
-                return None
+                if user_info:
+                    return {
+                        'access_token': token_data.get('access_token'),
+                        'refresh_token': token_data.get('refresh_token'),
+                        'id_token': token_data.get('id_token'),
+                        'expires_in': token_data.get('expires_in'),
+                        'user_info': user_info
+                    }
+            
+            logger.error(f"Token refresh failed: {response.status_code} - {response.text}")
+            return None
                 
         except Exception as e:
             logger.error(f"Error refreshing Apple token: {str(e)}")
             return None
     
-    async def _get_apple_public_keys(self) -> List[Dict[str, Any]]:
-        """
-        Fetch Apple's public keys for token validation.
-        
-        Returns:
-            List[Dict]: Apple's public keys
-        """
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.apple_public_keys_url)
-                
-                if response.status_code == 200:
-                    keys_data = response.json()
-                    return keys_data.get('keys', [])
-                else:
-                    logger.error(f"Failed to fetch Apple public keys: {response.status_code}")
-                    return []
-                    
-        except Exception as e:
-            logger.error(f"Error fetching Apple public keys: {str(e)}")
-            return []
-    
-    def _construct_public_key(self, key_data: Dict[str, Any]) -> str:
-        """
-        Construct RSA public key from Apple's key data.
-        
-        Args:
-            key_data (Dict): Apple's key information
-            
-        Returns:
-            str: PEM formatted public key
-        """
-        try:
-            # Extract key components
-            n = base64.urlsafe_b64decode(key_data['n'] + '==')
-            e = base64.urlsafe_b64decode(key_data['e'] + '==')
-            
-            # Convert to integers
-            n_int = int.from_bytes(n, 'big')
-            e_int = int.from_bytes(e, 'big')
-            
-            # Create RSA public key
-            public_key = rsa.RSAPublicNumbers(e_int, n_int).public_key()
-            
-            # Serialize to PEM format
-            pem_key = public_key.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo
-            )
-            
-            return pem_key.decode('utf-8')
-            
-        except Exception as e:
-            logger.error(f"Error constructing public key: {str(e)}")
-            raise
-    
     def _create_client_secret(self) -> str:
         """
         Create client secret for Apple authentication.
@@ -10,13 +10,13 @@ Date: 2024
 
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
-from urllib.parse import urljoin
+import os
+import weakref
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, AsyncIterator, List, Dict, Optional, Any, Tuple
+from urllib.parse import quote, urljoin, urlsplit
 import httpx
-import caldav
-from caldav import Calendar, Event
-from icalendar import Calendar as ICalendar, Event as IEvent
 import json
 import base64
 from cryptography.hazmat.primitives import serialization
@@ -26,8 +26,79 @@ from jose import jwt as jose_jwt
 import secrets
 import string
 
+from ical_stream_parser import (
+    APPLE_PARSE_POOL_THRESHOLD_BYTES,
+    MultistatusParser,
+    event_from_response,
+    get_parse_pool,
+    parse_ical_event,
+    parse_multistatus_events,
+    parse_sync_collection,
+)
+from http_clients import get_async_client, get_session, register_async_client, register_session
+from metrics import PARSE_POOL_JOBS_IN_FLIGHT
+from provider_calls import method_operation
+from recurrence import expand_events
+
+if TYPE_CHECKING:
+    # caldav and icalendar are slow to import; they load on first CalDAV use
+    from caldav import Calendar, Event
+
 logger = logging.getLogger(__name__)
 
+# XML namespaces used in WebDAV / CalDAV requests and responses
+DAV_NS = "DAV:"
+CALDAV_NS = "urn:ietf:params:xml:ns:caldav"
+CALENDARSERVER_NS = "http://calendarserver.org/ns/"
+
+# Maximum number of hrefs requested in a single calendar-multiget REPORT
+MULTIGET_BATCH_SIZE = 100
+
+# Maximum number of concurrent CalDAV calendar searches per user
+APPLE_CALDAV_CONCURRENCY = int(os.getenv("APPLE_CALDAV_CONCURRENCY", "4"))
+
+register_async_client("caldav", provider="apple", operation=method_operation,
+                      timeout=30.0, follow_redirects=True)
+# Used by the caldav library for principal discovery and its own requests
+register_session("caldav_sync", timeout=30.0, provider="apple", operation=method_operation)
+
+# Per-user semaphores shared by all service instances in this process. Weak
+# values: a user's entry goes away once no search holds its semaphore.
+_user_search_semaphores: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = \
+    weakref.WeakValueDictionary()
+
+
+def _day_aligned_window(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    """
+    Widen a window to whole days, so repeated searches share OccurrenceCache keys.
+    """
+    midnight = {"hour": 0, "minute": 0, "second": 0, "microsecond": 0}
+    aligned_start = start.replace(**midnight)
+    aligned_end = end.replace(**midnight)
+    if aligned_end < end:
+        aligned_end += timedelta(days=1)
+    return aligned_start, aligned_end
+
+
+def _get_user_search_semaphore(user_id: str) -> asyncio.Semaphore:
+    """
+    Return the semaphore capping concurrent CalDAV searches for a user.
+    """
+    semaphore = _user_search_semaphores.get(user_id)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(APPLE_CALDAV_CONCURRENCY)
+        _user_search_semaphores[user_id] = semaphore
+    return semaphore
+
+
+class InvalidSyncTokenError(Exception):
+    """Raised when the CalDAV server no longer accepts a stored sync token."""
+
+
+class EtagMismatchError(Exception):
+    """Raised when a conditional write fails because the resource changed on the server."""
+
+
 class AppleCalendarService:
     """
     Service class for Apple Calendar integration using CalDAV protocol.
@@ -54,6 +125,7 @@ class AppleCalendarService:
         self.caldav_url = "https://caldav.icloud.com"
         self.client = None
         self.principal = None
+        self.http_auth = httpx.BasicAuth(apple_id, app_specific_password)
         
     async def connect(self) -> bool:
         """
@@ -63,15 +135,19 @@ class AppleCalendarService:
             bool: True if connection successful, False otherwise
         """
         try:
+            import caldav
+            
             # Initialize CalDAV client
             self.client = caldav.DAVClient(
                 url=self.caldav_url,
                 username=self.apple_id,
                 password=self.app_specific_password
             )
+            # Reuse the shared pool; credentials are still sent per request
+            self.client.session = get_session("caldav_sync")
             
             # Get principal (user's calendar collection)
-            self.principal = self.client.principal()
+            self.principal = await asyncio.to_thread(self.client.principal)
             
             logger.info(f"Successfully connected to Apple Calendar for user {self.user_id}")
             return True
@@ -91,7 +167,7 @@ class AppleCalendarService:
             if not self.principal:
                 await self.connect()
             
-            calendars = self.principal.calendars()
+            calendars = await asyncio.to_thread(self.principal.calendars)
             calendar_list = []
             
             for calendar in calendars:
@@ -125,48 +201,276 @@ class AppleCalendarService:
             List[Dict]: List of event data
         """
         try:
-            if not self.principal:
-                await self.connect()
+            return [event async for event in self.iter_events(calendar_id, start_date, end_date)]
             
-            # Set default date range if not provided
-            if not start_date:
-                start_date = datetime.now() - timedelta(days=30)
-            if not end_date:
-                end_date = datetime.now() + timedelta(days=365)
+        except Exception as e:
+            logger.error(f"Error fetching Apple Calendar events: {str(e)}")
+            return []
+    
+    async def iter_events(self, calendar_id: str = None, start_date: datetime = None,
+                          end_date: datetime = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream events from Apple Calendar as each calendar responds.
+        
+        Calendars are searched concurrently (at most APPLE_CALDAV_CONCURRENCY
+        at a time per user) and events are yielded in completion order, so a
+        slow shared or subscribed calendar does not hold back the others.
+        
+        Args:
+            calendar_id (str): Specific calendar ID (optional)
+            start_date (datetime): Start date for event range
+            end_date (datetime): End date for event range
             
-            events = []
-            calendars = self.principal.calendars()
+        Yields:
+            Dict: Event data
+        """
+        if not self.principal:
+            await self.connect()
+        
+        # Set default date range if not provided. The window is day-aligned
+        # (as for /api/events) so recurring series expansions stay cacheable.
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if not start_date:
+            start_date = today - timedelta(days=30)
+        if not end_date:
+            end_date = today + timedelta(days=365)
+        start_date, end_date = _day_aligned_window(start_date, end_date)
+        
+        calendars = await asyncio.to_thread(self.principal.calendars)
+        semaphore = _get_user_search_semaphore(str(self.user_id))
+        
+        async def search(calendar: "Calendar") -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await asyncio.to_thread(self._search_calendar, calendar, start_date, end_date)
+        
+        tasks = [
+            asyncio.create_task(search(calendar))
+            for calendar in calendars
+            if not calendar_id or calendar.id == calendar_id
+        ]
+        
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for event_data in await next_done:
+                    yield event_data
+        finally:
+            # Stops searches still waiting for the semaphore; a search already
+            # running in a worker thread finishes and its result is discarded.
+            # Awaiting the tasks retrieves their exceptions, so failed searches
+            # are not reported as never retrieved.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _search_calendar(self, calendar: "Calendar", start_date: datetime,
+                         end_date: datetime) -> List[Dict[str, Any]]:
+        """
+        Search and parse one calendar (blocking; runs in a worker thread).
+        
+        Args:
+            calendar (Calendar): CalDAV calendar to search
+            start_date (datetime): Start date for event range
+            end_date (datetime): End date for event range
             
-            for calendar in calendars:
-                if calendar_id and calendar.id != calendar_id:
-                    continue
-                
-                try:
-                    # Search for events in date range
-                    search_results = calendar.search(
-                        start=start_date,
-                        end=end_date,
-                        event=True,
-                        expand=True
-                    )
-                    
-                    for event in search_results:
-                        event_data = self._parse_ical_event(event)
-                        if event_data:
-                            event_data['calendar_source'] = 'apple'
-                            event_data['calendar_id'] = calendar.id
-                            event_data['calendar_name'] = calendar.name
-                            events.append(event_data)
-                            
-                except Exception as e:
-                    logger.warning(f"Error fetching events from calendar {calendar.name}: {str(e)}")
-                    continue
+        Returns:
+            List[Dict]: Parsed events, empty if the calendar could not be read
+        """
+        events = []
+        
+        try:
+            # Search for events in date range. Series come back as masters and
+            # are expanded here rather than by the server.
+            search_results = calendar.search(
+                start=start_date,
+                end=end_date,
+                event=True,
+                expand=False
+            )
             
-            return events
+            for event in search_results:
+                event_data = self._parse_ical_event(event)
+                if event_data:
+                    event_data['user_id'] = self.user_id
+                    event_data['calendar_source'] = 'apple'
+                    event_data['calendar_id'] = calendar.id
+                    event_data['calendar_name'] = calendar.name
+                    events.append(event_data)
             
+            events = expand_events(events, start_date, end_date)
+                    
         except Exception as e:
-            logger.error(f"Error fetching Apple Calendar events: {str(e)}")
-            return []
+            logger.warning(f"Error fetching events from calendar {calendar.name}: {str(e)}")
+        
+        return events
+    
+    async def get_calendar_sync_info(self, calendar_url: str) -> Dict[str, Optional[str]]:
+        """
+        Fetch the ctag and current sync token of a calendar collection.
+        
+        The ctag changes whenever anything in the collection changes, so comparing
+        it with the stored value lets callers skip unchanged calendars entirely.
+        
+        Args:
+            calendar_url (str): Absolute URL of the calendar collection
+            
+        Returns:
+            Dict: {'ctag': str or None, 'sync_token': str or None}
+        """
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<d:propfind xmlns:d="DAV:" xmlns:cs="http://calendarserver.org/ns/">'
+            '<d:prop><cs:getctag/><d:sync-token/></d:prop>'
+            '</d:propfind>'
+        )
+        response = await self._dav_request("PROPFIND", calendar_url, body, {"Depth": "0"})
+        response.raise_for_status()
+        
+        root = ET.fromstring(response.content)
+        ctag = root.find(f".//{{{CALENDARSERVER_NS}}}getctag")
+        sync_token = root.find(f".//{{{DAV_NS}}}sync-token")
+        return {
+            'ctag': ctag.text if ctag is not None else None,
+            'sync_token': sync_token.text if sync_token is not None else None
+        }
+    
+    async def sync_calendar(self, calendar_url: str, sync_token: str = None) -> Dict[str, Any]:
+        """
+        Run an RFC 6578 sync-collection REPORT against a calendar.
+        
+        Without a sync token the server reports every member of the collection
+        (initial/full sync). With a token only members changed or removed since
+        that token are reported.
+        
+        Args:
+            calendar_url (str): Absolute URL of the calendar collection
+            sync_token (str): Token returned by a previous sync (optional)
+            
+        Returns:
+            Dict: {'changed': [{'href', 'etag'}], 'deleted': [href], 'sync_token': str}
+            
+        Raises:
+            InvalidSyncTokenError: If the server rejects the supplied sync token
+        """
+        changed: Dict[str, Optional[str]] = {}
+        deleted = set()
+        token = sync_token
+        
+        while True:
+            body = (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                '<d:sync-collection xmlns:d="DAV:">'
+                f'<d:sync-token>{token or ""}</d:sync-token>'
+                '<d:sync-level>1</d:sync-level>'
+                '<d:prop><d:getetag/></d:prop>'
+                '</d:sync-collection>'
+            )
+            response = await self._dav_request("REPORT", calendar_url, body, {"Depth": "1"})
+            
+            # RFC 6578 3.2: an invalid token yields 403/409 with DAV:valid-sync-token
+            if response.status_code in (403, 409, 410) and token:
+                raise InvalidSyncTokenError(
+                    f"Sync token rejected for {calendar_url}: HTTP {response.status_code}"
+                )
+            response.raise_for_status()
+            
+            entries, new_token, truncated = parse_sync_collection(response.content, calendar_url)
+            for href, etag, is_deleted in entries:
+                if is_deleted:
+                    deleted.add(href)
+                    changed.pop(href, None)
+                else:
+                    changed[href] = etag
+                    deleted.discard(href)
+            
+            token = new_token or token
+            if not truncated:
+                break
+        
+        return {
+            'changed': [{'href': href, 'etag': etag} for href, etag in changed.items()],
+            'deleted': list(deleted),
+            'sync_token': token
+        }
+    
+    async def fetch_events_by_href(self, calendar_url: str, hrefs: List[str],
+                                   include_ical: bool = False) -> List[Dict[str, Any]]:
+        """
+        Download specific calendar resources with a calendar-multiget REPORT.
+        
+        Args:
+            calendar_url (str): Absolute URL of the calendar collection
+            hrefs (List[str]): Absolute URLs of the resources to fetch
+            include_ical (bool): Also return the raw VCALENDAR text as 'ical_data'
+            
+        Returns:
+            List[Dict]: Parsed event data, each including its 'href' and 'etag'
+        """
+        events = []
+        
+        for offset in range(0, len(hrefs), MULTIGET_BATCH_SIZE):
+            batch = hrefs[offset:offset + MULTIGET_BATCH_SIZE]
+            href_xml = "".join(
+                f"<d:href>{self._xml_escape(self._href_path(href))}</d:href>" for href in batch
+            )
+            body = (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                '<c:calendar-multiget xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">'
+                '<d:prop><d:getetag/><c:calendar-data/></d:prop>'
+                f'{href_xml}'
+                '</c:calendar-multiget>'
+            )
+            events.extend(await self._report_events(calendar_url, body))
+        
+        if not include_ical:
+            for event_data in events:
+                event_data.pop('ical_data', None)
+        
+        return events
+    
+    async def _report_events(self, calendar_url: str, body: str) -> List[Dict[str, Any]]:
+        """
+        Send a calendar REPORT and parse the events in its multistatus response.
+        
+        The response is parsed while it streams in. Responses whose
+        Content-Length exceeds APPLE_PARSE_POOL_THRESHOLD_BYTES are read fully
+        and parsed in a process pool instead, keeping the event loop free.
+        
+        Args:
+            calendar_url (str): Absolute URL of the calendar collection
+            body (str): REPORT request body
+            
+        Returns:
+            List[Dict]: Parsed event data including 'href', 'etag' and 'ical_data'
+        """
+        client = self._get_http_client()
+        headers = {"Content-Type": "application/xml; charset=utf-8", "Depth": "1"}
+        
+        async with client.stream("REPORT", calendar_url, content=body.encode('utf-8'),
+                                 headers=headers, auth=self.http_auth) as response:
+            response.raise_for_status()
+            
+            content_length = int(response.headers.get("Content-Length") or 0)
+            if APPLE_PARSE_POOL_THRESHOLD_BYTES and content_length > APPLE_PARSE_POOL_THRESHOLD_BYTES:
+                content = await response.aread()
+                loop = asyncio.get_running_loop()
+                with PARSE_POOL_JOBS_IN_FLIGHT.track_inprogress():
+                    return await loop.run_in_executor(
+                        get_parse_pool(), parse_multistatus_events, content, calendar_url
+                    )
+            
+            events = []
+            parser = MultistatusParser()
+            async for chunk in response.aiter_bytes():
+                for href, etag, calendar_data, _ in parser.feed(chunk):
+                    event_data = event_from_response(href, etag, calendar_data, calendar_url)
+                    if event_data:
+                        events.append(event_data)
+            for href, etag, calendar_data, _ in parser.close():
+                event_data = event_from_response(href, etag, calendar_data, calendar_url)
+                if event_data:
+                    events.append(event_data)
+            
+            return events
     
     async def create_event(self, event_data: Dict[str, Any], calendar_id: str = None) -> Optional[str]:
         """
@@ -179,11 +483,30 @@ class AppleCalendarService:
         Returns:
             Optional[str]: Event ID if successful, None otherwise
         """
+        resource = await self.create_event_resource(event_data, calendar_id)
+        return resource['id'] if resource else None
+    
+    async def create_event_resource(self, event_data: Dict[str, Any],
+                                    calendar_id: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Create a new event and return where it was stored.
+        
+        The event is written with a single conditional PUT to
+        ``<calendar>/<uid>.ics`` so the caller can record the resource href and
+        etag and address later updates and deletes to it directly.
+        
+        Args:
+            event_data (Dict): Event information
+            calendar_id (str): Target calendar ID
+            
+        Returns:
+            Optional[Dict]: {'id', 'href', 'etag', 'calendar_id'} if successful, None otherwise
+        """
         try:
             if not self.principal:
                 await self.connect()
             
-            calendars = self.principal.calendars()
+            calendars = await asyncio.to_thread(self.principal.calendars)
             target_calendar = None
             
             # Find target calendar
@@ -200,23 +523,126 @@ class AppleCalendarService:
                 raise Exception("No calendar available for event creation")
             
             # Create iCal event
-            ical_event = self._create_ical_event(event_data)
-            
-            # Save event to calendar
-            event = target_calendar.save_event(ical_event)
+            uid = event_data.get('id') or self._generate_uid()
+            ical_event = self._create_ical_event({**event_data, 'id': uid})
+            
+            calendar_url = str(target_calendar.url)
+            if not calendar_url.endswith('/'):
+                calendar_url += '/'
+            href = urljoin(calendar_url, f"{quote(uid, safe='')}.ics")
+            
+            # If-None-Match guards against overwriting an existing resource
+            response = await self._dav_request(
+                "PUT",
+                href,
+                ical_event,
+                {"Content-Type": "text/calendar; charset=utf-8", "If-None-Match": "*"}
+            )
+            response.raise_for_status()
             
             logger.info(f"Successfully created Apple Calendar event for user {self.user_id}")
-            return event.id if hasattr(event, 'id') else str(event.url)
+            return {
+                'id': uid,
+                'href': href,
+                'etag': response.headers.get('ETag'),
+                'calendar_id': target_calendar.id
+            }
             
         except Exception as e:
             logger.error(f"Error creating Apple Calendar event: {str(e)}")
             return None
     
+    async def get_event_resource(self, href: str) -> Optional[Dict[str, Any]]:
+        """
+        Download the raw iCalendar payload of a single event resource.
+        
+        Args:
+            href (str): Absolute URL of the event resource
+            
+        Returns:
+            Optional[Dict]: {'ical_data', 'etag'}, or None if the resource does not exist
+        """
+        response = await self._dav_request("GET", href)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        
+        return {'ical_data': response.text, 'etag': response.headers.get('ETag')}
+    
+    async def update_event_resource(self, href: str, event_data: Dict[str, Any],
+                                    etag: str = None) -> Dict[str, Optional[str]]:
+        """
+        Update an event resource in place, addressed by its href.
+        
+        The stored VCALENDAR is downloaded and only the changed fields of its
+        master VEVENT are rewritten, so recurrence rules, exceptions, alarms
+        and attendees survive the update.
+        
+        Args:
+            href (str): Absolute URL of the event resource
+            event_data (Dict): Fields to change (title, description, location,
+                start_time, end_time)
+            etag (str): Last known etag; sent as If-Match when provided,
+                otherwise the etag of the downloaded copy is used
+            
+        Returns:
+            Dict: {'etag': new etag or None}
+            
+        Raises:
+            EtagMismatchError: If the resource was modified since ``etag`` or no longer exists
+        """
+        resource = await self.get_event_resource(href)
+        if resource is None:
+            raise EtagMismatchError(f"Event at {href} no longer exists on the server")
+        
+        headers = {"Content-Type": "text/calendar; charset=utf-8"}
+        if etag or resource['etag']:
+            headers["If-Match"] = etag or resource['etag']
+        
+        ical_event = self._merge_ical_event(resource['ical_data'], event_data)
+        response = await self._dav_request("PUT", href, ical_event, headers)
+        if response.status_code == 412:
+            raise EtagMismatchError(f"Event at {href} was modified on the server")
+        response.raise_for_status()
+        
+        logger.info(f"Successfully updated Apple Calendar event {href}")
+        return {'etag': response.headers.get('ETag')}
+    
+    async def delete_event_resource(self, href: str, etag: str = None) -> bool:
+        """
+        Delete an event resource addressed by its href.
+        
+        Args:
+            href (str): Absolute URL of the event resource
+            etag (str): Last known etag; sent as If-Match when provided
+            
+        Returns:
+            bool: True if the resource is gone
+            
+        Raises:
+            EtagMismatchError: If the resource was modified since ``etag``
+        """
+        headers = {"If-Match": etag} if etag else None
+        
+        response = await self._dav_request("DELETE", href, headers=headers)
+        if response.status_code == 412:
+            raise EtagMismatchError(f"Event at {href} was modified on the server")
+        if response.status_code == 404:
+            logger.info(f"Apple Calendar event {href} already deleted")
+            return True
+        response.raise_for_status()
+        
+        logger.info(f"Successfully deleted Apple Calendar event {href}")
+        return True
+    
     async def update_event(self, event_id: str, event_data: Dict[str, Any], 
                           calendar_id: str = None) -> bool:
         """
         Update an existing event in Apple Calendar.
         
+        This scans the calendar for the event and is only used for events
+        whose href is unknown; prefer update_event_resource().
+        
         Args:
             event_id (str): Event ID to update
             event_data (Dict): Updated event information
@@ -229,7 +655,7 @@ class AppleCalendarService:
             if not self.principal:
                 await self.connect()
             
-            calendars = self.principal.calendars()
+            calendars = await asyncio.to_thread(self.principal.calendars)
             target_calendar = None
             
             # Find target calendar
@@ -246,7 +672,7 @@ class AppleCalendarService:
                 raise Exception("No calendar available for event update")
             
             # Find the event
-            events = target_calendar.events()
+            events = await asyncio.to_thread(target_calendar.events)
             target_event = None
             
             for event in events:
@@ -257,12 +683,9 @@ class AppleCalendarService:
             if not target_event:
                 raise Exception(f"Event {event_id} not found")
             
-            # Create updated iCal event
-            ical_event = self._create_ical_event(event_data)
-            
             # Update the event
-            target_event.data = ical_event
-            target_event.save()
+            target_event.data = self._merge_ical_event(target_event.data, event_data)
+            await asyncio.to_thread(target_event.save)
             
             logger.info(f"Successfully updated Apple Calendar event {event_id}")
             return True
@@ -275,6 +698,9 @@ class AppleCalendarService:
         """
         Delete an event from Apple Calendar.
         
+        This scans the calendar for the event and is only used for events
+        whose href is unknown; prefer delete_event_resource().
+        
         Args:
             event_id (str): Event ID to delete
             calendar_id (str): Calendar ID containing the event
@@ -286,7 +712,7 @@ class AppleCalendarService:
             if not self.principal:
                 await self.connect()
             
-            calendars = self.principal.calendars()
+            calendars = await asyncio.to_thread(self.principal.calendars)
             target_calendar = None
             
             # Find target calendar
@@ -303,7 +729,7 @@ class AppleCalendarService:
                 raise Exception("No calendar available for event deletion")
             
             # Find the event
-            events = target_calendar.events()
+            events = await asyncio.to_thread(target_calendar.events)
             target_event = None
             
             for event in events:
@@ -315,7 +741,7 @@ class AppleCalendarService:
                 raise Exception(f"Event {event_id} not found")
             
             # Delete the event
-            target_event.delete()
+            await asyncio.to_thread(target_event.delete)
             
             logger.info(f"Successfully deleted Apple Calendar event {event_id}")
             return True
@@ -324,7 +750,7 @@ class AppleCalendarService:
             logger.error(f"Error deleting Apple Calendar event: {str(e)}")
             return False
     
-    def _parse_ical_event(self, event: Event) -> Optional[Dict[str, Any]]:
+    def _parse_ical_event(self, event: "Event") -> Optional[Dict[str, Any]]:
         """
         Parse iCal event data into our standard format.
         
@@ -335,38 +761,27 @@ class AppleCalendarService:
             Optional[Dict]: Parsed event data
         """
         try:
-            # Parse iCal data
-            ical_data = event.data
-            if isinstance(ical_data, bytes):
-                ical_data = ical_data.decode('utf-8')
-            
-            cal = ICalendar.from_ical(ical_data)
-            
-            for component in cal.walk():
-                if component.name == "VEVENT":
-                    # Extract event data
-                    event_data = {
-                        'id': str(component.get('uid', '')),
-                        'title': str(component.get('summary', '')),
-                        'description': str(component.get('description', '')),
-                        'location': str(component.get('location', '')),
-                        'start_time': self._parse_datetime(component.get('dtstart')),
-                        'end_time': self._parse_datetime(component.get('dtend')),
-                        'created_at': self._parse_datetime(component.get('created')),
-                        'updated_at': self._parse_datetime(component.get('last-modified')),
-                        'is_invite': False,  # Apple Calendar events are not invites by default
-                        'invite_status': None,
-                        'raw_data': ical_data
-                    }
-                    
-                    return event_data
-            
-            return None
+            return self._parse_ical_data(event.data)
             
         except Exception as e:
             logger.error(f"Error parsing iCal event: {str(e)}")
             return None
     
+    def _parse_ical_data(self, ical_data) -> Optional[Dict[str, Any]]:
+        """
+        Parse raw iCalendar text into our standard format.
+        
+        Uses the streaming parser's fast path and falls back to icalendar
+        for anything it does not handle.
+        
+        Args:
+            ical_data (str or bytes): VCALENDAR payload
+            
+        Returns:
+            Optional[Dict]: Parsed event data
+        """
+        return parse_ical_event(ical_data)
+    
     def _create_ical_event(self, event_data: Dict[str, Any]) -> str:
         """
         Create iCal formatted event data.
@@ -378,6 +793,8 @@ class AppleCalendarService:
             str: iCal formatted event data
         """
         try:
+            from icalendar import Calendar as ICalendar, Event as IEvent
+            
             # Create iCal event
             cal = ICalendar()
             event = IEvent()
@@ -410,35 +827,101 @@ class AppleCalendarService:
             logger.error(f"Error creating iCal event: {str(e)}")
             raise
     
-    def _parse_datetime(self, dt_value) -> Optional[str]:
+    def _merge_ical_event(self, ical_data, event_data: Dict[str, Any]) -> str:
         """
-        Parse datetime value from iCal format.
+        Apply event changes to the master VEVENT of an existing VCALENDAR.
         
         Args:
-            dt_value: iCal datetime value
+            ical_data (str or bytes): Stored VCALENDAR payload
+            event_data (Dict): Fields to change; missing fields are kept
             
         Returns:
-            Optional[str]: ISO formatted datetime string
+            str: Updated iCal formatted event data
         """
-        try:
-            if not dt_value:
-                return None
-            
-            if hasattr(dt_value, 'dt'):
-                dt = dt_value.dt
-            else:
-                dt = dt_value
-            
-            if isinstance(dt, datetime):
-                return dt.isoformat()
-            elif isinstance(dt, str):
-                return dt
-            
-            return None
+        from icalendar import Calendar as ICalendar
+        
+        cal = ICalendar.from_ical(ical_data)
+        vevents = cal.walk('VEVENT')
+        if not vevents:
+            raise ValueError("Stored event has no VEVENT")
+        # The series master carries no RECURRENCE-ID; edited occurrences are left alone
+        vevent = next((v for v in vevents if v.get('recurrence-id') is None), vevents[0])
+        
+        for field, prop in (('title', 'summary'), ('description', 'description'), ('location', 'location')):
+            if event_data.get(field) is not None:
+                vevent.pop(prop, None)
+                vevent.add(prop, event_data[field])
+        
+        for field, prop in (('start_time', 'dtstart'), ('end_time', 'dtend')):
+            if event_data.get(field) is None:
+                continue
+            value = event_data[field]
+            if isinstance(value, str):
+                value = (date.fromisoformat(value) if len(value) == 10
+                         else datetime.fromisoformat(value.replace('Z', '+00:00')))
+            # Keep the event's TZID so the rule keeps expanding in its own zone
+            current = vevent.get(prop)
+            current = current.dt if current is not None else None
+            if isinstance(value, datetime) and value.tzinfo and isinstance(current, datetime) and current.tzinfo:
+                value = value.astimezone(current.tzinfo)
+            vevent.pop(prop, None)
+            vevent.add(prop, value)
+        
+        sequence = int(vevent.get('sequence', 0)) + 1
+        now = datetime.now(timezone.utc)
+        for prop, value in (('sequence', sequence), ('dtstamp', now), ('last-modified', now)):
+            vevent.pop(prop, None)
+            vevent.add(prop, value)
+        
+        return cal.to_ical().decode('utf-8')
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """
+        Return the shared HTTP client used for raw WebDAV requests.
+        """
+        return get_async_client("caldav")
+    
+    async def _dav_request(self, method: str, url: str, body: str = None,
+                           headers: Dict[str, str] = None) -> httpx.Response:
+        """
+        Send a raw WebDAV/CalDAV request authenticated with the user's credentials.
+        
+        Args:
+            method (str): HTTP/WebDAV method (PROPFIND, REPORT, PUT, ...)
+            url (str): Absolute target URL
+            body (str): Request body (optional)
+            headers (Dict): Extra request headers (optional)
             
-        except Exception as e:
-            logger.error(f"Error parsing datetime: {str(e)}")
-            return None
+        Returns:
+            httpx.Response: Server response
+        """
+        client = self._get_http_client()
+        
+        request_headers = {"Content-Type": "application/xml; charset=utf-8"}
+        if headers:
+            request_headers.update(headers)
+        
+        return await client.request(
+            method,
+            url,
+            content=body.encode('utf-8') if isinstance(body, str) else body,
+            headers=request_headers,
+            auth=self.http_auth
+        )
+    
+    @staticmethod
+    def _href_path(href: str) -> str:
+        """
+        Return the path component of an absolute href for use in REPORT bodies.
+        """
+        return urlsplit(href).path or href
+    
+    @staticmethod
+    def _xml_escape(value: str) -> str:
+        """
+        Escape a value for inclusion in an XML text node.
+        """
+        return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
     
     def _generate_uid(self) -> str:
         """
@@ -452,6 +935,8 @@ class AppleCalendarService:
     async def close(self):
         """
         Close the CalDAV connection.
+        
+        The HTTP clients are shared and stay open for other users.
         """
         if self.client:
             # CalDAV client doesn't have explicit close method
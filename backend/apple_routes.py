@@ -13,15 +13,23 @@ Date: 2024
 
 from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime
+import json
 import logging
-from bson import ObjectId
+import os
+import zlib
+from bson import Binary, ObjectId
+from pymongo import UpdateOne, DeleteOne, DeleteMany
+from pymongo.errors import BulkWriteError
 
 from apple_auth_service import AppleAuthService
-from apple_calendar_service import AppleCalendarService
+from apple_calendar_service import AppleCalendarService, InvalidSyncTokenError, EtagMismatchError
 from dependencies import get_current_user, db
+from recurrence import occurrence_cache, series_key
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +37,10 @@ logger = logging.getLogger(__name__)
 apple_router = APIRouter(prefix="/api/apple", tags=["Apple Calendar"])
 security = HTTPBearer()
 
+# How synced raw iCalendar payloads are kept: "none" (dropped, re-fetched from
+# iCloud by href on demand), "plain" or "compressed" (zlib) in apple_event_payloads
+APPLE_RAW_ICAL_STORAGE = os.getenv("APPLE_RAW_ICAL_STORAGE", "none").lower()
+
 # Pydantic models for request/response
 class AppleSignInRequest(BaseModel):
     """Request model for Sign in with Apple"""
@@ -257,10 +269,14 @@ async def get_apple_events(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     calendar_id: Optional[str] = None,
+    stream: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Get events from Apple Calendar.
+    
+    With ``stream=true`` events are sent as newline-delimited JSON as soon as
+    each calendar responds instead of after all calendars have been searched.
     """
     try:
         user = await db.users.find_one({"_id": ObjectId(current_user["_id"])})
@@ -285,6 +301,18 @@ async def get_apple_events(
             user_id=current_user["_id"]
         )
         
+        if stream:
+            async def event_lines():
+                try:
+                    async for event in apple_calendar.iter_events(calendar_id, start_date, end_date):
+                        yield json.dumps(event, default=str) + "\n"
+                except Exception as e:
+                    logger.error(f"Error streaming Apple events: {str(e)}")
+                finally:
+                    await apple_calendar.close()
+            
+            return StreamingResponse(event_lines(), media_type="application/x-ndjson")
+        
         # Get events
         events = await apple_calendar.get_events(
             calendar_id=calendar_id,
@@ -348,17 +376,20 @@ async def create_apple_event(
         }
         
         # Create event
-        event_id = await apple_calendar.create_event(
+        resource = await apple_calendar.create_event_resource(
             event_data=event_dict,
             calendar_id=event_data.calendar_id
         )
+        await apple_calendar.close()
         
-        if not event_id:
+        if not resource:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create Apple Calendar event"
             )
         
+        event_id = resource["id"]
+        
         # Store event in local database
         local_event = {
             "title": event_data.title,
@@ -368,6 +399,9 @@ async def create_apple_event(
             "location": event_data.location,
             "calendar_source": "apple",
             "apple_event_id": event_id,
+            "apple_href": resource["href"],
+            "apple_etag": resource["etag"],
+            "calendar_id": resource["calendar_id"],
             "user_id": current_user["_id"],
             "created_at": datetime.utcnow()
         }
@@ -436,11 +470,33 @@ async def update_apple_event(
         if event_data.location is not None:
             update_dict["location"] = event_data.location
         
-        # Update event
-        success = await apple_calendar.update_event(
-            event_id=event_id,
-            event_data=update_dict
+        # Address the stored resource directly when its href is known
+        local_event = await db.events.find_one(
+            {"apple_event_id": event_id, "user_id": current_user["_id"]}
         )
+        local_updates = {}
+        
+        try:
+            if local_event and local_event.get("apple_href"):
+                result = await apple_calendar.update_event_resource(
+                    href=local_event["apple_href"],
+                    event_data=update_dict,
+                    etag=local_event.get("apple_etag")
+                )
+                local_updates["apple_etag"] = result["etag"]
+                success = True
+            else:
+                success = await apple_calendar.update_event(
+                    event_id=event_id,
+                    event_data=update_dict
+                )
+        except EtagMismatchError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Apple Calendar event was modified elsewhere. Sync and try again."
+            )
+        finally:
+            await apple_calendar.close()
         
         if not success:
             raise HTTPException(
@@ -454,6 +510,7 @@ async def update_apple_event(
             {
                 "$set": {
                     **update_dict,
+                    **local_updates,
                     "updated_at": datetime.utcnow()
                 }
             }
@@ -506,8 +563,26 @@ async def delete_apple_event(
             user_id=current_user["_id"]
         )
         
-        # Delete event
-        success = await apple_calendar.delete_event(event_id=event_id)
+        # Address the stored resource directly when its href is known
+        local_event = await db.events.find_one(
+            {"apple_event_id": event_id, "user_id": current_user["_id"]}
+        )
+        
+        try:
+            if local_event and local_event.get("apple_href"):
+                success = await apple_calendar.delete_event_resource(
+                    href=local_event["apple_href"],
+                    etag=local_event.get("apple_etag")
+                )
+            else:
+                success = await apple_calendar.delete_event(event_id=event_id)
+        except EtagMismatchError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Apple Calendar event was modified elsewhere. Sync and try again."
+            )
+        finally:
+            await apple_calendar.close()
         
         if not success:
             raise HTTPException(
@@ -537,6 +612,79 @@ async def delete_apple_event(
             detail="Failed to delete Apple Calendar event"
         )
 
+@apple_router.get("/calendar/events/{event_id}/raw")
+async def get_apple_event_raw(
+    event_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the raw iCalendar payload of a synced Apple Calendar event.
+    
+    Payloads are not stored on event documents. They are served from the
+    payload collection when APPLE_RAW_ICAL_STORAGE keeps them, otherwise
+    downloaded from iCloud using the event's stored href.
+    """
+    try:
+        payload = await db.apple_event_payloads.find_one(
+            {"user_id": current_user["_id"], "apple_event_id": event_id}
+        )
+        if payload:
+            return {
+                "event_id": event_id,
+                "etag": payload.get("etag"),
+                "ical_data": decode_ical_payload(payload),
+                "source": "cache"
+            }
+        
+        local_event = await db.events.find_one(
+            {"apple_event_id": event_id, "user_id": current_user["_id"]},
+            {"apple_href": 1}
+        )
+        if not local_event or not local_event.get("apple_href"):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Apple Calendar event not found"
+            )
+        
+        credentials = current_user.get("apple_calendar_credentials", {})
+        if not credentials:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Apple Calendar credentials not found"
+            )
+        
+        apple_calendar = AppleCalendarService(
+            apple_id=credentials["apple_id"],
+            app_specific_password=credentials["app_specific_password"],
+            user_id=current_user["_id"]
+        )
+        try:
+            resource = await apple_calendar.get_event_resource(local_event["apple_href"])
+        finally:
+            await apple_calendar.close()
+        
+        if not resource:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Apple Calendar event no longer exists in iCloud"
+            )
+        
+        return {
+            "event_id": event_id,
+            "etag": resource["etag"],
+            "ical_data": resource["ical_data"],
+            "source": "icloud"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching raw Apple event: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch raw Apple Calendar event"
+        )
+
 @apple_router.post("/calendar/sync")
 async def sync_apple_calendar(
     sync_request: AppleSyncRequest,
@@ -597,6 +745,7 @@ async def get_app_specific_password_instructions():
         )
 
 # Background task functions
+@traced("job apple.sync")
 async def sync_apple_calendar_events(
     user_id: str,
     sync_direction: str = "from_apple",
@@ -605,6 +754,11 @@ async def sync_apple_calendar_events(
     """
     Background task to sync Apple Calendar events.
     
+    Pulling from Apple is incremental: each calendar keeps its own ctag and
+    WebDAV sync token in ``apple_sync_state``, so only changed or deleted
+    resources are transferred. ``date_range_days`` is kept for API
+    compatibility; sync-collection always covers the whole calendar.
+    
     Args:
         user_id (str): User ID to sync events for
         sync_direction (str): Direction of sync ('from_apple', 'to_apple', 'bidirectional')
@@ -631,45 +785,300 @@ async def sync_apple_calendar_events(
             user_id=user_id
         )
         
-        # Calculate date range
-        end_date = datetime.utcnow() + timedelta(days=date_range_days)
-        start_date = datetime.utcnow() - timedelta(days=date_range_days)
+        sync_counts = {"inserted": 0, "modified": 0, "deleted": 0, "skipped_calendars": 0, "errors": 0}
         
         if sync_direction in ["from_apple", "bidirectional"]:
-            # Sync events from Apple Calendar to local database
-            apple_events = await apple_calendar.get_events(
-                start_date=start_date,
-                end_date=end_date
-            )
+            # Sync events from Apple Calendar to local database, one collection at a time
+            calendars = await apple_calendar.get_calendars()
             
-            for event in apple_events:
-                # Check if event already exists
-                existing_event = await db.events.find_one({
-                    "apple_event_id": event["id"],
-                    "user_id": user_id
-                })
-                
-                if not existing_event:
-                    # Create new local event
-                    local_event = {
-                        **event,
-                        "user_id": user_id,
-                        "created_at": datetime.utcnow()
-                    }
-                    await db.events.insert_one(local_event)
-                    logger.info(f"Synced Apple event: {event['id']}")
-        
-        # Update last sync time
+            for calendar in calendars:
+                try:
+                    calendar_counts = await _sync_apple_calendar_collection(apple_calendar, user_id, calendar)
+                    for key, value in calendar_counts.items():
+                        sync_counts[key] += value
+                except Exception as e:
+                    sync_counts["errors"] += 1
+                    logger.warning(f"Error syncing Apple calendar {calendar.get('name')}: {str(e)}")
+        
+        await apple_calendar.close()
+        
+        # Update last sync time and per-run counts
         await db.users.update_one(
             {"_id": ObjectId(user_id)},
             {
                 "$set": {
-                    "apple_last_sync": datetime.utcnow()
+                    "apple_last_sync": datetime.utcnow(),
+                    "apple_last_sync_counts": sync_counts
                 }
             }
         )
         
-        logger.info(f"Apple Calendar sync completed for user {user_id}")
+        logger.info(f"Apple Calendar sync completed for user {user_id}: {sync_counts}")
+        return sync_counts
         
     except Exception as e:
         logger.error(f"Error in Apple Calendar sync: {str(e)}")
+
+
+
+async def _sync_apple_calendar_collection(
+    apple_calendar: AppleCalendarService,
+    user_id: str,
+    calendar: Dict[str, Any]
+) -> Dict[str, int]:
+    """
+    Incrementally sync a single Apple calendar into the local events collection.
+    
+    Uses the stored ctag to skip unchanged calendars and the stored sync token
+    to fetch only changed/deleted resources. If the server rejects the token,
+    falls back to a full sync and removes local events that no longer exist.
+    All writes go to the database in one unordered bulk operation keyed on
+    the unique (user_id, apple_event_id) index, so re-running a sync is
+    idempotent.
+    
+    Args:
+        apple_calendar (AppleCalendarService): Connected Apple Calendar service
+        user_id (str): User ID to sync events for
+        calendar (Dict): Calendar information from get_calendars()
+        
+    Returns:
+        Dict[str, int]: Counts of inserted, modified and deleted events
+    """
+    counts = {"inserted": 0, "modified": 0, "deleted": 0, "skipped_calendars": 0}
+    calendar_url = str(calendar["url"])
+    state_filter = {"user_id": user_id, "calendar_url": calendar_url}
+    state = await db.apple_sync_state.find_one(state_filter) or {}
+    
+    sync_info = await apple_calendar.get_calendar_sync_info(calendar_url)
+    if sync_info.get("ctag") and sync_info["ctag"] == state.get("ctag"):
+        logger.info(f"Apple calendar {calendar.get('name')} unchanged (ctag match), skipping")
+        counts["skipped_calendars"] = 1
+        return counts
+    
+    sync_token = state.get("sync_token")
+    try:
+        result = await apple_calendar.sync_calendar(calendar_url, sync_token)
+    except InvalidSyncTokenError:
+        logger.warning(f"Apple sync token expired for calendar {calendar.get('name')}. Falling back to full sync.")
+        await db.apple_sync_state.update_one(
+            state_filter,
+            {"$unset": {"sync_token": ""}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        sync_token = None
+        result = await apple_calendar.sync_calendar(calendar_url)
+    
+    changed_hrefs = [item["href"] for item in result["changed"]]
+    store_payloads = APPLE_RAW_ICAL_STORAGE != "none"
+    events = await apple_calendar.fetch_events_by_href(
+        calendar_url, changed_hrefs, include_ical=store_payloads
+    )
+    
+    operations = []
+    payload_operations = []
+    for event in events:
+        event["calendar_id"] = calendar.get("id")
+        event["calendar_name"] = calendar.get("name")
+        ical_data = event.pop("ical_data", None)
+        if store_payloads and ical_data:
+            payload_operations.append(
+                _apple_payload_upsert_operation(user_id, calendar_url, event, ical_data)
+            )
+        operations.append(_apple_event_upsert_operation(user_id, calendar_url, event))
+    
+    for href in result["deleted"]:
+        operations.append(DeleteOne({
+            "user_id": user_id,
+            "calendar_source": "apple",
+            "apple_href": href
+        }))
+        payload_operations.append(DeleteOne({"user_id": user_id, "apple_href": href}))
+    
+    if sync_token is None:
+        # Full sync: anything not reported by the server has been removed from iCloud
+        operations.append(DeleteMany({
+            "user_id": user_id,
+            "calendar_source": "apple",
+            "apple_calendar_url": calendar_url,
+            "apple_href": {"$nin": changed_hrefs}
+        }))
+        payload_operations.append(DeleteMany({
+            "user_id": user_id,
+            "apple_calendar_url": calendar_url,
+            "apple_href": {"$nin": changed_hrefs}
+        }))
+    
+    if operations:
+        counts.update(await _apply_apple_event_operations(operations))
+    
+    if payload_operations:
+        try:
+            await db.apple_event_payloads.bulk_write(payload_operations, ordered=False)
+        except BulkWriteError as e:
+            logger.warning(f"Apple payload bulk write had {len((e.details or {}).get('writeErrors', []))} errors")
+    
+    await db.apple_sync_state.update_one(
+        state_filter,
+        {
+            "$set": {
+                "ctag": sync_info.get("ctag"),
+                "sync_token": result["sync_token"],
+                "updated_at": datetime.utcnow()
+            }
+        },
+        upsert=True
+    )
+    
+    logger.info(f"Synced Apple calendar {calendar.get('name')}: {counts}")
+    return counts
+
+
+def _apple_event_upsert_operation(user_id: str, calendar_url: str, event: Dict[str, Any]) -> UpdateOne:
+    """
+    Build the idempotent upsert for a synced Apple event, keyed on its iCalendar UID.
+    """
+    href = event.pop("href", None)
+    etag = event.pop("etag", None)
+    now = datetime.utcnow()
+    created_at = event.pop("created_at", None) or now
+    update_doc = {
+        **event,
+        "calendar_source": "apple",
+        "user_id": user_id,
+        "apple_event_id": event.get("id"),
+        "apple_href": href,
+        "apple_etag": etag,
+        "apple_calendar_url": calendar_url,
+        "synced_at": now
+    }
+    if event.get("rrule"):
+        update_doc["series_version"] = etag
+        occurrence_cache.invalidate(series_key(user_id, "apple", event.get("id")))
+    
+    return UpdateOne(
+        {"user_id": user_id, "apple_event_id": event.get("id")},
+        {"$set": update_doc, "$setOnInsert": {"created_at": created_at}},
+        upsert=True
+    )
+
+
+def _apple_payload_upsert_operation(user_id: str, calendar_url: str, event: Dict[str, Any],
+                                    ical_data: str) -> UpdateOne:
+    """
+    Build the upsert storing an event's raw iCalendar payload outside db.events.
+    """
+    if APPLE_RAW_ICAL_STORAGE == "compressed":
+        encoding, data = "zlib", Binary(zlib.compress(ical_data.encode("utf-8")))
+    else:
+        encoding, data = "plain", ical_data
+    
+    return UpdateOne(
+        {"user_id": user_id, "apple_event_id": event.get("id")},
+        {
+            "$set": {
+                "apple_href": event.get("href"),
+                "apple_calendar_url": calendar_url,
+                "etag": event.get("etag"),
+                "encoding": encoding,
+                "data": data,
+                "updated_at": datetime.utcnow()
+            }
+        },
+        upsert=True
+    )
+
+
+def decode_ical_payload(payload: Dict[str, Any]) -> str:
+    """
+    Return the iCalendar text of a stored payload document.
+    """
+    if payload.get("encoding") == "zlib":
+        return zlib.decompress(payload["data"]).decode("utf-8")
+    return payload.get("data", "")
+
+
+async def _apply_apple_event_operations(operations: List[Any]) -> Dict[str, int]:
+    """
+    Write sync operations as one unordered bulk request and return the counts.
+    
+    Unordered execution lets the remaining writes proceed if one fails (for
+    example a duplicate key raced by a concurrent sync of the same user).
+    """
+    try:
+        result = await db.events.bulk_write(operations, ordered=False)
+        return {
+            "inserted": result.upserted_count,
+            "modified": result.modified_count,
+            "deleted": result.deleted_count
+        }
+    except BulkWriteError as e:
+        details = e.details or {}
+        logger.warning(f"Apple sync bulk write had {len(details.get('writeErrors', []))} errors")
+        return {
+            "inserted": details.get("nUpserted", 0),
+            "modified": details.get("nModified", 0),
+            "deleted": details.get("nRemoved", 0)
+        }
+
+
+# Duplicates written by the old insert-only sync, which kept the UID under
+# ``id`` (next to ``calendar_name``) and never set ``apple_event_id``
+LEGACY_APPLE_DUPLICATE_FILTER = {
+    "calendar_source": "apple",
+    "apple_event_id": {"$exists": False},
+    "id": {"$exists": True},
+    "calendar_name": {"$exists": True}
+}
+
+
+async def ensure_apple_event_indexes():
+    """
+    Create the indexes the Apple sync relies on.
+    
+    Documents written by the old insert-only sync (UID under ``id``, no
+    ``apple_event_id``) are outside the unique index's partial filter. They
+    are left in place so their raw payloads can still be archived; see
+    check_legacy_apple_duplicates.
+    """
+    await db.events.create_index(
+        [("user_id", 1), ("apple_event_id", 1)],
+        name="user_apple_event_id_unique",
+        unique=True,
+        partialFilterExpression={"apple_event_id": {"$exists": True}}
+    )
+    await db.events.create_index(
+        [("user_id", 1), ("apple_href", 1)],
+        name="user_apple_href",
+        partialFilterExpression={"apple_href": {"$exists": True}}
+    )
+    await db.apple_sync_state.create_index(
+        [("user_id", 1), ("calendar_url", 1)],
+        name="user_calendar_url_unique",
+        unique=True
+    )
+    await db.apple_event_payloads.create_index(
+        [("user_id", 1), ("apple_event_id", 1)],
+        name="user_apple_event_id_unique",
+        unique=True
+    )
+    await db.apple_event_payloads.create_index(
+        [("user_id", 1), ("apple_href", 1)],
+        name="user_apple_href"
+    )
+
+
+async def check_legacy_apple_duplicates():
+    """
+    Fail (as a non-required warmup step, reported on /ready) while documents
+    from the legacy insert-only sync are present.
+    
+    They duplicate synced events in listings until removed with
+    migrate_strip_raw_ical.py --archive --remove-legacy-duplicates, a
+    required step when deploying over a database written by that sync.
+    """
+    legacy = await db.events.find_one(LEGACY_APPLE_DUPLICATE_FILTER, {"_id": 1})
+    if legacy:
+        raise RuntimeError(
+            "Apple events from the legacy insert-only sync are present; run "
+            "migrate_strip_raw_ical.py --archive --remove-legacy-duplicates to remove them"
+        )
@@ -0,0 +1,88 @@
+"""
+Google login redirect benchmark.
+
+Times GET /api/google/login in-process (no network: building the
+authorization URL is local) and, separately, the two ways of constructing
+the OAuth Flow: re-reading client_secret.json versus the shared in-memory
+client configuration.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench python benchmarks/bench_google_login.py
+"""
+
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GOOGLE_CLIENT_ID", "bench-client-id.apps.googleusercontent.com")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "bench-client-secret")
+os.environ.setdefault("GOOGLE_REDIRECT_URI", "http://localhost:8000/api/google/callback")
+
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "500"))
+SCOPES = ["https://www.googleapis.com/auth/calendar", "openid"]
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<32} median {statistics.median(samples) * 1000:7.3f} ms   p95 {p95 * 1000:7.3f} ms")
+
+
+def _time(fn):
+    fn()  # warm up
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_flow_construction():
+    from google_auth_oauthlib.flow import Flow
+    from google_oauth import create_google_flow, get_google_client_config
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(get_google_client_config(), f)
+        secrets_path = f.name
+
+    def from_file():
+        flow = Flow.from_client_secrets_file(secrets_path, scopes=SCOPES,
+                                             redirect_uri=os.environ["GOOGLE_REDIRECT_URI"])
+        flow.authorization_url(prompt="consent", access_type="offline", state="s")
+
+    def from_config():
+        flow = create_google_flow(SCOPES, os.environ["GOOGLE_REDIRECT_URI"])
+        flow.authorization_url(prompt="consent", access_type="offline", state="s")
+
+    try:
+        _report("flow from client_secret.json", _time(from_file))
+        _report("flow from shared config", _time(from_config))
+    finally:
+        os.unlink(secrets_path)
+
+
+def bench_login_route():
+    import logging
+    from fastapi.testclient import TestClient
+    import server
+
+    logging.disable(logging.INFO)
+    client = TestClient(server.app)
+
+    def login():
+        response = client.get("/api/google/login", params={"frontend_redirect_uri": "app://cb"},
+                              follow_redirects=False)
+        assert response.status_code == 307, response.status_code
+
+    _report("GET /api/google/login", _time(login))
+
+
+if __name__ == "__main__":
+    print(f"{ITERATIONS} iterations")
+    bench_flow_construction()
+    bench_login_route()
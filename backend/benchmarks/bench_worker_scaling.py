@@ -0,0 +1,149 @@
+"""
+Worker scaling benchmark for the production server profile.
+
+Starts gunicorn (gunicorn.conf.py, uvicorn workers) with 1, 2, 4, ... up to
+the CPU count, drives a request path with a fixed number of concurrent
+keep-alive connections from several load-generator processes, and prints
+throughput and latency per worker count.
+
+The default path, /health/http, does no I/O, so the numbers show how much
+request handling itself scales across cores. Point --path at a
+database-backed endpoint to include MongoDB.
+
+Usage (from backend/, Linux):
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench python benchmarks/bench_worker_scaling.py
+    python benchmarks/bench_worker_scaling.py --workers 1,2,4,8 --duration 20 --connections 256
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(workers, port):
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "bench")
+    env["GUNICORN_ACCESS_LOG"] = "/dev/null"
+    env["LOG_LEVEL"] = "warning"
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+         "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "server:app"],
+        cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def _wait_until_up(url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"server did not come up at {url}")
+
+
+async def _drive(url, connections, duration):
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(limits=limits, timeout=10.0) as client:
+        async def connection():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*[connection() for _ in range(connections)])
+    return latencies, errors
+
+
+def _load_process(args):
+    url, connections, duration = args
+    return asyncio.run(_drive(url, connections, duration))
+
+
+def run_load(url, connections, duration, clients):
+    """
+    Drive the URL from several processes so the load generator is not the
+    bottleneck.
+
+    Returns:
+        Tuple: (requests per second, p50 ms, p99 ms, error count)
+    """
+    per_client = max(connections // clients, 1)
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(_load_process, [(url, per_client, duration)] * clients)
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(count for _, count in results)
+    if not latencies:
+        return 0.0, 0.0, 0.0, errors
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    return len(latencies) / duration, statistics.median(latencies) * 1000, p99 * 1000, errors
+
+
+def main():
+    cpus = multiprocessing.cpu_count()
+    default_workers = sorted({1, *[n for n in (2, 4, 8, 16, 32) if n <= cpus], cpus})
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)),
+                        help="comma-separated worker counts (default: powers of two up to the CPU count)")
+    parser.add_argument("--path", default="/health/http", help="request path to drive")
+    parser.add_argument("--connections", type=int, default=128, help="concurrent connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each run")
+    parser.add_argument("--clients", type=int, default=max(cpus // 2, 1),
+                        help="load-generator processes")
+    args = parser.parse_args()
+
+    print(f"{cpus} CPUs, {args.connections} connections, {args.clients} load processes, "
+          f"{args.duration:.0f}s per run, GET {args.path}")
+    print(f"{'workers':>7} {'req/s':>10} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+    baseline = None
+    for workers in [int(n) for n in args.workers.split(",")]:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}{args.path}"
+        server = _start_server(workers, port)
+        try:
+            _wait_until_up(url)
+            run_load(url, args.connections, args.warmup, args.clients)
+            rps, p50, p99, errors = run_load(url, args.connections, args.duration, args.clients)
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+        baseline = baseline or rps
+        print(f"{workers:>7} {rps:>10.0f} {rps / baseline:>7.2f}x {p50:>8.2f} {p99:>8.2f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
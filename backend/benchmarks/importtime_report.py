@@ -0,0 +1,102 @@
+"""
+Import-time report for the API server (cold start regression check).
+
+Runs ``python -X importtime -c "import server"`` in a fresh interpreter and
+summarizes the output: total import time, the slowest top-level imports,
+and whether the provider SDKs that should load lazily were imported at
+startup. Exits non-zero when a lazy SDK was imported or the total exceeds
+--budget-ms, so it can run in CI.
+
+Usage (from backend/):
+    python benchmarks/importtime_report.py
+    python benchmarks/importtime_report.py --providers apple --runs 5 --budget-ms 1500
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Provider SDKs that must not be imported just by starting the server
+LAZY_MODULES = [
+    "caldav",
+    "icalendar",
+    "msal",
+    "googleapiclient.discovery",
+    "google_auth_oauthlib.flow",
+]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def run_importtime(providers):
+    """
+    Import the server once with -X importtime.
+
+    Returns:
+        List[Tuple]: (module, cumulative_us, depth) in import order
+    """
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "importtime")
+    if providers is not None:
+        env["ENABLED_PROVIDERS"] = providers
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit("importing server failed")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(2)), (len(match.group(3)) - 1) // 2))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--providers", help="ENABLED_PROVIDERS value (default: environment)")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to average over")
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--budget-ms", type=float, help="fail if the median total exceeds this")
+    args = parser.parse_args()
+
+    runs = [run_importtime(args.providers) for _ in range(args.runs)]
+    totals = [dict((name, us) for name, us, _ in rows)["server"] / 1000 for rows in runs]
+    total_ms = statistics.median(totals)
+
+    last = runs[-1]
+    top_level = sorted(
+        ((us, name) for name, us, depth in last if depth == 1),
+        reverse=True,
+    )[:args.top]
+    loaded = {name for name, _, _ in last}
+
+    print(f"import server: median {total_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(totals):.1f}, max {max(totals):.1f})")
+    print(f"ENABLED_PROVIDERS={args.providers if args.providers is not None else os.getenv('ENABLED_PROVIDERS', '<all>')}")
+    print("\nslowest top-level imports (cumulative, last run):")
+    for us, name in top_level:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    print("\nlazy provider SDKs imported at startup:", ", ".join(eager) or "none")
+
+    failed = bool(eager)
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nFAIL: {total_ms:.1f} ms exceeds budget of {args.budget_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,9 @@ import jwt
 from jose import JWTError
 import os
 from dotenv import load_dotenv
+from metrics import mongo_command_metrics
+from tracing import tracing_command_listeners
+from provider_calls import set_provider_user
 
 # Load environment variables
 load_dotenv()
@@ -24,7 +27,8 @@ security = HTTPBearer()
 
 # Database connection
 mongo_url = os.environ["MONGO_URL"]
-client = AsyncIOMotorClient(mongo_url)
+# The listener times every command for /metrics
+client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_command_metrics, *tracing_command_listeners()])
 db = client[os.environ["DB_NAME"]]
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -57,4 +61,6 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     user = await db.users.find_one({"_id": ObjectId(user_id)})
     if user is None:
         raise credentials_exception
+    # Provider calls made for this request count against the user's quotas
+    set_provider_user(user_id)
     return user
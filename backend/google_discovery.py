@@ -0,0 +1,89 @@
+"""
+Google API Service Templates
+
+``googleapiclient.discovery.build`` reads and parses the API's discovery
+document on every call. This module parses each document once per process
+and builds services from the cached copy with ``build_from_document``,
+which is what request handlers and the warmup phase use.
+
+Services are built with provider_calls' instrumented request class, so
+every ``.execute()`` is measured and counted against quotas.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from provider_calls import google_request_class
+
+logger = logging.getLogger(__name__)
+
+# Services the API uses; their documents are loaded during warmup
+GOOGLE_DISCOVERY_SERVICES = [("calendar", "v3"), ("oauth2", "v2")]
+
+_documents: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_documents_lock = threading.Lock()
+
+
+def get_discovery_document(service: str, version: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the parsed discovery document bundled with googleapiclient.
+
+    Args:
+        service (str): API name, e.g. "calendar"
+        version (str): API version, e.g. "v3"
+
+    Returns:
+        Optional[Dict]: The document, None if the library has no static copy
+    """
+    key = (service, version)
+    document = _documents.get(key)
+    if document is None:
+        from googleapiclient.discovery_cache import get_static_doc
+
+        content = get_static_doc(service, version)
+        if content is None:
+            return None
+        document = json.loads(content)
+        with _documents_lock:
+            document = _documents.setdefault(key, document)
+    return document
+
+
+def build_google_service(service: str, version: str, credentials=None):
+    """
+    Build a googleapiclient service object from the cached discovery document.
+
+    Args:
+        service (str): API name
+        version (str): API version
+        credentials: google-auth credentials for the service
+
+    Returns:
+        Resource: The service object
+    """
+    from googleapiclient.discovery import build, build_from_document
+
+    request_builder = google_request_class()
+    document = get_discovery_document(service, version)
+    if document is None:
+        logger.warning(f"No bundled discovery document for {service} {version}; using build()")
+        return build(service, version, credentials=credentials, requestBuilder=request_builder)
+    return build_from_document(document, credentials=credentials, requestBuilder=request_builder)
+
+
+async def prewarm_google_discovery():
+    """
+    Load googleapiclient and parse the discovery documents (called on warmup).
+    """
+    def load():
+        from google.auth.credentials import AnonymousCredentials
+
+        for service, version in GOOGLE_DISCOVERY_SERVICES:
+            # Building once also imports the resource and schema machinery;
+            # anonymous credentials keep it from looking up default ones
+            build_google_service(service, version, credentials=AnonymousCredentials())
+
+    await asyncio.to_thread(load)
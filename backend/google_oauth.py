@@ -0,0 +1,79 @@
+"""
+Google OAuth Client Configuration
+
+The OAuth client configuration is built once from the environment and
+reused for every ``Flow``, instead of being written to and re-read from a
+``client_secret.json`` file on each login.
+"""
+
+import logging
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from google_auth_oauthlib.flow import Flow
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_REDIRECT_URIS = [
+    "http://localhost:8000/api/google/callback",
+    "https://unified-calendar-zflg.onrender.com/api/google/callback",
+    "https://auth.expo.io/@anand9100/unified-calendar",
+]
+
+
+@lru_cache(maxsize=1)
+def get_google_client_config() -> Dict[str, Any]:
+    """
+    Return the Google OAuth "web" client configuration.
+
+    Returns:
+        Dict: Configuration in the client_secrets.json layout
+    """
+    client_id = os.getenv("GOOGLE_CLIENT_ID")
+    client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
+    if not client_id or not client_secret:
+        logger.warning("Google OAuth credentials not configured in environment")
+
+    redirect_uris = list(GOOGLE_REDIRECT_URIS)
+    configured_redirect = os.getenv("GOOGLE_REDIRECT_URI")
+    if configured_redirect and configured_redirect not in redirect_uris:
+        redirect_uris.append(configured_redirect)
+
+    return {
+        "web": {
+            "client_id": client_id,
+            "project_id": "unified-calendar",
+            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+            "client_secret": client_secret,
+            "redirect_uris": redirect_uris,
+            "javascript_origins": ["https://unified-calendar-zflg.onrender.com"],
+        }
+    }
+
+
+def create_google_flow(scopes: List[str], redirect_uri: Optional[str],
+                       state: Optional[str] = None) -> "Flow":
+    """
+    Create an OAuth Flow from the shared client configuration.
+
+    Args:
+        scopes (List[str]): Requested OAuth scopes
+        redirect_uri (str): Callback URL registered with Google
+        state (str): Expected state value (optional)
+
+    Returns:
+        Flow: A new flow; flows hold per-login state and are not shared
+    """
+    # Imported here: oauthlib is only needed on the login path
+    from google_auth_oauthlib.flow import Flow
+
+    return Flow.from_client_config(
+        get_google_client_config(),
+        scopes=scopes,
+        redirect_uri=redirect_uri,
+        state=state,
+    )
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import RedirectResponse, JSONResponse
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt
+import json
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+
+from google_discovery import build_google_service
+from google_oauth import create_google_flow
+from oauth_state_store import get_oauth_state_store
 
 load_dotenv()
 
@@ -19,14 +21,13 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 
-# In-memory state store for demo purposes (use DB in production)
-oauth_states = {}
+# OAuth state is shared by all workers and consumed once on callback
+oauth_states = get_oauth_state_store()
 
 @router.get("/")
-async def auth_google():
+async def auth_google(frontend_redirect_uri: str = None):
     """Step 1: Redirect user to Google OAuth login"""
-    flow = Flow.from_client_secrets_file(
-        "client_secret.json",
+    flow = create_google_flow(
         scopes=[
             "https://www.googleapis.com/auth/calendar.readonly",
             "openid",
@@ -38,7 +39,7 @@ async def auth_google():
         access_type="offline",
         include_granted_scopes="true"
     )
-    oauth_states[state] = datetime.utcnow()  # store state
+    await oauth_states.put(state, {"frontend_redirect_uri": frontend_redirect_uri})
     return RedirectResponse(authorization_url)
 
 @router.get("/callback")
@@ -48,18 +49,16 @@ async def google_callback(request: Request):
     if not state_str:
         raise HTTPException(status_code=400, detail="Missing state")
 
-    # Decode JSON-encoded state
-    try:
-        state = json.loads(state_str)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid state format")
+    # Consume the stored state (unknown, expired or already used states fail)
+    state = await oauth_states.pop(state_str)
+    if state is None:
+        raise HTTPException(status_code=400, detail="Invalid state")
 
     frontend_redirect_uri = state.get("frontend_redirect_uri")
     if not frontend_redirect_uri:
         raise HTTPException(status_code=400, detail="Missing frontend redirect URI")
 
-    flow = Flow.from_client_secrets_file(
-        "client_secret.json",
+    flow = create_google_flow(
         scopes=[
             "https://www.googleapis.com/auth/calendar.readonly",
             "openid",
@@ -73,7 +72,7 @@ async def google_callback(request: Request):
     credentials = flow.credentials
 
     # Get user info from Google
-    service = build("oauth2", "v2", credentials=credentials)
+    service = build_google_service("oauth2", "v2", credentials=credentials)
     user_info = service.userinfo().get().execute()
 
     # Build JWT
@@ -0,0 +1,274 @@
+"""
+Microsoft Graph Client
+
+This module provides the async HTTP client used for every Microsoft Graph
+call. All requests share the "graph" client from http_clients (HTTP/2 when
+the ``h2`` package is installed), so connections and TLS sessions are reused
+across users and requests instead of being set up for every call.
+
+Throttled responses (429, 503, 504) are retried after the delay given in
+``Retry-After``, up to GRAPH_MAX_RETRIES times. The same applies to the
+individual responses of a JSON ``$batch`` request.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from http_clients import get_async_client, register_async_client
+from provider_calls import operation_from_path
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_BASE = "https://graph.microsoft.com/v1.0"
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "3"))
+GRAPH_TIMEOUT_SECONDS = float(os.getenv("GRAPH_TIMEOUT_SECONDS", "30"))
+
+# Used when a throttled response has no usable Retry-After header
+DEFAULT_RETRY_AFTER_SECONDS = 2.0
+MAX_RETRY_AFTER_SECONDS = 60.0
+# 429 means the request was not processed and is always retried. 503/504
+# may come after Graph has applied the request, so they are only retried
+# where repeating it is harmless (no duplicate event from a repeated POST).
+THROTTLED_STATUS_CODES = {429}
+RETRYABLE_STATUS_CODES = {429, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Graph accepts at most 20 requests per $batch call
+GRAPH_BATCH_LIMIT = 20
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _graph_operation(method: str, path: str) -> str:
+    """
+    Operation label for a Graph call, e.g. "GET /me/calendarView".
+    """
+    version_root = httpx.URL(GRAPH_API_BASE).path
+    if path.startswith(version_root):
+        path = path[len(version_root):]
+    return operation_from_path(method, path)
+
+
+register_async_client(
+    "graph",
+    provider="microsoft",
+    operation=_graph_operation,
+    base_url=GRAPH_API_BASE,
+    http2=_http2_available(),
+    timeout=GRAPH_TIMEOUT_SECONDS,
+)
+
+
+def get_graph_http_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide pooled HTTP client for Microsoft Graph.
+    """
+    return get_async_client("graph")
+
+
+class GraphAPIError(Exception):
+    """Raised for Graph responses the caller asked to treat as errors."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Graph API error {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+def _is_retryable(method: str, status: Optional[int], headers: Optional[Dict[str, str]]) -> bool:
+    """
+    Whether a response with this status may be retried for this request.
+    """
+    if status in THROTTLED_STATUS_CODES:
+        return True
+    if status not in RETRYABLE_STATUS_CODES:
+        return False
+    method = method.upper()
+    if method in IDEMPOTENT_METHODS:
+        return True
+    # A conditional PATCH cannot apply twice
+    return method == "PATCH" and any(name.lower() == "if-match" for name in (headers or {}))
+
+
+def _retry_after_seconds(response, attempt: int) -> float:
+    """
+    Delay before retrying a throttled response (or batch item response).
+    """
+    headers = response.headers if isinstance(response, httpx.Response) else (response.get("headers") or {})
+    retry_after = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        delay = float(retry_after) if retry_after is not None else None
+    except ValueError:
+        # HTTP-date form is not used by Graph; fall back to backoff
+        delay = None
+    if delay is None:
+        delay = DEFAULT_RETRY_AFTER_SECONDS * (2 ** attempt)
+    return min(max(delay, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+class GraphClient:
+    """
+    Async Microsoft Graph client bound to one access token.
+    """
+
+    def __init__(self, access_token: str):
+        """
+        Initialize the Graph client.
+
+        Args:
+            access_token (str): Microsoft access token
+        """
+        self.access_token = access_token
+        self.headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Any] = None,
+        headers: Optional[Dict[str, str]] = None,
+        extensions: Optional[Dict[str, Any]] = None
+    ) -> httpx.Response:
+        """
+        Send a Graph request, retrying throttled responses (429 always;
+        503/504 only for idempotent requests).
+
+        Args:
+            method (str): HTTP method
+            url (str): Path relative to GRAPH_API_BASE, or an absolute URL
+                such as an @odata.nextLink
+            params (Dict): Query parameters
+            json (Any): JSON body
+            headers (Dict): Extra request headers
+            extensions (Dict): Call accounting hints (provider_retry,
+                provider_units) for the shared client
+
+        Returns:
+            httpx.Response: The final response (callers check the status)
+        """
+        client = get_graph_http_client()
+        request_headers = {**self.headers, **(headers or {})}
+
+        attempt = 0
+        while True:
+            call_extensions = dict(extensions or {})
+            if attempt:
+                call_extensions["provider_retry"] = True
+            response = await client.request(
+                method, url, params=params, json=json, headers=request_headers,
+                extensions=call_extensions
+            )
+            if not _is_retryable(method, response.status_code, request_headers) or attempt >= GRAPH_MAX_RETRIES:
+                return response
+
+            delay = _retry_after_seconds(response, attempt)
+            logger.warning(
+                f"Graph {method} {url} returned {response.status_code}; "
+                f"retrying in {delay:.1f}s (attempt {attempt + 1}/{GRAPH_MAX_RETRIES})"
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    async def batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Run several Graph requests through JSON $batch, 20 per round trip.
+
+        Throttled items are retried (honoring their Retry-After) in a follow-up
+        batch, with the same rule as ``request`` (503/504 only for idempotent
+        items); other failures are returned to the caller item by item.
+
+        Args:
+            requests (List[Dict]): Requests with 'method', 'url' (relative to
+                GRAPH_API_BASE) and optional 'body' and 'headers'
+
+        Returns:
+            List[Dict]: One {'status', 'headers', 'body'} per request, in order.
+            A batch call that fails as a whole yields that status for its items.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        pending = list(range(len(requests)))
+
+        attempt = 0
+        while pending:
+            throttled = []
+            delay = 0.0
+            for offset in range(0, len(pending), GRAPH_BATCH_LIMIT):
+                chunk = pending[offset:offset + GRAPH_BATCH_LIMIT]
+                payload = {"requests": [
+                    _batch_item(str(index), requests[index]) for index in chunk
+                ]}
+                # Graph throttles each request in a batch individually
+                response = await self.post("/$batch", json=payload, extensions={
+                    "provider_units": len(chunk),
+                    "provider_retry": attempt > 0,
+                })
+
+                if response.status_code != 200:
+                    for index in chunk:
+                        results[index] = {"status": response.status_code, "headers": {}, "body": response.text}
+                    continue
+
+                for item in response.json().get("responses", []):
+                    index = int(item["id"])
+                    results[index] = item
+                    request = requests[index]
+                    retryable = _is_retryable(request["method"], item.get("status"), request.get("headers"))
+                    if retryable and attempt < GRAPH_MAX_RETRIES:
+                        throttled.append(index)
+                        delay = max(delay, _retry_after_seconds(item, attempt))
+
+            if throttled:
+                logger.warning(
+                    f"Graph $batch had {len(throttled)} throttled items; "
+                    f"retrying in {delay:.1f}s (attempt {attempt + 1}/{GRAPH_MAX_RETRIES})"
+                )
+                await asyncio.sleep(delay)
+            pending = sorted(throttled)
+            attempt += 1
+
+        return results
+
+
+def _batch_item(request_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build one entry of a $batch payload.
+    """
+    url = request["url"]
+    item = {
+        "id": request_id,
+        "method": request.get("method", "GET"),
+        # Batch URLs are relative to the version root, without a leading slash
+        "url": url[len(GRAPH_API_BASE):] if url.startswith(GRAPH_API_BASE) else url.lstrip("/")
+    }
+    if request.get("body") is not None:
+        item["body"] = request["body"]
+        item["headers"] = {"Content-Type": "application/json", **(request.get("headers") or {})}
+    elif request.get("headers"):
+        item["headers"] = request["headers"]
+    return item
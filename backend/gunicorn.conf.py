@@ -0,0 +1,58 @@
+"""
+Gunicorn configuration for the production server profile (Linux only).
+
+Used by start_prod.py, or directly:
+    gunicorn -c gunicorn.conf.py server:app
+
+Every worker is a uvicorn worker running the FastAPI app on uvloop with the
+httptools parser. Workers are independent processes: each opens its own
+MongoDB pool and HTTP clients and runs the warmup, while the background
+renewal loops run in only one of them (see leader_lease.py).
+"""
+
+import multiprocessing
+import os
+
+# Binding
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+
+# One worker per core: the app is async, so a worker keeps its core busy
+# on its own. WEB_CONCURRENCY overrides (the convention on Render/Heroku).
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"  # loop/http "auto": uvloop + httptools
+
+# Recycle workers after a number of requests to bound memory growth; the
+# jitter keeps them from all restarting at the same time
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+
+# Workers that stop heartbeating for this long are killed and replaced
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# Time a recycled or stopped worker gets to finish in-flight requests
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Import the app in each worker, not in the master: the Motor client and
+# the HTTP clients must not be shared across a fork
+preload_app = False
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and os.getenv("OAUTH_STATE_BACKEND", "mongo").lower() == "memory":
+        server.log.warning(
+            "OAUTH_STATE_BACKEND=memory with %s workers: an OAuth callback handled by "
+            "another worker will not find its state; use the mongo backend",
+            server.cfg.workers,
+        )
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges from the aggregated /metrics
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
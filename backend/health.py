@@ -0,0 +1,147 @@
+"""
+Health Diagnostics
+
+/health is a liveness probe and does no I/O. /health/db is the detailed
+view: it pings MongoDB on every call but reuses the expensive parts
+(``dbStats``, the collection list, provider reachability probes) for a
+configurable interval, so frequent load balancer or monitoring probes do
+not turn into database and provider load.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from dependencies import db
+from http_clients import circuit_breaker_states
+from provider_calls import quota_tracker
+from providers import enabled_providers
+
+logger = logging.getLogger(__name__)
+
+HEALTH_DB_STATS_CACHE_SECONDS = float(os.getenv("HEALTH_DB_STATS_CACHE_SECONDS", "60"))
+HEALTH_PROVIDER_CACHE_SECONDS = float(os.getenv("HEALTH_PROVIDER_CACHE_SECONDS", "60"))
+HEALTH_PROVIDER_TIMEOUT_SECONDS = float(os.getenv("HEALTH_PROVIDER_TIMEOUT_SECONDS", "5"))
+
+# Endpoints probed for reachability; any HTTP response counts as reachable
+PROVIDER_PROBE_URLS = {
+    "google": "https://oauth2.googleapis.com/tokeninfo",
+    "apple": "https://caldav.icloud.com/",
+    "microsoft": "https://graph.microsoft.com/v1.0/",
+}
+
+# Shared HTTP clients (see http_clients.py) used by each provider
+PROVIDER_HTTP_CLIENTS = {
+    "google": ["google"],
+    "apple": ["apple_auth", "caldav", "caldav_sync"],
+    "microsoft": ["graph", "msal"],
+}
+
+
+class CachedResult:
+    """
+    Result of an async function, recomputed at most once per interval.
+    Concurrent callers during a refresh wait for the same computation.
+    """
+
+    def __init__(self, fn: Callable[[], Awaitable[Any]], ttl_seconds: float):
+        self._fn = fn
+        self._ttl = ttl_seconds
+        self._value: Any = None
+        self._fetched_at: Optional[float] = None
+        self._checked_at: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._fetched_at is not None and time.monotonic() - self._fetched_at < self._ttl
+
+    async def get(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict: {"value", "checked_at", "age_seconds"}
+        """
+        if not self._fresh():
+            async with self._lock:
+                if not self._fresh():
+                    self._value = await self._fn()
+                    self._fetched_at = time.monotonic()
+                    self._checked_at = datetime.utcnow()
+        return {
+            "value": self._value,
+            "checked_at": self._checked_at.isoformat(),
+            "age_seconds": round(time.monotonic() - self._fetched_at, 1),
+        }
+
+
+async def _database_stats() -> Dict[str, Any]:
+    stats = await db.command("dbStats")
+    collections = await db.list_collection_names()
+    return {
+        "database_name": stats.get("db"),
+        "collections": sorted(collections),
+        "collections_count": len(collections),
+        "objects": stats.get("objects"),
+        "data_size_bytes": stats.get("dataSize"),
+        "storage_size_bytes": stats.get("storageSize"),
+        "indexes": stats.get("indexes"),
+    }
+
+
+async def _probe(client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        response = await client.get(url)
+        return {
+            "reachable": True,
+            "status_code": response.status_code,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    except Exception as e:
+        return {"reachable": False, "error": str(e) or type(e).__name__}
+
+
+async def _provider_reachability() -> Dict[str, Dict[str, Any]]:
+    providers = [name for name in enabled_providers() if name in PROVIDER_PROBE_URLS]
+    # A separate client: probes must not trip or be blocked by the
+    # providers' circuit breakers
+    async with httpx.AsyncClient(timeout=HEALTH_PROVIDER_TIMEOUT_SECONDS) as client:
+        results = await asyncio.gather(*[_probe(client, PROVIDER_PROBE_URLS[name]) for name in providers])
+    return dict(zip(providers, results))
+
+
+database_stats_cache = CachedResult(_database_stats, HEALTH_DB_STATS_CACHE_SECONDS)
+provider_reachability_cache = CachedResult(_provider_reachability, HEALTH_PROVIDER_CACHE_SECONDS)
+
+
+async def provider_health() -> Dict[str, Any]:
+    """
+    Cached reachability of every enabled provider, the live state of the
+    circuit breakers on its HTTP clients and its quota usage.
+    """
+    reachability = await provider_reachability_cache.get()
+    breakers = circuit_breaker_states()
+    quotas = quota_tracker.usage()
+
+    providers = {}
+    for name, probe in reachability["value"].items():
+        provider_breakers = {
+            client: breakers[client] for client in PROVIDER_HTTP_CLIENTS[name] if client in breakers
+        }
+        providers[name] = {
+            **probe,
+            "circuit_breakers": provider_breakers,
+            "quota": quotas.get(name, {}),
+            "degraded": not probe["reachable"] or any(
+                breaker["state"] != "closed" for breaker in provider_breakers.values()
+            ),
+        }
+    return {
+        "providers": providers,
+        "checked_at": reachability["checked_at"],
+        "age_seconds": reachability["age_seconds"],
+    }
@@ -0,0 +1,488 @@
+"""
+Shared HTTP Clients
+
+This module keeps one named HTTP client per outbound integration, so every
+call to the same provider reuses pooled keep-alive connections under common
+limits and timeouts:
+
+- async ``httpx.AsyncClient`` instances (Apple ID, CalDAV, Microsoft Graph)
+- sync ``requests.Session`` instances for libraries that need one (Google
+  token refresh, MSAL, the caldav library)
+
+Provider modules register their clients at import time; the application
+opens them on startup and closes them on shutdown. Clients requested before
+startup (scripts, tests) are created on first use.
+
+Shared clients never store cookies, since they carry requests for many
+users. Per-user credentials are passed with each request.
+
+Each client also has a circuit breaker: after HTTP_BREAKER_FAILURE_THRESHOLD
+consecutive connection errors or 5xx responses it fails requests
+immediately for HTTP_BREAKER_RESET_SECONDS instead of letting every caller
+wait for a timeout, then lets traffic through again to test the provider.
+
+Clients registered with a ``provider`` report every call, with its
+operation, status, latency and bytes, to provider_calls.py.
+"""
+
+import logging
+import os
+import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from provider_calls import operation_from_path, record_provider_call
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_DEFAULT_TIMEOUT_SECONDS = float(os.getenv("HTTP_DEFAULT_TIMEOUT_SECONDS", "30"))
+# 0 disables the circuit breakers
+HTTP_BREAKER_FAILURE_THRESHOLD = int(os.getenv("HTTP_BREAKER_FAILURE_THRESHOLD", "5"))
+HTTP_BREAKER_RESET_SECONDS = float(os.getenv("HTTP_BREAKER_RESET_SECONDS", "30"))
+
+_async_specs: Dict[str, Dict[str, Any]] = {}
+_session_specs: Dict[str, Dict[str, Any]] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_sessions: Dict[str, requests.Session] = {}
+_stats: Dict[str, "ClientStats"] = {}
+_breakers: Dict[str, "CircuitBreaker"] = {}
+# name -> (provider, operation resolver) for clients that call a provider
+_providers: Dict[str, Tuple[str, Callable[[str, str], str]]] = {}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """
+    Raised by a shared async client while its circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one named client.
+
+    closed: requests pass. open: requests fail immediately until the reset
+    interval has passed. half_open: requests pass again; the next outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = HTTP_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = HTTP_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def allow_request(self) -> bool:
+        if self.failure_threshold <= 0 or self.state != "open":
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.failure_threshold <= 0:
+            return
+        # A failed trial request in half_open re-opens at once
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+
+    def record_status(self, status_code: int):
+        if status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class ClientStats:
+    """
+    Request and connection counters for one named client.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.connections_opened = 0
+        self.status_classes: Dict[str, int] = {}
+        self.latency_seconds_total = 0.0
+
+    def started(self):
+        self.requests += 1
+        self.in_flight += 1
+
+    def finished(self, started_at: float, status_code: Optional[int] = None):
+        self.in_flight = max(self.in_flight - 1, 0)
+        self.latency_seconds_total += time.monotonic() - started_at
+        if status_code is None:
+            self.errors += 1
+        else:
+            status_class = f"{status_code // 100}xx"
+            self.status_classes[status_class] = self.status_classes.get(status_class, 0) + 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        completed = self.requests - self.in_flight
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "connections_opened": self.connections_opened,
+            # Requests served on an existing keep-alive connection
+            "connection_reuse_ratio": (
+                round(1 - self.connections_opened / completed, 3) if completed else None
+            ),
+            "status_classes": dict(self.status_classes),
+            "avg_latency_ms": (
+                round(self.latency_seconds_total / completed * 1000, 1) if completed else None
+            ),
+        }
+
+
+def _no_cookies() -> CookieJar:
+    return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+
+def _register_provider(name: str, provider: Optional[str],
+                       operation: Optional[Callable[[str, str], str]]):
+    if provider:
+        _providers[name] = (provider, operation or operation_from_path)
+
+
+def register_async_client(name: str, provider: Optional[str] = None,
+                          operation: Optional[Callable[[str, str], str]] = None, **client_kwargs):
+    """
+    Declare an async client; other keyword arguments go to ``httpx.AsyncClient``.
+
+    Args:
+        name (str): Client name, e.g. "graph"
+        provider (str): Calendar provider the client calls, for call accounting
+        operation (Callable): Maps (method, path) to an operation label;
+            defaults to the method and the path with ids masked
+        **client_kwargs: Overrides for the default limits and timeout
+    """
+    _register_provider(name, provider, operation)
+    _async_specs[name] = client_kwargs
+    _stats.setdefault(name, ClientStats())
+    _breakers.setdefault(name, CircuitBreaker())
+
+
+def register_session(name: str, timeout: Optional[float] = None, provider: Optional[str] = None,
+                     operation: Optional[Callable[[str, str], str]] = None):
+    """
+    Declare a sync ``requests.Session``.
+
+    Args:
+        name (str): Session name, e.g. "google"
+        timeout (float): Timeout for requests sent without one
+        provider (str): Calendar provider the session calls, for call accounting
+        operation (Callable): Maps (method, path) to an operation label
+    """
+    _register_provider(name, provider, operation)
+    _session_specs[name] = {"timeout": timeout or HTTP_DEFAULT_TIMEOUT_SECONDS}
+    _stats.setdefault(name, ClientStats())
+    _breakers.setdefault(name, CircuitBreaker())
+
+
+def get_async_client(name: str) -> httpx.AsyncClient:
+    """
+    Return the shared async client registered under ``name``.
+    """
+    client = _async_clients.get(name)
+    if client is None or client.is_closed:
+        client = _create_async_client(name)
+        _async_clients[name] = client
+    return client
+
+
+def get_session(name: str) -> requests.Session:
+    """
+    Return the shared sync session registered under ``name``.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        session = _create_session(name)
+        _sessions[name] = session
+    return session
+
+
+async def open_http_clients():
+    """
+    Create every registered client (called on application startup).
+    """
+    for name in _async_specs:
+        get_async_client(name)
+    for name in _session_specs:
+        get_session(name)
+    logger.info(f"Opened HTTP clients: {', '.join(sorted([*_async_specs, *_session_specs]))}")
+
+
+async def close_http_clients():
+    """
+    Close every open client (called on application shutdown).
+    """
+    for name, client in list(_async_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"Error closing HTTP client {name}: {str(e)}")
+    _async_clients.clear()
+
+    for session in _sessions.values():
+        session.close()
+    _sessions.clear()
+
+
+def http_client_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Counters for every registered client, keyed by name.
+    """
+    return {name: stats.as_dict() for name, stats in sorted(_stats.items())}
+
+
+def circuit_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """
+    Circuit breaker state of every registered client, keyed by name.
+    """
+    return {name: breaker.as_dict() for name, breaker in sorted(_breakers.items())}
+
+
+def _create_async_client(name: str) -> httpx.AsyncClient:
+    if name not in _async_specs:
+        raise KeyError(f"HTTP client '{name}' is not registered")
+
+    stats = _stats[name]
+    breaker = _breakers[name]
+
+    async def trace(event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            stats.connections_opened += 1
+
+    async def on_request(request: httpx.Request):
+        stats.started()
+        request.extensions["trace"] = trace
+        request.extensions["started_at"] = time.monotonic()
+
+    async def on_response(response: httpx.Response):
+        stats.finished(response.request.extensions["started_at"], response.status_code)
+        breaker.record_status(response.status_code)
+
+    kwargs = {
+        "timeout": HTTP_DEFAULT_TIMEOUT_SECONDS,
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        **_async_specs[name],
+    }
+    return _InstrumentedAsyncClient(
+        name,
+        stats,
+        breaker,
+        cookies=_no_cookies(),
+        event_hooks={"request": [on_request], "response": [on_response]},
+        **kwargs,
+    )
+
+
+class _InstrumentedAsyncClient(httpx.AsyncClient):
+    """
+    AsyncClient that also counts requests failing without a response,
+    rejects requests while its circuit breaker is open and reports provider
+    calls.
+
+    Callers may set ``provider_retry`` (bool) and ``provider_units`` (calls
+    counted against quotas, e.g. $batch size) in the request extensions.
+    """
+
+    def __init__(self, name: str, stats: ClientStats, breaker: CircuitBreaker, **kwargs):
+        super().__init__(**kwargs)
+        self._name = name
+        self._stats = stats
+        self._breaker = breaker
+        self._provider = _providers.get(name)
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        if not self._breaker.allow_request():
+            raise CircuitOpenError(f"Circuit open for HTTP client '{self._name}'", request=request)
+        sent_at = time.perf_counter()
+        try:
+            response = await super().send(request, **kwargs)
+        except Exception:
+            started_at = request.extensions.get("started_at")
+            if started_at is not None:
+                self._stats.finished(started_at)
+            self._breaker.record_failure()
+            self._record_provider_call(request, None, sent_at)
+            raise
+
+        if self._provider is not None:
+            if kwargs.get("stream"):
+                # Streamed bodies are read later; record once the caller closes it
+                response.stream = _RecordOnClose(
+                    response.stream,
+                    lambda: self._record_provider_call(
+                        request, response, sent_at, response.num_bytes_downloaded
+                    ),
+                )
+            else:
+                self._record_provider_call(
+                    request, response, sent_at, response.num_bytes_downloaded or len(response.content)
+                )
+        return response
+
+    def _record_provider_call(self, request: httpx.Request, response: Optional[httpx.Response],
+                              sent_at: float, response_bytes: int = 0):
+        if self._provider is None:
+            return
+        provider, operation = self._provider
+        record_provider_call(
+            provider,
+            operation(request.method, request.url.path),
+            response.status_code if response is not None else None,
+            time.perf_counter() - sent_at,
+            request_bytes=int(request.headers.get("Content-Length") or 0),
+            response_bytes=response_bytes,
+            retry=bool(request.extensions.get("provider_retry")),
+            units=request.extensions.get("provider_units", 1),
+        )
+
+
+class _RecordOnClose(httpx.AsyncByteStream):
+    """
+    Response stream wrapper calling ``on_close`` once the body is closed.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class _InstrumentedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter applying a default timeout, recording ClientStats and
+    honoring the session's circuit breaker and reporting provider calls.
+    """
+
+    def __init__(self, name: str, stats: ClientStats, breaker: CircuitBreaker,
+                 timeout: float, **kwargs):
+        self._name = name
+        self._stats = stats
+        self._breaker = breaker
+        self._timeout = timeout
+        self._provider = _providers.get(name)
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if not self._breaker.allow_request():
+            raise requests.exceptions.ConnectionError(
+                f"Circuit open for HTTP session '{self._name}'", request=request
+            )
+        started_at = time.monotonic()
+        self._stats.started()
+        try:
+            response = super().send(request, timeout=timeout or self._timeout, **kwargs)
+        except Exception:
+            self._stats.finished(started_at)
+            self._breaker.record_failure()
+            self._record_provider_call(request, None, started_at)
+            raise
+        self._stats.finished(started_at, response.status_code)
+        self._breaker.record_status(response.status_code)
+        self._record_provider_call(request, response, started_at)
+        return response
+
+    def _record_provider_call(self, request, response, started_at: float):
+        if self._provider is None:
+            return
+        provider, operation = self._provider
+        body = request.body
+        record_provider_call(
+            provider,
+            operation(request.method, requests.utils.urlparse(request.url).path),
+            response.status_code if response is not None else None,
+            time.monotonic() - started_at,
+            request_bytes=len(body) if isinstance(body, (bytes, str)) else 0,
+            # The body is read after the adapter returns; use the declared size
+            response_bytes=int(response.headers.get("Content-Length") or 0) if response is not None else 0,
+        )
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        connection_pool = super().get_connection_with_tls_context(request, verify, proxies, cert)
+        _count_new_connections(connection_pool, self._stats)
+        return connection_pool
+
+
+def _count_new_connections(connection_pool, stats: ClientStats):
+    """
+    Wrap a urllib3 pool's connection factory once to count new connections.
+    """
+    if getattr(connection_pool, "_counts_connections", False):
+        return
+    new_conn = connection_pool._new_conn
+
+    def counted_new_conn():
+        stats.connections_opened += 1
+        return new_conn()
+
+    connection_pool._new_conn = counted_new_conn
+    connection_pool._counts_connections = True
+
+
+def _create_session(name: str) -> requests.Session:
+    if name not in _session_specs:
+        raise KeyError(f"HTTP session '{name}' is not registered")
+
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = _InstrumentedAdapter(
+        name,
+        _stats[name],
+        _breakers[name],
+        _session_specs[name]["timeout"],
+        pool_connections=10,
+        pool_maxsize=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,524 @@
+"""
+Streaming iCalendar Parser
+
+This module extracts the VEVENT properties the app uses (UID, SUMMARY,
+DESCRIPTION, LOCATION, DTSTART/DTEND with TZID, CREATED, LAST-MODIFIED,
+RRULE, EXDATE) from CalDAV multistatus REPORT bodies without building a
+full icalendar object tree.
+
+The fast path is a line scanner over the unfolded calendar-data text.
+Anything it does not handle exactly like icalendar (date-only values,
+non-IANA TZIDs, encoded or binary values, multiple VEVENTs such as
+recurrence overrides) falls back to ``icalendar`` so both paths return the
+same result.
+"""
+
+import logging
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from recurrence import occurrence_key
+
+logger = logging.getLogger(__name__)
+
+DAV_NS = "DAV:"
+CALDAV_NS = "urn:ietf:params:xml:ns:caldav"
+
+# Responses larger than this are parsed in a process pool (0 disables the pool)
+APPLE_PARSE_POOL_THRESHOLD_BYTES = int(os.getenv("APPLE_PARSE_POOL_THRESHOLD_BYTES", "0"))
+APPLE_PARSE_POOL_WORKERS = int(os.getenv("APPLE_PARSE_POOL_WORKERS", "2"))
+
+# VEVENT properties read by the fast path
+_WANTED_PROPERTIES = {
+    "UID", "SUMMARY", "DESCRIPTION", "LOCATION", "DTSTART", "DTEND",
+    "CREATED", "LAST-MODIFIED", "RRULE", "RECURRENCE-ID"
+}
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+class _NeedsFallback(Exception):
+    """Raised by the fast path for input it does not handle."""
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Return the process pool used for parsing very large REPORT responses.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=APPLE_PARSE_POOL_WORKERS)
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    """
+    Shut down the parse process pool if it was started.
+    """
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+class MultistatusParser:
+    """
+    Push parser for multistatus bodies that arrive in chunks.
+
+    Each DAV:response element is released as soon as it has been read, so
+    memory use is bounded by the largest single response, not the body.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("end",))
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, Optional[str], Optional[str], str]]:
+        """
+        Feed a body chunk and return the responses completed by it.
+
+        Returns:
+            List[Tuple]: (href, etag, calendar_data, status) per DAV:response
+        """
+        self._parser.feed(chunk)
+        return list(self._drain())
+
+    def close(self) -> List[Tuple[str, Optional[str], Optional[str], str]]:
+        """
+        Finish parsing and return any remaining responses.
+        """
+        self._parser.close()
+        return list(self._drain())
+
+    def _drain(self):
+        response_tag = f"{{{DAV_NS}}}response"
+        for _, element in self._parser.read_events():
+            if element.tag != response_tag:
+                continue
+            href = (element.findtext(f"{{{DAV_NS}}}href") or "").strip()
+            etag = element.findtext(f".//{{{DAV_NS}}}getetag")
+            calendar_data = element.findtext(f".//{{{CALDAV_NS}}}calendar-data")
+            status = element.findtext(f".//{{{DAV_NS}}}status") or ""
+            element.clear()
+            yield href, etag, calendar_data, status
+
+
+def iter_multistatus(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Optional[str], Optional[str], str]]:
+    """
+    Incrementally parse a multistatus body.
+
+    Args:
+        chunks (Iterable[bytes]): Body chunks (a single bytes object also works)
+
+    Yields:
+        Tuple: (href, etag, calendar_data, status) for every DAV:response
+    """
+    if isinstance(chunks, (bytes, str)):
+        chunks = [chunks]
+
+    parser = MultistatusParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def event_from_response(href: str, etag: Optional[str], calendar_data: Optional[str],
+                        base_url: str) -> Optional[Dict[str, Any]]:
+    """
+    Build event data from one multistatus response entry.
+
+    Returns:
+        Optional[Dict]: Parsed event including 'href', 'etag' and 'ical_data'
+    """
+    if not href or not calendar_data:
+        return None
+    event_data = parse_ical_event(calendar_data)
+    if event_data:
+        event_data['href'] = urljoin(base_url, href)
+        event_data['etag'] = etag
+        event_data['ical_data'] = calendar_data
+    return event_data
+
+
+def parse_multistatus_events(body: bytes, base_url: str) -> List[Dict[str, Any]]:
+    """
+    Parse every event in a calendar-multiget/calendar-query response.
+
+    This is a module-level function so it can run in the parse process pool.
+
+    Args:
+        body (bytes): Multistatus response body
+        base_url (str): URL the request was sent to, for resolving hrefs
+
+    Returns:
+        List[Dict]: Parsed event data including 'href', 'etag' and 'ical_data'
+    """
+    events = []
+    for href, etag, calendar_data, _ in iter_multistatus(body):
+        event_data = event_from_response(href, etag, calendar_data, base_url)
+        if event_data:
+            events.append(event_data)
+    return events
+
+
+def parse_sync_collection(body: bytes, calendar_url: str) -> Tuple[
+        List[Tuple[str, Optional[str], bool]], Optional[str], bool]:
+    """
+    Parse one RFC 6578 sync-collection REPORT response.
+
+    Args:
+        body (bytes): Multistatus response body
+        calendar_url (str): Calendar collection URL, for resolving hrefs
+
+    Returns:
+        Tuple: ([(href, etag, deleted)] in document order, the new sync
+        token or None, whether the server truncated the result (507))
+    """
+    root = ET.fromstring(body)
+    entries = []
+    truncated = False
+    for item in root.findall(f"{{{DAV_NS}}}response"):
+        href_el = item.find(f"{{{DAV_NS}}}href")
+        if href_el is None or not href_el.text:
+            continue
+        href = urljoin(calendar_url, href_el.text.strip())
+        status_text = item.findtext(f"{{{DAV_NS}}}status") or ""
+
+        # The collection itself is reported with 507 when results were truncated
+        if href.rstrip("/") == calendar_url.rstrip("/"):
+            truncated = truncated or " 507 " in status_text
+            continue
+
+        if " 404 " in status_text:
+            entries.append((href, None, True))
+            continue
+
+        entries.append((href, item.findtext(f".//{{{DAV_NS}}}getetag"), False))
+
+    return entries, root.findtext(f"{{{DAV_NS}}}sync-token"), truncated
+
+
+def parse_ical_event(ical_data) -> Optional[Dict[str, Any]]:
+    """
+    Parse a VCALENDAR payload into our standard event format.
+
+    Args:
+        ical_data (str or bytes): VCALENDAR payload
+
+    Returns:
+        Optional[Dict]: Parsed event data, None if there is no VEVENT
+    """
+    if isinstance(ical_data, bytes):
+        ical_data = ical_data.decode('utf-8')
+
+    try:
+        return _parse_fast(ical_data)
+    except _NeedsFallback:
+        return parse_with_icalendar(ical_data)
+    except Exception as e:
+        logger.debug(f"Fast iCal parse failed, falling back to icalendar: {str(e)}")
+        return parse_with_icalendar(ical_data)
+
+
+def parse_with_icalendar(ical_data: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a VCALENDAR payload with the icalendar library.
+
+    Args:
+        ical_data (str): VCALENDAR payload
+
+    Returns:
+        Optional[Dict]: Parsed event data
+    """
+    from icalendar import Calendar as ICalendar
+
+    try:
+        cal = ICalendar.from_ical(ical_data)
+
+        vevents = [component for component in cal.walk() if component.name == "VEVENT"]
+        if not vevents:
+            return None
+
+        # The master is the VEVENT without RECURRENCE-ID; the others override occurrences
+        master = next((c for c in vevents if c.get('recurrence-id') is None), vevents[0])
+        rrule = master.get('rrule')
+        dtstart = master.get('dtstart')
+
+        overrides = {}
+        for component in vevents:
+            recurrence_id = component.get('recurrence-id')
+            if component is master or recurrence_id is None:
+                continue
+            overrides[occurrence_key(_format_date_value(recurrence_id))] = {
+                'title': str(component.get('summary', '')),
+                'description': str(component.get('description', '')),
+                'location': str(component.get('location', '')),
+                'start_time': _format_datetime(component.get('dtstart')),
+                'end_time': _format_datetime(component.get('dtend')),
+                'cancelled': str(component.get('status', '')).upper() == 'CANCELLED'
+            }
+
+        return _build_event(
+            uid=str(master.get('uid', '')),
+            summary=str(master.get('summary', '')),
+            description=str(master.get('description', '')),
+            location=str(master.get('location', '')),
+            start=_format_datetime(dtstart),
+            end=_format_datetime(master.get('dtend')),
+            created=_format_datetime(master.get('created')),
+            last_modified=_format_datetime(master.get('last-modified')),
+            rrule=rrule.to_ical().decode('utf-8') if rrule else None,
+            timezone=dtstart.params.get('TZID') if dtstart is not None else None,
+            exdates=_icalendar_exdates(master.get('exdate')),
+            overrides=overrides
+        )
+
+    except Exception as e:
+        logger.error(f"Error parsing iCal event: {str(e)}")
+        return None
+
+
+def _build_event(uid, summary, description, location, start, end, created,
+                 last_modified, rrule, timezone=None, exdates=None,
+                 overrides=None) -> Dict[str, Any]:
+    event = {
+        'id': uid,
+        'title': summary,
+        'description': description,
+        'location': location,
+        'start_time': start,
+        'end_time': end,
+        'created_at': created,
+        'updated_at': last_modified,
+        'rrule': rrule,
+        'is_invite': False,  # Apple Calendar events are not invites by default
+        'invite_status': None
+    }
+    if rrule:
+        # Series fields consumed by recurrence.expand_series
+        event['timezone'] = timezone
+        event['exdates'] = exdates or []
+        event['overrides'] = overrides or {}
+    return event
+
+
+def _format_date_value(dt_value) -> Optional[str]:
+    """
+    Format an icalendar date or datetime property as ISO 8601.
+    """
+    dt = dt_value.dt if hasattr(dt_value, 'dt') else dt_value
+    return dt.isoformat() if hasattr(dt, 'isoformat') else None
+
+
+def _icalendar_exdates(exdate_value) -> List[str]:
+    """
+    Flatten icalendar EXDATE properties (one or many) into ISO strings.
+    """
+    if exdate_value is None:
+        return []
+    properties = exdate_value if isinstance(exdate_value, list) else [exdate_value]
+    exdates = []
+    for prop in properties:
+        for value in getattr(prop, 'dts', [prop]):
+            formatted = _format_date_value(value)
+            if formatted:
+                exdates.append(formatted)
+    return exdates
+
+
+def _format_datetime(dt_value) -> Optional[str]:
+    """
+    Format an icalendar datetime property as ISO 8601 (None for dates).
+    """
+    if not dt_value:
+        return None
+
+    dt = dt_value.dt if hasattr(dt_value, 'dt') else dt_value
+    if isinstance(dt, datetime):
+        return dt.isoformat()
+    elif isinstance(dt, str):
+        return dt
+
+    return None
+
+
+def _unfold_lines(ical_data: str) -> Iterator[str]:
+    """
+    Yield logical content lines, joining RFC 5545 folded continuations.
+    """
+    current = None
+    for raw_line in ical_data.splitlines():
+        if raw_line[:1] in (" ", "\t") and current is not None:
+            current += raw_line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = raw_line
+    if current is not None:
+        yield current
+
+
+def _split_content_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """
+    Split ``NAME;PARAM=VALUE:value`` into name, params and value.
+    """
+    in_quotes = False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ":" and not in_quotes:
+            head, value = line[:index], line[index + 1:]
+            break
+    else:
+        raise _NeedsFallback("content line without value")
+
+    parts = head.split(";")
+    params = {}
+    for part in parts[1:]:
+        key, _, param_value = part.partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return parts[0].upper(), params, value
+
+
+def _unescape_text(value: str) -> str:
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            result.append("\n" if escaped in ("n", "N") else escaped)
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+def _parse_date_time(value: str, params: Dict[str, str]) -> str:
+    if params.get("VALUE", "DATE-TIME").upper() != "DATE-TIME" or len(value) < 15:
+        # Date-only values are returned as None by the icalendar path
+        raise _NeedsFallback("non DATE-TIME value")
+
+    utc = value.endswith("Z")
+    dt = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if utc:
+        return dt.replace(tzinfo=timezone.utc).isoformat()
+
+    tzid = params.get("TZID")
+    if tzid:
+        try:
+            return dt.replace(tzinfo=ZoneInfo(tzid)).isoformat()
+        except (ZoneInfoNotFoundError, ValueError):
+            # Custom VTIMEZONE definitions need icalendar
+            raise _NeedsFallback(f"unknown TZID {tzid}")
+
+    return dt.isoformat()
+
+
+def parse_exdate_line(line: str) -> List[str]:
+    """
+    Parse one ``EXDATE`` content line (as found in Google's ``recurrence``
+    list) into ISO 8601 values; date-only values become ``YYYY-MM-DD``.
+
+    Args:
+        line (str): Content line, e.g. ``EXDATE;TZID=Europe/Berlin:20240108T100000``
+
+    Returns:
+        List[str]: Excluded occurrence starts, empty if the line cannot be read
+    """
+    try:
+        _, params, value = _split_content_line(line)
+        exdates = []
+        for part in value.split(","):
+            if len(part) == 8:
+                exdates.append(datetime.strptime(part, "%Y%m%d").date().isoformat())
+            else:
+                exdates.append(_parse_date_time(part, params))
+        return exdates
+    except (_NeedsFallback, ValueError) as e:
+        logger.warning(f"Could not parse EXDATE line {line!r}: {str(e)}")
+        return []
+
+
+def _parse_fast(ical_data: str) -> Optional[Dict[str, Any]]:
+    """
+    Line-scanning parser for the first VEVENT of a payload.
+
+    Raises:
+        _NeedsFallback: For input that must be handled by icalendar
+    """
+    properties: Dict[str, Tuple[Dict[str, str], str]] = {}
+    exdates: List[str] = []
+    depth = 0
+    vevent_count = 0
+    in_vevent = False
+
+    for line in _unfold_lines(ical_data):
+        if not line:
+            continue
+        upper = line.upper()
+
+        if upper.startswith("BEGIN:"):
+            if upper == "BEGIN:VEVENT":
+                vevent_count += 1
+                if vevent_count > 1:
+                    # Recurrence overrides: let icalendar pick the component
+                    raise _NeedsFallback("multiple VEVENTs")
+                in_vevent = True
+                depth = 0
+            elif in_vevent:
+                depth += 1
+            continue
+
+        if upper.startswith("END:"):
+            if in_vevent:
+                if depth == 0 and upper == "END:VEVENT":
+                    in_vevent = False
+                else:
+                    depth -= 1
+            continue
+
+        # Only direct VEVENT properties, not those of nested VALARMs
+        if not in_vevent or depth:
+            continue
+
+        name, params, value = _split_content_line(line)
+        if name == "EXDATE":
+            # EXDATE may repeat and carry comma-separated values
+            exdates.extend(_parse_date_time(part, params) for part in value.split(","))
+            continue
+        if name not in _WANTED_PROPERTIES or name in properties:
+            continue
+        if name == "RECURRENCE-ID":
+            # A lone override instance; icalendar decides what to return
+            raise _NeedsFallback("override without master")
+        if "ENCODING" in params or params.get("VALUE", "").upper() == "BINARY":
+            raise _NeedsFallback("encoded value")
+        properties[name] = (params, value)
+
+    if not vevent_count:
+        return None
+
+    def text(name: str) -> str:
+        params_value = properties.get(name)
+        return _unescape_text(params_value[1]) if params_value else ''
+
+    def date_time(name: str) -> Optional[str]:
+        params_value = properties.get(name)
+        return _parse_date_time(params_value[1], params_value[0]) if params_value else None
+
+    return _build_event(
+        uid=properties.get("UID", ({}, ""))[1],
+        summary=text("SUMMARY"),
+        description=text("DESCRIPTION"),
+        location=text("LOCATION"),
+        start=date_time("DTSTART"),
+        end=date_time("DTEND"),
+        created=date_time("CREATED"),
+        last_modified=date_time("LAST-MODIFIED"),
+        rrule=properties["RRULE"][1] if "RRULE" in properties else None,
+        timezone=properties.get("DTSTART", ({}, ""))[0].get("TZID"),
+        exdates=exdates
+    )
@@ -0,0 +1,147 @@
+"""
+Leader Leases for Background Loops
+
+With several server workers (gunicorn, or more than one instance) every
+worker runs the startup hooks. Per-worker work such as opening connection
+pools or priming caches is fine to repeat, but loops that renew Google
+watch channels, Microsoft subscriptions or tokens must run once per
+deployment, or each renewal is done (and billed) once per worker.
+
+A lease is a document in ``db.leases`` holding the current holder and an
+expiry. One worker acquires it and runs the loop; it renews the lease
+periodically and the others keep trying, so if the holder exits or hangs
+another worker takes over once the lease expires.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from dependencies import db
+from metrics import BACKGROUND_TASKS_RUNNING
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE_TTL_SECONDS = int(os.getenv("LEADER_LEASE_TTL_SECONDS", "60"))
+# Holders renew (and followers retry) this often; well inside the TTL
+LEADER_LEASE_RENEW_SECONDS = float(
+    os.getenv("LEADER_LEASE_RENEW_SECONDS", str(LEADER_LEASE_TTL_SECONDS / 3))
+)
+
+# Identifies this worker process as a lease holder
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_leader_tasks: Dict[str, asyncio.Task] = {}
+
+
+async def acquire_lease(name: str, ttl_seconds: int = LEADER_LEASE_TTL_SECONDS) -> bool:
+    """
+    Acquire or renew the named lease for this worker.
+
+    Args:
+        name (str): Lease name, one per background loop
+        ttl_seconds (int): How long the lease stays valid without renewal
+
+    Returns:
+        bool: True if this worker holds the lease
+    """
+    now = datetime.utcnow()
+    try:
+        lease = await db.leases.find_one_and_update(
+            {
+                "_id": name,
+                "$or": [{"holder": WORKER_ID}, {"expires_at": {"$lte": now}}],
+            },
+            {
+                "$set": {"holder": WORKER_ID, "expires_at": now + timedelta(seconds=ttl_seconds)},
+                "$setOnInsert": {"created_at": now},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Another worker holds an unexpired lease (the upsert raced its _id)
+        return False
+    return lease is not None and lease.get("holder") == WORKER_ID
+
+
+async def release_lease(name: str):
+    """
+    Give up the named lease if this worker holds it.
+    """
+    await db.leases.delete_one({"_id": name, "holder": WORKER_ID})
+
+
+async def _run_while_leader(name: str, loop_factory: Callable[[], Awaitable[Any]]):
+    task: Optional[asyncio.Task] = None
+    # Monotonic time the lease was last renewed (start of that renewal)
+    last_renewed: Optional[float] = None
+    try:
+        while True:
+            attempt_started = time.monotonic()
+            try:
+                # Bounded so a hung database cannot outlast the lease unnoticed
+                is_leader = await asyncio.wait_for(acquire_lease(name), timeout=LEADER_LEASE_RENEW_SECONDS)
+                if is_leader:
+                    last_renewed = attempt_started
+            except Exception as e:
+                # Without a verdict keep the current role until the lease would
+                # expire; after that another worker may hold it
+                logger.warning(f"Lease {name}: could not reach the database: {str(e) or type(e).__name__}")
+                is_leader = task is not None and last_renewed is not None and \
+                    time.monotonic() - last_renewed < LEADER_LEASE_TTL_SECONDS
+
+            if is_leader and (task is None or task.done()):
+                logger.info(f"Lease {name}: acquired by {WORKER_ID}; starting loop")
+                task = asyncio.create_task(loop_factory())
+                BACKGROUND_TASKS_RUNNING.labels(name).inc()
+                task.add_done_callback(lambda _: BACKGROUND_TASKS_RUNNING.labels(name).dec())
+            elif not is_leader and task is not None:
+                logger.warning(f"Lease {name}: lost by {WORKER_ID}; stopping loop")
+                task.cancel()
+                task = None
+
+            await asyncio.sleep(LEADER_LEASE_RENEW_SECONDS)
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+def start_leader_task(name: str, loop_factory: Callable[[], Awaitable[Any]]):
+    """
+    Run a background loop in exactly one worker across the deployment.
+
+    Args:
+        name (str): Lease name
+        loop_factory (Callable): Returns the loop coroutine when this worker
+            becomes the leader
+    """
+    if name in _leader_tasks and not _leader_tasks[name].done():
+        return
+    _leader_tasks[name] = asyncio.create_task(_run_while_leader(name, loop_factory))
+
+
+async def stop_leader_tasks():
+    """
+    Stop leader loops and release their leases so another worker can take
+    over without waiting for them to expire (called on shutdown).
+    """
+    for name, task in list(_leader_tasks.items()):
+        task.cancel()
+        try:
+            # Bounded so an unreachable database cannot stall worker shutdown
+            await asyncio.wait_for(release_lease(name), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning(f"Could not release lease {name}: timed out")
+        except Exception as e:
+            logger.warning(f"Could not release lease {name}: {str(e)}")
+    _leader_tasks.clear()
+
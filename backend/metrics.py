@@ -0,0 +1,216 @@
+"""
+Prometheus Metrics
+
+Exposed on /metrics in the Prometheus text format:
+
+- ``http_requests_total`` and ``http_request_duration_seconds``, labelled by
+  method, route template (``/api/events/{event_id}``, never the raw path)
+  and status, recorded by MetricsMiddleware
+- ``http_requests_in_progress``
+- ``mongodb_command_duration_seconds`` by collection and command, recorded
+  by a pymongo CommandListener attached to the Motor client
+- ``provider_calls_total``, ``provider_call_duration_seconds`` and the
+  provider retry, byte, rate-limit and quota series, recorded by
+  provider_calls.py for every Google, Graph and CalDAV call
+- ``background_tasks_running``, ``apple_parse_pool_jobs_in_flight`` and
+  ``warmup_ready`` for background work
+
+Under gunicorn each worker has its own counters. Set PROMETHEUS_MULTIPROC_DIR
+to an empty, writable directory to have /metrics aggregate all workers.
+"""
+
+import os
+import time
+from typing import Any, Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from pymongo import monitoring
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Seconds; API requests include provider round trips
+HTTP_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Label for requests that matched no route (keeps 404 scans from adding series)
+UNMATCHED_ROUTE = "<unmatched>"
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+    buckets=HTTP_LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled", ["method"],
+    multiprocess_mode="livesum",
+)
+
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ["collection", "command"],
+    buckets=MONGO_LATENCY_BUCKETS,
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total", "MongoDB commands that failed", ["collection", "command"]
+)
+
+PROVIDER_CALLS = Counter(
+    "provider_calls_total", "Calls to calendar providers", ["provider", "operation", "status"]
+)
+PROVIDER_CALL_DURATION = Histogram(
+    "provider_call_duration_seconds", "Calendar provider call latency", ["provider", "operation"],
+    buckets=HTTP_LATENCY_BUCKETS,
+)
+PROVIDER_CALL_RETRIES = Counter(
+    "provider_call_retries_total", "Provider calls repeating a throttled call", ["provider", "operation"]
+)
+PROVIDER_REQUEST_BYTES = Counter(
+    "provider_request_bytes_total", "Request body bytes sent to providers", ["provider", "operation"]
+)
+PROVIDER_RESPONSE_BYTES = Counter(
+    "provider_response_bytes_total", "Response body bytes received from providers", ["provider", "operation"]
+)
+PROVIDER_RATE_LIMITED = Counter(
+    "provider_rate_limited_total", "Provider calls rejected for rate or quota limits", ["provider", "operation"]
+)
+PROVIDER_QUOTA_USAGE = Gauge(
+    "provider_quota_usage_ratio", "Share of the provider quota used in the current window", ["provider", "scope"],
+    multiprocess_mode="livesum",
+)
+PROVIDER_QUOTA_WARNINGS = Counter(
+    "provider_quota_warnings_total", "Times usage crossed the quota warning ratio", ["provider", "scope"]
+)
+
+BACKGROUND_TASKS_RUNNING = Gauge(
+    "background_tasks_running", "Background loops running in this deployment", ["task"],
+    multiprocess_mode="livesum",
+)
+PARSE_POOL_JOBS_IN_FLIGHT = Gauge(
+    "apple_parse_pool_jobs_in_flight", "CalDAV responses queued or being parsed in the process pool",
+    multiprocess_mode="livesum",
+)
+WARMUP_READY = Gauge(
+    "warmup_ready", "1 once every worker has finished its startup warmup",
+    multiprocess_mode="livemin",
+)
+
+
+_route_templates: Dict[Any, str] = {}
+
+
+def route_template(scope) -> str:
+    """
+    Path template of the route that handled a request, e.g.
+    "/api/events/{event_id}", from the endpoint the router stored in the scope.
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    template = _route_templates.get(endpoint)
+    if template is None:
+        # Routes are all registered by the time requests arrive; build once
+        for route in scope["app"].routes:
+            route_endpoint = getattr(route, "endpoint", None)
+            path = getattr(route, "path", None)
+            if route_endpoint is not None and path is not None:
+                _route_templates.setdefault(route_endpoint, path)
+        template = _route_templates.setdefault(endpoint, UNMATCHED_ROUTE)
+    return template
+
+
+def command_labels(event) -> Tuple[str, str]:
+    """
+    (collection, command name) of a pymongo command started event.
+    """
+    command = event.command
+    target = command.get(event.command_name)
+    if event.command_name == "getMore":
+        target = command.get("collection")
+    return (target if isinstance(target, str) else "", event.command_name)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request count, latency and in-flight requests.
+
+    The route label is the matched route's path template, looked up from
+    the endpoint the router stored in the scope.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = route_template(scope)
+            HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    pymongo CommandListener timing every command by collection and name.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+
+    def started(self, event):
+        self._pending[(event.connection_id, event.request_id)] = command_labels(event)
+
+    def succeeded(self, event):
+        labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels is not None:
+            MONGO_COMMAND_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels is not None:
+            MONGO_COMMAND_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+            MONGO_COMMAND_FAILURES.labels(*labels).inc()
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Render every metric in the Prometheus text format.
+
+    Returns:
+        Tuple[bytes, str]: Body and content type
+    """
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -3,19 +3,57 @@ Microsoft Identity Platform Authentication Service
 
 This module handles Microsoft OAuth 2.0 authentication flow for Outlook Calendar integration.
 Uses msal library for secure token management.
+
+One ConfidentialClientApplication is shared by the whole process, so authority
+discovery happens once. Its SerializableTokenCache holds every signed-in
+account; export_account_cache/import_account_cache move one account's slice
+of it to and from the database.
 """
 
 import os
+import json
+import asyncio
 import logging
-from typing import Dict, Optional, Any
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Any
 from datetime import datetime, timedelta
-import msal
 from dotenv import load_dotenv
 
+from http_clients import get_session, register_session
+
+if TYPE_CHECKING:
+    # msal is imported on first use so disabled or idle workers skip it
+    import msal
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# MSAL adds these itself and rejects them when passed explicitly
+_RESERVED_SCOPES = {"openid", "profile", "offline_access"}
+
+_shared_app: Optional["msal.ConfidentialClientApplication"] = None
+_token_cache: Optional["msal.SerializableTokenCache"] = None
+# Guards creating the shared app and cache. Token calls do network I/O and
+# run unlocked: the MSAL cache locks its own reads and writes.
+_msal_lock = threading.RLock()
+
+register_session("msal", provider="microsoft")
+
+
+def _get_token_cache() -> "msal.SerializableTokenCache":
+    """
+    Return the process-wide MSAL token cache, creating it on first use.
+    """
+    global _token_cache
+    with _msal_lock:
+        if _token_cache is None:
+            import msal
+            
+            _token_cache = msal.SerializableTokenCache()
+        return _token_cache
+
+
 class MicrosoftAuthService:
     """
     Service class for Microsoft Identity Platform authentication.
@@ -60,15 +98,11 @@ class MicrosoftAuthService:
             str: Authorization URL
         """
         try:
-            app = msal.ConfidentialClientApplication(
-                self.client_id,
-                authority=self.AUTHORITY,
-                client_credential=self.client_secret
-            )
+            app = self._get_app()
             
             # Generate authorization URL
             auth_url = app.get_authorization_request_url(
-                scopes=self.SCOPES,
+                scopes=self._request_scopes(),
                 state=state,
                 redirect_uri=self.redirect_uri
             )
@@ -92,18 +126,15 @@ class MicrosoftAuthService:
             Dict: Token information and user data
         """
         try:
-            app = msal.ConfidentialClientApplication(
-                self.client_id,
-                authority=self.AUTHORITY,
-                client_credential=self.client_secret
-            )
+            app = self._get_app()
             
             # Exchange authorization code for tokens
             result = app.acquire_token_by_authorization_code(
                 code,
-                scopes=self.SCOPES,
+                scopes=self._request_scopes(),
                 redirect_uri=self.redirect_uri
             )
+            account = self._account_for_result(app, result)
             
             if "error" in result:
                 logger.error(f"Token acquisition failed: {result.get('error_description')}")
@@ -115,6 +146,7 @@ class MicrosoftAuthService:
                 "refresh_token": result.get("refresh_token"),
                 "expires_at": datetime.utcnow() + timedelta(seconds=result.get("expires_in", 3600)),
                 "scope": result.get("scope", " ".join(self.SCOPES)),
+                "home_account_id": account.get("home_account_id") if account else None,
                 "user_data": {
                     "id": result.get("id_token_claims", {}).get("oid"),
                     "name": result.get("id_token_claims", {}).get("name"),
@@ -141,17 +173,14 @@ class MicrosoftAuthService:
             Dict: New token information
         """
         try:
-            app = msal.ConfidentialClientApplication(
-                self.client_id,
-                authority=self.AUTHORITY,
-                client_credential=self.client_secret
-            )
+            app = self._get_app()
             
             # Refresh the token
             result = app.acquire_token_by_refresh_token(
                 refresh_token,
-                scopes=self.SCOPES
+                scopes=self._request_scopes()
             )
+            account = self._account_for_result(app, result)
             
             if "error" in result:
                 logger.error(f"Token refresh failed: {result.get('error_description')}")
@@ -161,7 +190,8 @@ class MicrosoftAuthService:
             token_data = {
                 "access_token": result.get("access_token"),
                 "refresh_token": result.get("refresh_token") or refresh_token,  # Keep old if not provided
-                "expires_at": datetime.utcnow() + timedelta(seconds=result.get("expires_in", 3600))
+                "expires_at": datetime.utcnow() + timedelta(seconds=result.get("expires_in", 3600)),
+                "home_account_id": account.get("home_account_id") if account else None
             }
             
             logger.info("Successfully refreshed Microsoft token")
@@ -171,6 +201,115 @@ class MicrosoftAuthService:
             logger.error(f"Error refreshing Microsoft token: {str(e)}")
             raise
     
+    def acquire_token_for_account(self, home_account_id: str,
+                                  force_refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get an access token for a cached account, refreshing it through MSAL if needed.
+        
+        Args:
+            home_account_id (str): MSAL home account ID
+            force_refresh (bool): Refresh even if the cached token is still valid
+            
+        Returns:
+            Optional[Dict]: New token information, None if the account is not
+            in the cache or MSAL could not refresh silently
+        """
+        app = self._get_app()
+        account = next(
+            (a for a in app.get_accounts() if a.get("home_account_id") == home_account_id),
+            None
+        )
+        if not account:
+            return None
+        result = app.acquire_token_silent(
+            self._request_scopes(), account=account, force_refresh=force_refresh
+        )
+        
+        if not result or "access_token" not in result:
+            if result:
+                logger.warning(f"Silent Microsoft token refresh failed: {result.get('error_description')}")
+            return None
+        
+        return {
+            "access_token": result.get("access_token"),
+            "expires_at": datetime.utcnow() + timedelta(seconds=result.get("expires_in", 3600))
+        }
+    
+    def export_account_cache(self, home_account_id: str) -> str:
+        """
+        Serialize the token cache entries belonging to one account.
+        
+        Args:
+            home_account_id (str): MSAL home account ID
+            
+        Returns:
+            str: Serialized cache slice, suitable for import_account_cache
+        """
+        state = json.loads(_get_token_cache().serialize())
+        
+        partition = {
+            section: {
+                key: entry for key, entry in entries.items()
+                if entry.get("home_account_id") == home_account_id
+            }
+            for section, entries in state.items()
+            if isinstance(entries, dict)
+        }
+        return json.dumps(partition)
+    
+    def import_account_cache(self, serialized: str):
+        """
+        Merge an account's cache slice (from export_account_cache) into the shared cache.
+        """
+        token_cache = _get_token_cache()
+        # The cache's own (reentrant) lock keeps concurrent token writes from
+        # landing between serialize and deserialize and being dropped
+        with token_cache._lock:
+            state = json.loads(token_cache.serialize())
+            for section, entries in json.loads(serialized).items():
+                state.setdefault(section, {}).update(entries)
+            token_cache.deserialize(json.dumps(state))
+    
+    def has_account(self, home_account_id: str) -> bool:
+        """
+        Whether an account is present in this process's token cache.
+        """
+        return any(
+            a.get("home_account_id") == home_account_id
+            for a in self._get_app().get_accounts()
+        )
+    
+    def _get_app(self) -> "msal.ConfidentialClientApplication":
+        """
+        Return the process-wide MSAL application, creating it on first use.
+        """
+        global _shared_app
+        with _msal_lock:
+            if _shared_app is None:
+                import msal
+                
+                _shared_app = msal.ConfidentialClientApplication(
+                    self.client_id,
+                    authority=self.AUTHORITY,
+                    client_credential=self.client_secret,
+                    token_cache=_get_token_cache(),
+                    http_client=get_session("msal")
+                )
+            return _shared_app
+    
+    def _account_for_result(self, app: "msal.ConfidentialClientApplication",
+                            result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Find the cache account a token response was stored under.
+        """
+        oid = (result.get("id_token_claims") or {}).get("oid")
+        if not oid:
+            return None
+        return next((a for a in app.get_accounts() if a.get("local_account_id") == oid), None)
+    
+    def _request_scopes(self):
+        return [scope for scope in self.SCOPES if scope not in _RESERVED_SCOPES]
+    
     def validate_token(self, access_token: str) -> bool:
         """
         Validate Microsoft access token.
@@ -188,3 +327,18 @@ class MicrosoftAuthService:
         except Exception as e:
             logger.error(f"Error validating Microsoft token: {str(e)}")
             return False
+
+
+async def prewarm_msal():
+    """
+    Create the shared MSAL application ahead of the first request.
+    
+    MSAL resolves the authority's OpenID configuration when the application
+    is created; doing it on warmup keeps that round trip off sign-in and
+    token refresh.
+    """
+    service = MicrosoftAuthService()
+    if not service.client_id:
+        logger.info("Skipping MSAL warmup: Microsoft credentials not configured")
+        return
+    await asyncio.to_thread(service._get_app)
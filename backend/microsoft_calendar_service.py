@@ -2,16 +2,34 @@
 Microsoft Calendar Service
 
 This module handles Microsoft Graph API integration for Outlook Calendar.
+Requests go through the shared async GraphClient (see graph_client.py).
 """
 
-import requests
 import logging
-from typing import List, Dict, Optional, Any
+from typing import AsyncIterator, List, Dict, Optional, Any
 from datetime import datetime
+from urllib.parse import urlencode
 import pytz
 
+from graph_client import GRAPH_API_BASE, GraphAPIError, GraphClient
+
 logger = logging.getLogger(__name__)
 
+# Page sizes requested via Prefer: odata.maxpagesize (Graph caps them at its own maximum)
+DELTA_PAGE_SIZE = 200
+EVENT_PAGE_SIZE = 100
+
+# Event properties read by _transform_event
+EVENT_SELECT_FIELDS = ",".join([
+    "id", "subject", "body", "start", "end", "location", "createdDateTime",
+    "lastModifiedDateTime", "isAllDay", "isReminderOn", "attendees"
+])
+
+
+class DeltaLinkExpiredError(Exception):
+    """Raised when Graph no longer accepts a stored deltaLink (410 Gone)."""
+
+
 class MicrosoftCalendarService:
     """
     Service class for Microsoft Outlook Calendar integration.
@@ -22,7 +40,7 @@ class MicrosoftCalendarService:
     - Managing calendar sync
     """
     
-    GRAPH_API_BASE = "https://graph.microsoft.com/v1.0"
+    GRAPH_API_BASE = GRAPH_API_BASE
     
     def __init__(self, access_token: str):
         """
@@ -32,12 +50,9 @@ class MicrosoftCalendarService:
             access_token (str): Microsoft access token
         """
         self.access_token = access_token
-        self.headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
+        self.graph = GraphClient(access_token)
     
-    def get_user_info(self) -> Dict[str, Any]:
+    async def get_user_info(self) -> Dict[str, Any]:
         """
         Get authenticated user information from Microsoft Graph.
         
@@ -45,10 +60,7 @@ class MicrosoftCalendarService:
             Dict: User information
         """
         try:
-            response = requests.get(
-                f"{self.GRAPH_API_BASE}/me",
-                headers=self.headers
-            )
+            response = await self.graph.get("/me")
             
             if response.status_code == 200:
                 return response.json()
@@ -60,7 +72,7 @@ class MicrosoftCalendarService:
             logger.error(f"Error getting Microsoft user info: {str(e)}")
             return {}
     
-    def get_calendars(self) -> List[Dict[str, Any]]:
+    async def get_calendars(self) -> List[Dict[str, Any]]:
         """
         Get user's calendars from Outlook.
         
@@ -68,10 +80,7 @@ class MicrosoftCalendarService:
             List[Dict]: List of calendar objects
         """
         try:
-            response = requests.get(
-                f"{self.GRAPH_API_BASE}/me/calendars",
-                headers=self.headers
-            )
+            response = await self.graph.get("/me/calendars")
             
             if response.status_code == 200:
                 return response.json().get("value", [])
@@ -83,12 +92,12 @@ class MicrosoftCalendarService:
             logger.error(f"Error getting Microsoft calendars: {str(e)}")
             return []
     
-    def get_events(
+    async def get_events(
         self, 
         calendar_id: str = None,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        max_results: int = 50
+        max_results: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
         Fetch calendar events from Microsoft Outlook.
@@ -97,53 +106,202 @@ class MicrosoftCalendarService:
             calendar_id (str): Specific calendar ID (None for default calendar)
             start_date (datetime): Start date for events
             end_date (datetime): End date for events
-            max_results (int): Maximum number of events to return
+            max_results (int): Maximum number of events to return (None for all)
             
         Returns:
             List[Dict]: List of event objects with unified format
         """
+        unified_events = []
         try:
-            # Determine calendar endpoint
-            if calendar_id:
-                endpoint = f"{self.GRAPH_API_BASE}/me/calendars/{calendar_id}/events"
-            else:
-                endpoint = f"{self.GRAPH_API_BASE}/me/events"
-            
-            # Build query parameters
-            params = {}
-            if start_date:
-                params["startDateTime"] = start_date.isoformat()
-            if end_date:
-                params["endDateTime"] = end_date.isoformat()
-            params["$top"] = str(max_results)
-            
-            # Fetch events
-            response = requests.get(
-                endpoint,
-                headers=self.headers,
-                params=params
-            )
+            async for page in self.iter_event_pages(calendar_id, start_date, end_date):
+                unified_events.extend(page)
+                if max_results and len(unified_events) >= max_results:
+                    unified_events = unified_events[:max_results]
+                    break
             
-            if response.status_code == 200:
-                events = response.json().get("value", [])
-                
-                # Transform Microsoft events to unified format
-                unified_events = []
-                for event in events:
-                    unified_event = self._transform_event(event)
-                    unified_events.append(unified_event)
-                
-                logger.info(f"Fetched {len(unified_events)} Microsoft events")
-                return unified_events
-            else:
-                logger.error(f"Failed to get events: {response.status_code} - {response.text}")
-                return []
+            logger.info(f"Fetched {len(unified_events)} Microsoft events")
+            return unified_events
                 
         except Exception as e:
             logger.error(f"Error fetching Microsoft events: {str(e)}")
-            return []
+            return unified_events
+    
+    async def iter_event_pages(
+        self,
+        calendar_id: str = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream events page by page, following @odata.nextLink to the end.
+        
+        With a date range this reads the calendar view, which includes
+        occurrences of recurring events; without one it lists events.
+        Only the fields _transform_event reads are selected.
+        
+        Args:
+            calendar_id (str): Specific calendar ID (None for default calendar)
+            start_date (datetime): Start date for events
+            end_date (datetime): End date for events
+            
+        Yields:
+            List[Dict]: One page of events in unified format
+        """
+        base = f"/me/calendars/{calendar_id}" if calendar_id else "/me"
+        params = {"$select": EVENT_SELECT_FIELDS}
+        if start_date and end_date:
+            url = f"{base}/calendarView"
+            params["startDateTime"] = start_date.isoformat()
+            params["endDateTime"] = end_date.isoformat()
+            params["$orderby"] = "start/dateTime"
+        else:
+            url = f"{base}/events"
+        headers = {"Prefer": f"odata.maxpagesize={EVENT_PAGE_SIZE}"}
+        
+        while url:
+            response = await self.graph.get(url, params=params, headers=headers)
+            if response.status_code != 200:
+                logger.error(f"Failed to get events: {response.status_code} - {response.text}")
+                raise GraphAPIError(response.status_code, f"Failed to get events: {response.text}")
+            
+            page = response.json()
+            yield [self._transform_event(event) for event in page.get("value", [])]
+            
+            # nextLink already carries the query string
+            url, params = page.get("@odata.nextLink"), None
+    
+    async def get_event_delta(
+        self,
+        delta_link: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Fetch calendar view changes since the last delta round.
+        
+        Without a delta_link this starts a new round for the given window and
+        returns every event in it; with one it returns only what changed.
+        
+        Args:
+            delta_link (str): @odata.deltaLink from the previous round
+            start_date (datetime): Window start (new rounds only)
+            end_date (datetime): Window end (new rounds only)
+            
+        Returns:
+            Dict: {'changed': [unified events], 'deleted': [event ids],
+                   'delta_link': str}
+            
+        Raises:
+            DeltaLinkExpiredError: If Graph requires a full resync
+        """
+        if delta_link:
+            url, params = delta_link, None
+        else:
+            url = "/me/calendarView/delta"
+            params = {
+                "startDateTime": start_date.isoformat(),
+                "endDateTime": end_date.isoformat()
+            }
+        headers = {"Prefer": f"odata.maxpagesize={DELTA_PAGE_SIZE}"}
+        
+        changed, deleted = [], []
+        while True:
+            response = await self.graph.get(url, params=params, headers=headers)
+            if response.status_code == 410:
+                raise DeltaLinkExpiredError(response.text)
+            if response.status_code != 200:
+                raise GraphAPIError(response.status_code, f"Delta query failed: {response.text}")
+            
+            page = response.json()
+            for item in page.get("value", []):
+                if "@removed" in item:
+                    deleted.append(item.get("id"))
+                else:
+                    changed.append(self._transform_event(item))
+            
+            if page.get("@odata.nextLink"):
+                # nextLink already carries the query string
+                url, params = page["@odata.nextLink"], None
+                continue
+            
+            logger.info(f"Microsoft delta: {len(changed)} changed, {len(deleted)} deleted")
+            return {
+                "changed": changed,
+                "deleted": deleted,
+                "delta_link": page.get("@odata.deltaLink")
+            }
+    
+    async def create_subscription(
+        self,
+        notification_url: str,
+        client_state: str,
+        expiration: datetime
+    ) -> Dict[str, Any]:
+        """
+        Subscribe to change notifications for the user's events.
+        
+        Graph validates notification_url synchronously by posting a
+        validationToken to it before this call returns.
+        
+        Args:
+            notification_url (str): Public URL of the notifications endpoint
+            client_state (str): Secret echoed back in every notification
+            expiration (datetime): Requested expiration (UTC)
+            
+        Returns:
+            Dict: Created subscription
+        """
+        response = await self.graph.post("/subscriptions", json={
+            "changeType": "created,updated,deleted",
+            "notificationUrl": notification_url,
+            "lifecycleNotificationUrl": notification_url,
+            "resource": "me/events",
+            "expirationDateTime": expiration.strftime("%Y-%m-%dT%H:%M:%S.0000000Z"),
+            "clientState": client_state
+        })
+        if response.status_code != 201:
+            raise GraphAPIError(response.status_code, f"Failed to create subscription: {response.text}")
+        
+        subscription = response.json()
+        logger.info(f"Created Microsoft subscription {subscription.get('id')}")
+        return subscription
     
-    def create_event(self, event_data: Dict[str, Any], calendar_id: str = None) -> Dict[str, Any]:
+    async def renew_subscription(self, subscription_id: str, expiration: datetime) -> Dict[str, Any]:
+        """
+        Extend a change-notification subscription.
+        
+        Args:
+            subscription_id (str): Graph subscription ID
+            expiration (datetime): New expiration (UTC)
+            
+        Returns:
+            Dict: Updated subscription
+        """
+        response = await self.graph.patch(f"/subscriptions/{subscription_id}", json={
+            "expirationDateTime": expiration.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+        })
+        if response.status_code != 200:
+            raise GraphAPIError(response.status_code, f"Failed to renew subscription: {response.text}")
+        return response.json()
+    
+    async def delete_subscription(self, subscription_id: str) -> bool:
+        """
+        Delete a change-notification subscription.
+        
+        Args:
+            subscription_id (str): Graph subscription ID
+            
+        Returns:
+            bool: True if deleted (or already gone)
+        """
+        try:
+            response = await self.graph.delete(f"/subscriptions/{subscription_id}")
+            return response.status_code in (204, 404)
+        except Exception as e:
+            logger.error(f"Error deleting Microsoft subscription: {str(e)}")
+            return False
+    
+    async def create_event(self, event_data: Dict[str, Any], calendar_id: str = None) -> Dict[str, Any]:
         """
         Create a new event in Microsoft Outlook calendar.
         
@@ -157,19 +315,15 @@ class MicrosoftCalendarService:
         try:
             # Determine calendar endpoint
             if calendar_id:
-                endpoint = f"{self.GRAPH_API_BASE}/me/calendars/{calendar_id}/events"
+                endpoint = f"/me/calendars/{calendar_id}/events"
             else:
-                endpoint = f"{self.GRAPH_API_BASE}/me/events"
+                endpoint = "/me/events"
             
             # Transform unified format to Microsoft format
             microsoft_event = self._transform_to_microsoft_format(event_data)
             
             # Create event
-            response = requests.post(
-                endpoint,
-                headers=self.headers,
-                json=microsoft_event
-            )
+            response = await self.graph.post(endpoint, json=microsoft_event)
             
             if response.status_code == 201:
                 created_event = response.json()
@@ -177,35 +331,32 @@ class MicrosoftCalendarService:
                 return self._transform_event(created_event)
             else:
                 logger.error(f"Failed to create event: {response.status_code} - {response.text}")
-                raise Exception(f"Failed to create Microsoft event: {response.text}")
+                raise GraphAPIError(response.status_code, f"Failed to create Microsoft event: {response.text}")
                 
         except Exception as e:
             logger.error(f"Error creating Microsoft event: {str(e)}")
             raise
     
-    def update_event(self, event_id: str, event_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def update_event(self, event_id: str, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Update an existing event in Microsoft Outlook calendar.
         
         Args:
             event_id (str): Microsoft event ID
-            event_data (Dict): Updated event data
+            event_data (Dict): Fields to change, in unified format; fields
+                not present are left unchanged
             
         Returns:
             Dict: Updated event data
         """
         try:
-            endpoint = f"{self.GRAPH_API_BASE}/me/events/{event_id}"
+            endpoint = f"/me/events/{event_id}"
             
-            # Transform unified format to Microsoft format
-            microsoft_event = self._transform_to_microsoft_format(event_data)
+            # Only the fields being changed; PATCH leaves the rest as they are
+            microsoft_event = self._transform_update_to_microsoft_format(event_data)
             
             # Update event
-            response = requests.patch(
-                endpoint,
-                headers=self.headers,
-                json=microsoft_event
-            )
+            response = await self.graph.patch(endpoint, json=microsoft_event)
             
             if response.status_code == 200:
                 updated_event = response.json()
@@ -213,13 +364,13 @@ class MicrosoftCalendarService:
                 return self._transform_event(updated_event)
             else:
                 logger.error(f"Failed to update event: {response.status_code} - {response.text}")
-                raise Exception(f"Failed to update Microsoft event: {response.text}")
+                raise GraphAPIError(response.status_code, f"Failed to update Microsoft event: {response.text}")
                 
         except Exception as e:
             logger.error(f"Error updating Microsoft event: {str(e)}")
             raise
     
-    def delete_event(self, event_id: str) -> bool:
+    async def delete_event(self, event_id: str) -> bool:
         """
         Delete an event from Microsoft Outlook calendar.
         
@@ -230,12 +381,9 @@ class MicrosoftCalendarService:
             bool: True if successful
         """
         try:
-            endpoint = f"{self.GRAPH_API_BASE}/me/events/{event_id}"
+            endpoint = f"/me/events/{event_id}"
             
-            response = requests.delete(
-                endpoint,
-                headers=self.headers
-            )
+            response = await self.graph.delete(endpoint)
             
             if response.status_code == 204:
                 logger.info(f"Deleted Microsoft event: {event_id}")
@@ -248,6 +396,150 @@ class MicrosoftCalendarService:
             logger.error(f"Error deleting Microsoft event: {str(e)}")
             return False
     
+    async def create_events(self, events_data: List[Dict[str, Any]],
+                            calendar_id: str = None) -> List[Dict[str, Any]]:
+        """
+        Create several events with $batch (20 per Graph round trip).
+        
+        Args:
+            events_data (List[Dict]): Events in unified format
+            calendar_id (str): Specific calendar ID (None for default calendar)
+            
+        Returns:
+            List[Dict]: Per event, in order: {'success': True, 'event': ...} or
+            {'success': False, 'status': int, 'error': str}
+        """
+        endpoint = f"/me/calendars/{calendar_id}/events" if calendar_id else "/me/events"
+        responses = await self.graph.batch([
+            {"method": "POST", "url": endpoint, "body": self._transform_to_microsoft_format(event_data)}
+            for event_data in events_data
+        ])
+        return [self._batch_event_result(response, 201) for response in responses]
+    
+    async def update_events(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Update several events with $batch.
+        
+        Args:
+            updates (List[Dict]): Items with the Microsoft event 'id' and the
+                fields to change in unified format; other fields are left unchanged
+            
+        Returns:
+            List[Dict]: Per update, in order, as for create_events
+        """
+        responses = await self.graph.batch([
+            {
+                "method": "PATCH",
+                "url": f"/me/events/{update['id']}",
+                "body": self._transform_update_to_microsoft_format(update)
+            }
+            for update in updates
+        ])
+        return [self._batch_event_result(response, 200) for response in responses]
+    
+    async def delete_events(self, event_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Delete several events with $batch.
+        
+        Args:
+            event_ids (List[str]): Microsoft event IDs
+            
+        Returns:
+            List[Dict]: Per ID, in order: {'success': bool} plus 'status' and
+            'error' on failure
+        """
+        responses = await self.graph.batch([
+            {"method": "DELETE", "url": f"/me/events/{event_id}"} for event_id in event_ids
+        ])
+        results = []
+        for response in responses:
+            if response.get("status") == 204:
+                results.append({"success": True})
+            else:
+                results.append(self._batch_error(response))
+        return results
+    
+    async def get_events_for_calendars(
+        self,
+        calendar_ids: List[str],
+        start_date: datetime,
+        end_date: datetime
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        List the calendar view of several calendars.
+        
+        First pages are fetched together with $batch; calendars with more
+        pages continue through their @odata.nextLink.
+        
+        Args:
+            calendar_ids (List[str]): Calendar IDs
+            start_date (datetime): Start date for events
+            end_date (datetime): End date for events
+            
+        Returns:
+            Dict: Per calendar ID, {'success': True, 'events': [...]} or
+            {'success': False, 'status': int, 'error': str}
+        """
+        query = urlencode({
+            "startDateTime": start_date.isoformat(),
+            "endDateTime": end_date.isoformat(),
+            "$select": EVENT_SELECT_FIELDS,
+            "$orderby": "start/dateTime"
+        })
+        responses = await self.graph.batch([
+            {
+                "method": "GET",
+                "url": f"/me/calendars/{calendar_id}/calendarView?{query}",
+                "headers": {"Prefer": f"odata.maxpagesize={EVENT_PAGE_SIZE}"}
+            }
+            for calendar_id in calendar_ids
+        ])
+        
+        results = {}
+        for calendar_id, response in zip(calendar_ids, responses):
+            if response.get("status") != 200:
+                results[calendar_id] = self._batch_error(response)
+                continue
+            
+            page = response.get("body") or {}
+            events = [self._transform_event(event) for event in page.get("value", [])]
+            next_link = page.get("@odata.nextLink")
+            try:
+                while next_link:
+                    next_response = await self.graph.get(
+                        next_link, headers={"Prefer": f"odata.maxpagesize={EVENT_PAGE_SIZE}"}
+                    )
+                    if next_response.status_code != 200:
+                        raise GraphAPIError(next_response.status_code, next_response.text)
+                    page = next_response.json()
+                    events.extend(self._transform_event(event) for event in page.get("value", []))
+                    next_link = page.get("@odata.nextLink")
+            except GraphAPIError as e:
+                results[calendar_id] = {"success": False, "status": e.status_code, "error": e.message}
+                continue
+            
+            for event in events:
+                event["microsoft_calendar_id"] = calendar_id
+            results[calendar_id] = {"success": True, "events": events}
+        
+        return results
+    
+    def _batch_event_result(self, response: Dict[str, Any], expected_status: int) -> Dict[str, Any]:
+        """
+        Map one $batch response carrying an event to a per-item result.
+        """
+        if response.get("status") == expected_status:
+            return {"success": True, "event": self._transform_event(response.get("body") or {})}
+        return self._batch_error(response)
+    
+    def _batch_error(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map a failed $batch response to a per-item error result.
+        """
+        body = response.get("body")
+        message = body.get("error", {}).get("message") if isinstance(body, dict) else body
+        return {"success": False, "status": response.get("status"), "error": message or "Unknown Graph error"}
+    
     def _transform_event(self, microsoft_event: Dict[str, Any]) -> Dict[str, Any]:
         """
         Transform Microsoft event format to unified format.
@@ -266,7 +558,7 @@ class MicrosoftCalendarService:
             "start_time": microsoft_event.get("start", {}).get("dateTime", ""),
             "end_time": microsoft_event.get("end", {}).get("dateTime", ""),
             "location": microsoft_event.get("location", {}).get("displayName", ""),
-            "calendar_source": "Microsoft",
+            "calendar_source": "microsoft",
             "microsoft_event_id": microsoft_event.get("id"),
             "microsoft_calendar_id": microsoft_event.get("calendarId"),
             "created_at": microsoft_event.get("createdDateTime", ""),
@@ -315,3 +607,38 @@ class MicrosoftCalendarService:
             microsoft_event["attendees"] = event_data.get("attendees")
         
         return microsoft_event
+    
+    def _transform_update_to_microsoft_format(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Transform a partial update in unified format to a Microsoft PATCH body.
+        
+        Unlike _transform_to_microsoft_format, no defaults are filled in:
+        only the fields present in ``event_data`` are sent.
+        
+        Args:
+            event_data (Dict): Fields to change in unified format
+            
+        Returns:
+            Dict: PATCH body in Microsoft format
+        """
+        microsoft_event = {}
+        
+        if "title" in event_data:
+            microsoft_event["subject"] = event_data["title"]
+        if "description" in event_data:
+            microsoft_event["body"] = {
+                "contentType": "HTML",
+                "content": event_data["description"] or ""
+            }
+        if "start_time" in event_data:
+            microsoft_event["start"] = {"dateTime": event_data["start_time"], "timeZone": "UTC"}
+        if "end_time" in event_data:
+            microsoft_event["end"] = {"dateTime": event_data["end_time"], "timeZone": "UTC"}
+        if "location" in event_data:
+            microsoft_event["location"] = {"displayName": event_data["location"] or ""}
+        if "attendees" in event_data:
+            microsoft_event["attendees"] = event_data["attendees"] or []
+        if "is_all_day" in event_data:
+            microsoft_event["isAllDay"] = bool(event_data["is_all_day"])
+        
+        return microsoft_event
@@ -4,28 +4,67 @@ Microsoft Outlook Calendar Routes
 FastAPI routes for Microsoft Calendar integration.
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Request
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Request, BackgroundTasks
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
 from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
 import logging
+import os
 import secrets
+from pymongo import UpdateOne, DeleteOne, DeleteMany
+from pymongo.errors import BulkWriteError
 
 from dependencies import db, get_current_user
 from microsoft_auth_service import MicrosoftAuthService
-from microsoft_calendar_service import MicrosoftCalendarService
+from microsoft_calendar_service import MicrosoftCalendarService, DeltaLinkExpiredError
+from graph_client import GraphAPIError
+from oauth_state_store import get_oauth_state_store
+from provider_calls import set_provider_user
+from providers import env_flag_enabled
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
+# Window mirrored by the delta sync. A calendarView deltaLink stays bound to
+# the window it was created for, so a new round starts once fewer than
+# MICROSOFT_SYNC_MIN_FUTURE_DAYS of it are left.
+MICROSOFT_SYNC_PAST_DAYS = 30
+MICROSOFT_SYNC_FUTURE_DAYS = 365
+MICROSOFT_SYNC_MIN_FUTURE_DAYS = 30
+
+# Change notifications. Graph allows at most 10080 minutes for Outlook
+# events; subscriptions are renewed once less than a day is left. No
+# subscriptions are created until MICROSOFT_NOTIFICATION_URL is set.
+MICROSOFT_NOTIFICATION_URL = os.getenv("MICROSOFT_NOTIFICATION_URL", "")
+MICROSOFT_SUBSCRIPTION_TTL_MINUTES = 4200
+MICROSOFT_SUBSCRIPTION_RENEW_BEFORE = timedelta(hours=24)
+# With subscriptions switched off, connected users are delta-synced on this
+# interval instead
+MICROSOFT_SUBSCRIPTIONS_ENABLED = env_flag_enabled("MICROSOFT_SUBSCRIPTIONS_ENABLED")
+MICROSOFT_DELTA_POLL_INTERVAL_SECONDS = int(os.getenv("MICROSOFT_DELTA_POLL_INTERVAL_SECONDS", "900"))
+
+# Tokens are treated as expired this long before their actual expiry; the
+# refresher runs every MICROSOFT_TOKEN_REFRESH_INTERVAL_SECONDS and renews
+# anything that would otherwise expire before its next run.
+MICROSOFT_TOKEN_EXPIRY_SKEW = timedelta(minutes=5)
+MICROSOFT_TOKEN_REFRESH_INTERVAL_SECONDS = 300
+
+# Users with a delta sync queued by a notification that has not started yet
+_pending_delta_syncs = set()
+
 # Create router
 microsoft_router = APIRouter(prefix="/microsoft")
 
 # Initialize service
 microsoft_auth = MicrosoftAuthService()
 
-# In-memory state store for OAuth (use Redis in production)
-oauth_states = {}
+# OAuth state is shared by all workers and consumed once on callback
+oauth_states = get_oauth_state_store()
 
 # ───────────────────────────────────────────────
 # Authentication Routes
@@ -40,7 +79,7 @@ async def microsoft_login(request: Request):
     try:
         # Generate state for CSRF protection
         state = secrets.token_urlsafe(32)
-        oauth_states[state] = datetime.utcnow()
+        await oauth_states.put(state)
         
         # Get authorization URL
         auth_url = microsoft_auth.get_auth_url(state=state)
@@ -53,7 +92,7 @@ async def microsoft_login(request: Request):
 
 
 @microsoft_router.get("/auth/callback")
-async def microsoft_callback(request: Request):
+async def microsoft_callback(request: Request, background_tasks: BackgroundTasks):
     """
     Handle Microsoft OAuth callback.
     Exchange authorization code for tokens and save to database.
@@ -73,12 +112,12 @@ async def microsoft_callback(request: Request):
         if not code:
             raise HTTPException(status_code=400, detail="Authorization code not provided")
         
-        # Verify state
-        if state not in oauth_states:
+        # Verify state (consuming it, so a callback cannot be replayed)
+        if await oauth_states.pop(state) is None:
             raise HTTPException(status_code=400, detail="Invalid state parameter")
         
         # Exchange code for tokens
-        token_data = microsoft_auth.handle_callback(code=code, state=state)
+        token_data = await asyncio.to_thread(microsoft_auth.handle_callback, code=code, state=state)
         
         # Store tokens in database
         user_data = token_data.get("user_data", {})
@@ -98,19 +137,22 @@ async def microsoft_callback(request: Request):
                         "microsoft_refresh_token": token_data.get("refresh_token"),
                         "microsoft_access_token": token_data.get("access_token"),
                         "microsoft_token_expires": token_data.get("expires_at"),
+                        "microsoft_home_account_id": token_data.get("home_account_id"),
                         "microsoft_calendar_connected": True,
                         "microsoft_connected_at": datetime.utcnow()
                     }
                 }
             )
+            if token_data.get("home_account_id"):
+                await _save_microsoft_token_cache(str(user["_id"]), token_data["home_account_id"])
             logger.info(f"Linked Microsoft calendar to existing user: {user_email}")
+            
+            # Mirror the calendar and subscribe to changes for real-time sync
+            background_tasks.add_task(ensure_microsoft_subscription, str(user["_id"]))
         else:
             # Create new user (should not happen in normal flow, but handle it)
             logger.warning(f"Microsoft user not found: {user_email}")
         
-        # Clean up state
-        del oauth_states[state]
-        
         # Return success response
         return JSONResponse({
             "status": "success",
@@ -134,6 +176,11 @@ async def microsoft_disconnect(current_user: dict = Depends(get_current_user)):
     try:
         user_id = str(current_user["_id"])
         
+        # Stop change notifications while the token is still valid
+        await _delete_microsoft_subscriptions(user_id, current_user.get("microsoft_access_token"))
+        await db.microsoft_sync_state.delete_one({"user_id": user_id})
+        await db.microsoft_token_cache.delete_many({"user_id": user_id})
+        
         await db.users.update_one(
             {"_id": ObjectId(user_id)},
             {
@@ -141,6 +188,7 @@ async def microsoft_disconnect(current_user: dict = Depends(get_current_user)):
                     "microsoft_refresh_token": "",
                     "microsoft_access_token": "",
                     "microsoft_token_expires": "",
+                    "microsoft_home_account_id": "",
                     "microsoft_calendar_connected": "",
                     "microsoft_connected_at": ""
                 }
@@ -164,10 +212,21 @@ async def microsoft_disconnect(current_user: dict = Depends(get_current_user)):
 # ───────────────────────────────────────────────
 
 @microsoft_router.get("/calendar/events")
-async def get_microsoft_events(current_user: dict = Depends(get_current_user)):
+async def get_microsoft_events(
+    stream: bool = False,
+    calendar_ids: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
     """
     Fetch Microsoft Outlook calendar events.
     Returns events in unified format.
+    
+    With ``stream=true`` live results are sent as newline-delimited JSON page
+    by page instead of after the whole calendar view has been read.
+    
+    ``calendar_ids`` (comma-separated) lists those calendars instead of the
+    default one, reading them together through Graph $batch. Calendars that
+    fail are reported under ``errors`` without failing the others.
     """
     try:
         user_id = str(current_user["_id"])
@@ -176,46 +235,65 @@ async def get_microsoft_events(current_user: dict = Depends(get_current_user)):
         if not current_user.get("microsoft_calendar_connected"):
             raise HTTPException(status_code=400, detail="Microsoft Calendar not connected")
         
+        # Get events for next 30 days
+        start_date = datetime.utcnow()
+        end_date = datetime.utcnow() + timedelta(days=30)
+        
+        requested_calendars = [c.strip() for c in (calendar_ids or "").split(",") if c.strip()]
+        
+        # Serve from the mirror while a subscription keeps it current
+        if not requested_calendars and await has_active_microsoft_subscription(user_id):
+            events = await get_mirrored_microsoft_events(user_id, start_date, end_date)
+            return JSONResponse(jsonable_encoder({
+                "status": "success",
+                "events": events,
+                "count": len(events)
+            }))
+        
         # Get access token
-        access_token = current_user.get("microsoft_access_token")
-        if not access_token:
+        if not current_user.get("microsoft_access_token"):
             raise HTTPException(status_code=400, detail="Microsoft access token not found")
         
-        # Check if token is expired
-        token_expires = current_user.get("microsoft_token_expires")
-        if token_expires and datetime.utcnow() > token_expires:
-            # Refresh token
-            try:
-                refresh_token = current_user.get("microsoft_refresh_token")
-                if refresh_token:
-                    new_token_data = microsoft_auth.refresh_token(refresh_token)
-                    access_token = new_token_data.get("access_token")
-                    
-                    # Update token in database
-                    await db.users.update_one(
-                        {"_id": ObjectId(user_id)},
-                        {
-                            "$set": {
-                                "microsoft_access_token": access_token,
-                                "microsoft_token_expires": new_token_data.get("expires_at")
-                            }
-                        }
-                    )
-            except Exception as e:
-                logger.error(f"Token refresh failed: {str(e)}")
-                raise HTTPException(status_code=401, detail="Failed to refresh Microsoft token")
+        access_token = await get_valid_microsoft_access_token(current_user)
+        if not access_token:
+            raise HTTPException(status_code=401, detail="Failed to refresh Microsoft token")
         
         # Initialize calendar service
         calendar_service = MicrosoftCalendarService(access_token)
         
-        # Get events for next 30 days
-        start_date = datetime.utcnow()
-        end_date = datetime.utcnow() + timedelta(days=30)
+        if requested_calendars:
+            results = await calendar_service.get_events_for_calendars(
+                requested_calendars, start_date, end_date
+            )
+            events = []
+            errors = {}
+            for calendar_id, result in results.items():
+                if result["success"]:
+                    events.extend(result["events"])
+                else:
+                    errors[calendar_id] = {"status": result["status"], "error": result["error"]}
+            
+            return JSONResponse({
+                "status": "success",
+                "events": events,
+                "count": len(events),
+                "errors": errors
+            })
         
-        events = calendar_service.get_events(
+        if stream:
+            async def event_lines():
+                try:
+                    async for page in calendar_service.iter_event_pages(start_date=start_date, end_date=end_date):
+                        for event in page:
+                            yield json.dumps(event, default=str) + "\n"
+                except Exception as e:
+                    logger.error(f"Error streaming Microsoft events: {str(e)}")
+            
+            return StreamingResponse(event_lines(), media_type="application/x-ndjson")
+        
+        events = await calendar_service.get_events(
             start_date=start_date,
-            end_date=end_date,
-            max_results=100
+            end_date=end_date
         )
         
         return JSONResponse({
@@ -244,7 +322,7 @@ async def create_microsoft_event(event_data: dict, current_user: dict = Depends(
             raise HTTPException(status_code=400, detail="Microsoft Calendar not connected")
         
         # Get access token
-        access_token = current_user.get("microsoft_access_token")
+        access_token = await get_valid_microsoft_access_token(current_user)
         if not access_token:
             raise HTTPException(status_code=400, detail="Microsoft access token not found")
         
@@ -252,7 +330,7 @@ async def create_microsoft_event(event_data: dict, current_user: dict = Depends(
         calendar_service = MicrosoftCalendarService(access_token)
         
         # Create event
-        created_event = calendar_service.create_event(event_data)
+        created_event = await calendar_service.create_event(event_data)
         
         logger.info(f"Created Microsoft event: {created_event.get('title')}")
         
@@ -282,7 +360,7 @@ async def update_microsoft_event(event_id: str, event_data: dict, current_user:
             raise HTTPException(status_code=400, detail="Microsoft Calendar not connected")
         
         # Get access token
-        access_token = current_user.get("microsoft_access_token")
+        access_token = await get_valid_microsoft_access_token(current_user)
         if not access_token:
             raise HTTPException(status_code=400, detail="Microsoft access token not found")
         
@@ -290,7 +368,7 @@ async def update_microsoft_event(event_id: str, event_data: dict, current_user:
         calendar_service = MicrosoftCalendarService(access_token)
         
         # Update event
-        updated_event = calendar_service.update_event(event_id, event_data)
+        updated_event = await calendar_service.update_event(event_id, event_data)
         
         logger.info(f"Updated Microsoft event: {updated_event.get('title')}")
         
@@ -320,7 +398,7 @@ async def delete_microsoft_event(event_id: str, current_user: dict = Depends(get
             raise HTTPException(status_code=400, detail="Microsoft Calendar not connected")
         
         # Get access token
-        access_token = current_user.get("microsoft_access_token")
+        access_token = await get_valid_microsoft_access_token(current_user)
         if not access_token:
             raise HTTPException(status_code=400, detail="Microsoft access token not found")
         
@@ -328,7 +406,7 @@ async def delete_microsoft_event(event_id: str, current_user: dict = Depends(get
         calendar_service = MicrosoftCalendarService(access_token)
         
         # Delete event
-        success = calendar_service.delete_event(event_id)
+        success = await calendar_service.delete_event(event_id)
         
         if success:
             logger.info(f"Deleted Microsoft event: {event_id}")
@@ -344,3 +422,568 @@ async def delete_microsoft_event(event_id: str, current_user: dict = Depends(get
     except Exception as e:
         logger.error(f"Error deleting Microsoft event: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to delete event: {str(e)}")
+
+
+@microsoft_router.post("/calendar/events/batch")
+async def batch_microsoft_events(batch_data: dict, current_user: dict = Depends(get_current_user)):
+    """
+    Create, update and delete several Outlook events in one request.
+    
+    Body: ``{"create": [event, ...], "update": [{"id": ..., **fields}, ...],
+    "delete": [event_id, ...]}``. Operations are sent through Graph $batch
+    (20 per round trip) and each gets its own result, in request order.
+    """
+    try:
+        # Check if Microsoft is connected
+        if not current_user.get("microsoft_calendar_connected"):
+            raise HTTPException(status_code=400, detail="Microsoft Calendar not connected")
+        
+        creates = batch_data.get("create") or []
+        updates = batch_data.get("update") or []
+        deletes = batch_data.get("delete") or []
+        if any(not update.get("id") for update in updates):
+            raise HTTPException(status_code=400, detail="Every update needs an event id")
+        
+        # Get access token
+        access_token = await get_valid_microsoft_access_token(current_user)
+        if not access_token:
+            raise HTTPException(status_code=400, detail="Microsoft access token not found")
+        
+        # Initialize calendar service
+        calendar_service = MicrosoftCalendarService(access_token)
+        
+        created = await calendar_service.create_events(creates) if creates else []
+        updated = await calendar_service.update_events(updates) if updates else []
+        deleted = await calendar_service.delete_events(deletes) if deletes else []
+        
+        results = created + updated + deleted
+        failed = sum(1 for result in results if not result["success"])
+        logger.info(f"Microsoft batch: {len(results)} operations, {failed} failed")
+        
+        return JSONResponse({
+            "status": "success" if not failed else "partial",
+            "create": created,
+            "update": updated,
+            "delete": [{"id": event_id, **result} for event_id, result in zip(deletes, deleted)]
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error running Microsoft event batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to run batch: {str(e)}")
+
+
+# ───────────────────────────────────────────────
+# Delta Sync
+# ───────────────────────────────────────────────
+
+@microsoft_router.post("/calendar/sync")
+async def sync_microsoft_calendar_events(current_user: dict = Depends(get_current_user)):
+    """
+    Sync Outlook events into the local events mirror.
+    """
+    try:
+        if not current_user.get("microsoft_calendar_connected"):
+            raise HTTPException(status_code=400, detail="Microsoft Calendar not connected")
+        
+        counts = await perform_microsoft_delta_sync(str(current_user["_id"]))
+        if counts is None:
+            raise HTTPException(status_code=500, detail="Microsoft sync failed")
+        
+        return JSONResponse({
+            "status": "success",
+            "message": "Microsoft Calendar synced successfully",
+            **counts
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error syncing Microsoft events: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to sync events: {str(e)}")
+
+
+async def get_valid_microsoft_access_token(user: dict) -> Optional[str]:
+    """
+    Return a usable Microsoft access token for a user.
+    
+    The background refresher renews tokens before they expire, so this
+    normally returns the stored token without any token exchange; it only
+    refreshes inline when the refresher has not got to the user yet.
+    
+    Args:
+        user (dict): User document
+        
+    Returns:
+        Optional[str]: Access token, None if it expired and could not be refreshed
+    """
+    # Graph calls made with this token count against the user's quota
+    set_provider_user(user.get("_id"))
+    access_token = user.get("microsoft_access_token")
+    token_expires = user.get("microsoft_token_expires")
+    if access_token and (not token_expires or token_expires - MICROSOFT_TOKEN_EXPIRY_SKEW > datetime.utcnow()):
+        return access_token
+    
+    try:
+        token_data = await _refresh_microsoft_tokens(user)
+        return token_data.get("access_token")
+    except Exception as e:
+        logger.error(f"Microsoft token refresh failed for user {user.get('_id')}: {str(e)}")
+        return None
+
+
+async def _refresh_microsoft_tokens(user: dict, force_refresh: bool = False) -> Dict[str, Any]:
+    """
+    Refresh a user's tokens through the shared MSAL app and store them.
+    
+    Accounts signed in since the shared token cache was introduced refresh
+    silently from their cache slice (loaded from the database on first use
+    in this process); older connections fall back to the stored refresh token.
+    """
+    user_id = str(user["_id"])
+    set_provider_user(user_id)
+    home_account_id = user.get("microsoft_home_account_id")
+    
+    token_data = None
+    if home_account_id:
+        if not microsoft_auth.has_account(home_account_id):
+            cached = await db.microsoft_token_cache.find_one({"home_account_id": home_account_id})
+            if cached:
+                microsoft_auth.import_account_cache(cached["cache"])
+        token_data = await asyncio.to_thread(
+            microsoft_auth.acquire_token_for_account, home_account_id, force_refresh
+        )
+    
+    if token_data is None:
+        refresh_token = user.get("microsoft_refresh_token")
+        if not refresh_token:
+            raise Exception("No Microsoft refresh token stored")
+        token_data = await asyncio.to_thread(microsoft_auth.refresh_token, refresh_token)
+        home_account_id = token_data.get("home_account_id") or home_account_id
+    
+    update = {
+        "microsoft_access_token": token_data.get("access_token"),
+        "microsoft_token_expires": token_data.get("expires_at")
+    }
+    if token_data.get("refresh_token"):
+        update["microsoft_refresh_token"] = token_data["refresh_token"]
+    if home_account_id:
+        update["microsoft_home_account_id"] = home_account_id
+    await db.users.update_one({"_id": user["_id"]}, {"$set": update})
+    
+    if home_account_id:
+        await _save_microsoft_token_cache(user_id, home_account_id)
+    return token_data
+
+
+async def _save_microsoft_token_cache(user_id: str, home_account_id: str):
+    """
+    Persist an account's slice of the shared MSAL token cache.
+    """
+    await db.microsoft_token_cache.update_one(
+        {"home_account_id": home_account_id},
+        {"$set": {
+            "user_id": user_id,
+            "cache": microsoft_auth.export_account_cache(home_account_id),
+            "updated_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+
+async def refresh_microsoft_tokens_periodically():
+    """
+    Background task renewing Microsoft tokens shortly before they expire.
+    """
+    while True:
+        try:
+            threshold = datetime.utcnow() + MICROSOFT_TOKEN_EXPIRY_SKEW + timedelta(
+                seconds=MICROSOFT_TOKEN_REFRESH_INTERVAL_SECONDS
+            )
+            cursor = db.users.find({
+                "microsoft_calendar_connected": True,
+                "microsoft_token_expires": {"$lte": threshold}
+            })
+            for user in await cursor.to_list(length=1000):
+                try:
+                    await _refresh_microsoft_tokens(user, force_refresh=True)
+                except Exception as e:
+                    logger.error(f"Proactive Microsoft token refresh failed for user {user['_id']}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Microsoft token refresh loop error: {str(e)}")
+        await asyncio.sleep(MICROSOFT_TOKEN_REFRESH_INTERVAL_SECONDS)
+
+
+@traced("job microsoft.delta_sync")
+async def perform_microsoft_delta_sync(user_id: str) -> Optional[Dict[str, int]]:
+    """
+    Mirror a user's Outlook events into db.events with Graph delta queries.
+    
+    Follows the Google incremental sync: the stored deltaLink returns only
+    changes; without one (first sync, expired link or exhausted window) a
+    full round over the sync window runs and sweeps events it no longer sees.
+    
+    Args:
+        user_id (str): Internal user ID
+        
+    Returns:
+        Optional[Dict]: inserted/modified/deleted counts, None on failure
+    """
+    try:
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        if not user or not user.get("microsoft_calendar_connected"):
+            return None
+        
+        service = MicrosoftCalendarService(await get_valid_microsoft_access_token(user))
+        state = await db.microsoft_sync_state.find_one({"user_id": user_id})
+        
+        now = datetime.utcnow()
+        delta_link = None
+        if state and state.get("delta_link") and state.get("window_end") \
+                and state["window_end"] - now > timedelta(days=MICROSOFT_SYNC_MIN_FUTURE_DAYS):
+            delta_link = state["delta_link"]
+        
+        window_start = now - timedelta(days=MICROSOFT_SYNC_PAST_DAYS)
+        window_end = now + timedelta(days=MICROSOFT_SYNC_FUTURE_DAYS)
+        
+        try:
+            delta = await service.get_event_delta(
+                delta_link=delta_link, start_date=window_start, end_date=window_end
+            )
+        except DeltaLinkExpiredError:
+            logger.warning(f"Microsoft deltaLink expired for user {user_id}. Falling back to full sync.")
+            delta_link = None
+            delta = await service.get_event_delta(start_date=window_start, end_date=window_end)
+        
+        full_sync = delta_link is None
+        operations: List[Any] = [
+            _microsoft_event_upsert_operation(user_id, event) for event in delta["changed"]
+        ]
+        operations.extend(
+            DeleteOne({"user_id": user_id, "calendar_source": "microsoft", "microsoft_event_id": event_id})
+            for event_id in delta["deleted"]
+        )
+        if full_sync:
+            # A full round lists everything in the window; drop what it did not return
+            operations.append(DeleteMany({
+                "user_id": user_id,
+                "calendar_source": "microsoft",
+                "microsoft_event_id": {"$nin": [event.get("id") for event in delta["changed"]]}
+            }))
+        
+        counts = await _apply_microsoft_event_operations(operations) if operations else {
+            "inserted": 0, "modified": 0, "deleted": 0
+        }
+        
+        state_update: Dict[str, Any] = {"delta_link": delta["delta_link"], "updated_at": datetime.utcnow()}
+        if full_sync:
+            state_update.update({"window_start": window_start, "window_end": window_end})
+        await db.microsoft_sync_state.update_one(
+            {"user_id": user_id},
+            {"$set": state_update},
+            upsert=True
+        )
+        
+        logger.info(f"Microsoft {'full' if full_sync else 'delta'} sync for user {user_id}: {counts}")
+        return counts
+        
+    except Exception as e:
+        logger.error(f"Microsoft delta sync failed for user {user_id}: {str(e)}")
+        return None
+
+
+def _microsoft_event_upsert_operation(user_id: str, event: Dict[str, Any]) -> UpdateOne:
+    """
+    Build the idempotent upsert for a synced Outlook event, keyed on its Graph ID.
+    """
+    now = datetime.utcnow()
+    update_doc = {
+        **event,
+        "calendar_source": "microsoft",
+        "user_id": user_id,
+        "microsoft_event_id": event.get("id"),
+        "synced_at": now
+    }
+    update_doc.pop("created_at", None)
+    
+    return UpdateOne(
+        {"user_id": user_id, "calendar_source": "microsoft", "microsoft_event_id": event.get("id")},
+        {"$set": update_doc, "$setOnInsert": {"created_at": event.get("created_at") or now}},
+        upsert=True
+    )
+
+
+async def _apply_microsoft_event_operations(operations: List[Any]) -> Dict[str, int]:
+    """
+    Write sync operations as one unordered bulk request and return the counts.
+    """
+    try:
+        result = await db.events.bulk_write(operations, ordered=False)
+        return {
+            "inserted": result.upserted_count,
+            "modified": result.modified_count,
+            "deleted": result.deleted_count
+        }
+    except BulkWriteError as e:
+        details = e.details or {}
+        logger.warning(f"Microsoft sync bulk write had {len(details.get('writeErrors', []))} errors")
+        return {
+            "inserted": details.get("nUpserted", 0),
+            "modified": details.get("nModified", 0),
+            "deleted": details.get("nRemoved", 0)
+        }
+
+
+async def ensure_microsoft_event_indexes():
+    """
+    Create the indexes the Microsoft delta sync relies on.
+    """
+    await db.events.create_index(
+        [("user_id", 1), ("microsoft_event_id", 1)],
+        unique=True,
+        partialFilterExpression={"calendar_source": "microsoft", "microsoft_event_id": {"$exists": True}}
+    )
+    await db.microsoft_sync_state.create_index("user_id", unique=True)
+    await db.microsoft_subscriptions.create_index("subscription_id", unique=True)
+    await db.microsoft_subscriptions.create_index("user_id")
+    await db.microsoft_token_cache.create_index("home_account_id", unique=True)
+    await db.microsoft_token_cache.create_index("user_id")
+
+
+# ───────────────────────────────────────────────
+# Change Notifications
+# ───────────────────────────────────────────────
+
+@microsoft_router.post("/notifications")
+async def microsoft_notifications(request: Request, background_tasks: BackgroundTasks):
+    """
+    Receive Graph change notifications. Graph expects a 2xx within a few seconds.
+    
+    Subscription creation first posts a validationToken, which must be echoed
+    back as text/plain.
+    """
+    validation_token = request.query_params.get("validationToken")
+    if validation_token:
+        logger.info("Answering Microsoft subscription validation request")
+        return PlainTextResponse(validation_token)
+    
+    try:
+        payload = await request.json()
+    except Exception:
+        logger.warning("Microsoft notification with invalid body")
+        return JSONResponse({"status": "ignored", "reason": "invalid_body"}, status_code=202)
+    
+    queued = set()
+    for notification in payload.get("value", []):
+        subscription = await db.microsoft_subscriptions.find_one({
+            "subscription_id": notification.get("subscriptionId")
+        })
+        if not subscription:
+            logger.warning(f"Microsoft notification for unknown subscription {notification.get('subscriptionId')}")
+            continue
+        if notification.get("clientState") != subscription.get("client_state"):
+            logger.warning(f"Microsoft notification clientState mismatch for {subscription['subscription_id']}")
+            continue
+        
+        user_id = subscription["user_id"]
+        lifecycle_event = notification.get("lifecycleEvent")
+        if lifecycle_event == "reauthorizationRequired":
+            background_tasks.add_task(_renew_microsoft_subscription, subscription)
+        elif lifecycle_event == "subscriptionRemoved":
+            await db.microsoft_subscriptions.delete_one({"_id": subscription["_id"]})
+            background_tasks.add_task(ensure_microsoft_subscription, user_id)
+            continue
+        
+        # One delta sync covers every change in the batch (and "missed" events)
+        if user_id not in queued and user_id not in _pending_delta_syncs:
+            queued.add(user_id)
+            _pending_delta_syncs.add(user_id)
+            background_tasks.add_task(_run_queued_delta_sync, user_id)
+    
+    logger.info(f"Microsoft notifications queued delta sync for {len(queued)} user(s)")
+    return JSONResponse({"status": "accepted"}, status_code=202)
+
+
+async def _run_queued_delta_sync(user_id: str):
+    _pending_delta_syncs.discard(user_id)
+    await perform_microsoft_delta_sync(user_id)
+
+
+async def has_active_microsoft_subscription(user_id: str) -> bool:
+    """
+    Whether the user's events mirror is kept current by a live subscription.
+    """
+    subscription = await db.microsoft_subscriptions.find_one({
+        "user_id": user_id,
+        "expiration": {"$gt": datetime.utcnow()}
+    })
+    return subscription is not None
+
+
+async def get_mirrored_microsoft_events(
+    user_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Read Outlook events for a window from the local mirror.
+    
+    Returns:
+        List[Dict]: Events in the same unified format as the live Graph fetch
+    """
+    # Graph dateTime values are UTC without offset, so ISO strings compare in order
+    cursor = db.events.find(
+        {
+            "user_id": user_id,
+            "calendar_source": "microsoft",
+            "end_time": {"$gte": start_date.isoformat()},
+            "start_time": {"$lte": end_date.isoformat()}
+        },
+        {"_id": 0, "user_id": 0, "synced_at": 0}
+    ).sort("start_time", 1)
+    return await cursor.to_list(length=limit)
+
+
+@traced("job microsoft.ensure_subscription")
+async def ensure_microsoft_subscription(user_id: str):
+    """
+    Mirror the user's Outlook events and make sure a change subscription
+    exists (unless MICROSOFT_SUBSCRIPTIONS_ENABLED is off, in which case the
+    mirror is kept current by poll_microsoft_delta_sync_periodically).
+    """
+    try:
+        await perform_microsoft_delta_sync(user_id)
+        
+        if not MICROSOFT_SUBSCRIPTIONS_ENABLED:
+            return
+        
+        if not MICROSOFT_NOTIFICATION_URL:
+            logger.warning(
+                f"MICROSOFT_NOTIFICATION_URL is not set; not creating a Microsoft subscription for user {user_id}"
+            )
+            return
+        
+        if await has_active_microsoft_subscription(user_id):
+            logger.info(f"User {user_id} already has a Microsoft subscription, skipping duplicate setup")
+            return
+        
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        if not user or not user.get("microsoft_calendar_connected"):
+            return
+        
+        service = MicrosoftCalendarService(await get_valid_microsoft_access_token(user))
+        client_state = secrets.token_urlsafe(32)
+        subscription = await service.create_subscription(
+            notification_url=MICROSOFT_NOTIFICATION_URL,
+            client_state=client_state,
+            expiration=datetime.utcnow() + timedelta(minutes=MICROSOFT_SUBSCRIPTION_TTL_MINUTES)
+        )
+        
+        await db.microsoft_subscriptions.insert_one({
+            "user_id": user_id,
+            "subscription_id": subscription.get("id"),
+            "client_state": client_state,
+            "resource": subscription.get("resource"),
+            "notification_url": MICROSOFT_NOTIFICATION_URL,
+            "expiration": _parse_graph_datetime(subscription.get("expirationDateTime")),
+            "created_at": datetime.utcnow()
+        })
+        logger.info(
+            f"✅ Auto-setup Microsoft subscription for user {user_id} | "
+            f"subscription_id={subscription.get('id')} webhook={MICROSOFT_NOTIFICATION_URL}"
+        )
+        
+    except Exception as e:
+        logger.error(f"Failed to set up Microsoft subscription for user {user_id}: {str(e)}")
+
+
+@traced("job microsoft.renew_subscription")
+async def _renew_microsoft_subscription(subscription_doc: dict):
+    """
+    Extend a subscription, recreating it if Graph no longer knows it.
+    """
+    user_id = subscription_doc.get("user_id")
+    try:
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        if not user or not user.get("microsoft_calendar_connected"):
+            await db.microsoft_subscriptions.delete_one({"_id": subscription_doc["_id"]})
+            return
+        
+        service = MicrosoftCalendarService(await get_valid_microsoft_access_token(user))
+        try:
+            subscription = await service.renew_subscription(
+                subscription_doc["subscription_id"],
+                datetime.utcnow() + timedelta(minutes=MICROSOFT_SUBSCRIPTION_TTL_MINUTES)
+            )
+        except GraphAPIError as e:
+            if e.status_code != 404:
+                raise
+            logger.warning(f"Microsoft subscription for user {user_id} is gone, recreating")
+            await db.microsoft_subscriptions.delete_one({"_id": subscription_doc["_id"]})
+            await ensure_microsoft_subscription(user_id)
+            return
+        
+        await db.microsoft_subscriptions.update_one(
+            {"_id": subscription_doc["_id"]},
+            {"$set": {
+                "expiration": _parse_graph_datetime(subscription.get("expirationDateTime")),
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        logger.info(f"🔄 Renewed Microsoft subscription for user {user_id}")
+        
+    except Exception as e:
+        logger.error(f"Failed to renew Microsoft subscription for user {user_id}: {str(e)}")
+
+
+async def renew_microsoft_subscriptions_periodically():
+    """
+    Background task to renew subscriptions expiring within 24 hours.
+    """
+    while True:
+        try:
+            threshold = datetime.utcnow() + MICROSOFT_SUBSCRIPTION_RENEW_BEFORE
+            cursor = db.microsoft_subscriptions.find({"expiration": {"$lte": threshold}})
+            for subscription_doc in await cursor.to_list(length=1000):
+                await _renew_microsoft_subscription(subscription_doc)
+        except Exception as e:
+            logger.error(f"Microsoft subscription renewal loop error: {str(e)}")
+        # Check hourly
+        await asyncio.sleep(3600)
+
+
+async def poll_microsoft_delta_sync_periodically():
+    """
+    Background task delta-syncing every connected user, used instead of
+    change notifications when MICROSOFT_SUBSCRIPTIONS_ENABLED is off.
+    """
+    while True:
+        try:
+            cursor = db.users.find({"microsoft_calendar_connected": True}, {"_id": 1})
+            async for user in cursor:
+                await perform_microsoft_delta_sync(str(user["_id"]))
+        except Exception as e:
+            logger.error(f"Microsoft delta poll loop error: {str(e)}")
+        await asyncio.sleep(MICROSOFT_DELTA_POLL_INTERVAL_SECONDS)
+
+
+async def _delete_microsoft_subscriptions(user_id: str, access_token: Optional[str]):
+    """
+    Delete a user's subscriptions from Graph (best effort) and from the database.
+    """
+    async for subscription_doc in db.microsoft_subscriptions.find({"user_id": user_id}):
+        if access_token:
+            await MicrosoftCalendarService(access_token).delete_subscription(subscription_doc["subscription_id"])
+    await db.microsoft_subscriptions.delete_many({"user_id": user_id})
+
+
+def _parse_graph_datetime(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a Graph expirationDateTime (e.g. 2024-01-01T10:00:00.0000000Z) as naive UTC.
+    """
+    if not value:
+        return None
+    # Graph uses 7 fractional digits, which fromisoformat rejects before Python 3.11
+    return datetime.fromisoformat(value.rstrip("Z")[:26])
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Migration: strip raw iCalendar payloads from event documents.
+
+Older Apple syncs stored the full VCALENDAR text of every event in
+``db.events.raw_data``. This script removes that field in batches. With
+``--archive`` the payloads are first copied into ``apple_event_payloads``
+(zlib-compressed) so they remain available through
+``GET /api/apple/calendar/events/{event_id}/raw``.
+
+With ``--remove-legacy-duplicates`` it then deletes the duplicate Apple
+documents left by the old insert-only sync; the next sync restores a
+single copy of each event. Combine it with ``--archive`` to keep their
+payloads.
+
+Usage: python migrate_strip_raw_ical.py [--archive] [--remove-legacy-duplicates] [--batch-size N]
+"""
+
+import argparse
+import asyncio
+import zlib
+from datetime import datetime
+
+from bson import Binary
+from pymongo import UpdateOne
+
+from apple_routes import LEGACY_APPLE_DUPLICATE_FILTER
+from dependencies import db
+
+
+async def strip_raw_ical(archive: bool, batch_size: int) -> int:
+    """Remove raw_data from event documents, optionally archiving it first."""
+    stripped = 0
+    cursor = db.events.find(
+        {"raw_data": {"$exists": True}},
+        {"raw_data": 1, "user_id": 1, "apple_event_id": 1, "id": 1, "apple_href": 1, "apple_etag": 1},
+    )
+
+    batch = []
+    async for event in cursor:
+        batch.append(event)
+        if len(batch) >= batch_size:
+            stripped += await _process_batch(batch, archive)
+            batch = []
+    if batch:
+        stripped += await _process_batch(batch, archive)
+
+    return stripped
+
+
+async def _process_batch(batch: list, archive: bool) -> int:
+    if archive:
+        payload_ops = []
+        for event in batch:
+            event_id = event.get("apple_event_id") or event.get("id")
+            if not event_id or not event.get("raw_data"):
+                continue
+            payload_ops.append(UpdateOne(
+                {"user_id": event.get("user_id"), "apple_event_id": event_id},
+                {"$setOnInsert": {
+                    "apple_href": event.get("apple_href"),
+                    "etag": event.get("apple_etag"),
+                    "encoding": "zlib",
+                    "data": Binary(zlib.compress(event["raw_data"].encode("utf-8"))),
+                    "updated_at": datetime.utcnow(),
+                }},
+                upsert=True,
+            ))
+        if payload_ops:
+            await db.apple_event_payloads.bulk_write(payload_ops, ordered=False)
+
+    result = await db.events.update_many(
+        {"_id": {"$in": [event["_id"] for event in batch]}},
+        {"$unset": {"raw_data": ""}},
+    )
+    return result.modified_count
+
+
+async def remove_legacy_duplicates() -> int:
+    """Delete duplicate Apple events written by the old insert-only sync."""
+    result = await db.events.delete_many(LEGACY_APPLE_DUPLICATE_FILTER)
+    return result.deleted_count
+
+
+async def migrate(archive: bool, remove_legacy: bool, batch_size: int):
+    # Archive first so the duplicates' payloads survive their removal
+    stripped = await strip_raw_ical(archive, batch_size)
+    print(f"Stripped raw_data from {stripped} event documents")
+    if remove_legacy:
+        removed = await remove_legacy_duplicates()
+        print(f"Removed {removed} duplicate Apple events from the legacy sync")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Strip raw iCalendar payloads from db.events")
+    parser.add_argument("--archive", action="store_true", help="copy payloads to apple_event_payloads first")
+    parser.add_argument("--remove-legacy-duplicates", action="store_true",
+                        help="then delete duplicate Apple events left by the old insert-only sync")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.archive, args.remove_legacy_duplicates, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+OAuth State Store
+
+Short-lived storage for the OAuth ``state`` values issued at login and
+checked on the provider callback. Each state can be consumed exactly once:
+``pop`` is an atomic get-and-delete, so a replayed or concurrent callback
+finds nothing.
+
+Two backends, selected with OAUTH_STATE_BACKEND:
+
+- ``mongo`` (default): the ``oauth_states`` collection with a TTL index,
+  shared by every worker so a callback may land on any of them
+- ``memory``: a bounded in-process LRU for single-node deployments
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from dependencies import db
+
+logger = logging.getLogger(__name__)
+
+OAUTH_STATE_BACKEND = os.getenv("OAUTH_STATE_BACKEND", "mongo").lower()
+OAUTH_STATE_TTL_SECONDS = int(os.getenv("OAUTH_STATE_TTL_SECONDS", "600"))
+OAUTH_STATE_MEMORY_MAX_ENTRIES = int(os.getenv("OAUTH_STATE_MEMORY_MAX_ENTRIES", "10000"))
+
+
+class MongoOAuthStateStore:
+    """
+    OAuth states in a MongoDB collection with a TTL index on ``expires_at``.
+    """
+
+    def __init__(self, collection=None, ttl_seconds: int = OAUTH_STATE_TTL_SECONDS):
+        self.collection = collection if collection is not None else db.oauth_states
+        self.ttl_seconds = ttl_seconds
+
+    async def put(self, state: str, data: Optional[Dict[str, Any]] = None):
+        """
+        Save a state with optional data to return when it is consumed.
+
+        Args:
+            state (str): The state value sent to the provider
+            data (Dict): Data tied to this login attempt
+        """
+        now = datetime.utcnow()
+        await self.collection.insert_one({
+            "_id": state,
+            "data": data or {},
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds),
+        })
+
+    async def pop(self, state: str) -> Optional[Dict[str, Any]]:
+        """
+        Consume a state.
+
+        Args:
+            state (str): The state value from the callback
+
+        Returns:
+            Optional[Dict]: The saved data, None if the state is unknown,
+            expired or already consumed
+        """
+        if not state:
+            return None
+        # The TTL monitor only runs about once a minute, so check expiry here too
+        doc = await self.collection.find_one_and_delete(
+            {"_id": state, "expires_at": {"$gt": datetime.utcnow()}}
+        )
+        return doc.get("data", {}) if doc else None
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+class MemoryOAuthStateStore:
+    """
+    Bounded in-process OAuth state store; oldest entries are evicted first.
+    """
+
+    def __init__(self, ttl_seconds: int = OAUTH_STATE_TTL_SECONDS,
+                 max_entries: int = OAUTH_STATE_MEMORY_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def put(self, state: str, data: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._entries[state] = (time.monotonic() + self.ttl_seconds, data or {})
+            self._entries.move_to_end(state)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def pop(self, state: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.pop(state, None)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        return data if time.monotonic() < expires_at else None
+
+    async def ensure_indexes(self):
+        pass
+
+
+_store = None
+
+
+def get_oauth_state_store():
+    """
+    Return the configured process-wide OAuth state store.
+    """
+    global _store
+    if _store is None:
+        if OAUTH_STATE_BACKEND == "memory":
+            _store = MemoryOAuthStateStore()
+        else:
+            if OAUTH_STATE_BACKEND != "mongo":
+                logger.warning(f"Unknown OAUTH_STATE_BACKEND '{OAUTH_STATE_BACKEND}', using mongo")
+            _store = MongoOAuthStateStore()
+    return _store
@@ -0,0 +1,259 @@
+"""
+On-Demand Request Profiling
+
+Profiles single requests in a running deployment, without redeploying:
+
+- Admin requests: send ``X-Profile: 1`` and ``X-Profile-Token: <PROFILING_ADMIN_TOKEN>``.
+  The profile is saved under PROFILING_DIR and its file name returned in
+  the ``X-Profile-File`` response header. With ``X-Profile: inline`` the
+  response body is replaced by the profile itself (the handler's status is
+  in ``X-Profile-Status``). ``X-Profile-Engine`` picks the profiler for one
+  request.
+- Sampling: PROFILING_SAMPLE_EVERY=N profiles every Nth request of each
+  route (per worker) and saves it under PROFILING_DIR.
+
+Engines (PROFILING_ENGINE):
+
+- ``pyinstrument``: statistical, follows the request's own coroutine across
+  awaits; saved as speedscope JSON (open at https://www.speedscope.app)
+- ``cprofile``: deterministic; saved as pstats (``python -m pstats`` or
+  snakeviz). It sees everything the worker's event loop runs meanwhile,
+  including other requests.
+- ``auto`` (default): pyinstrument if installed, otherwise cprofile
+
+The profile covers the handler and any BackgroundTasks it queued. One
+request per worker is profiled at a time; others run unprofiled meanwhile.
+PROFILING_MAX_FILES bounds how many profiles are kept on disk.
+"""
+
+import asyncio
+import cProfile
+import importlib.util
+import logging
+import marshal
+import os
+import re
+import secrets
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+PROFILING_SAMPLE_EVERY = int(os.getenv("PROFILING_SAMPLE_EVERY", "0"))
+PROFILING_ENGINE = os.getenv("PROFILING_ENGINE", "auto").lower()
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "200"))
+# Sampling interval for pyinstrument, in seconds
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", "0.001"))
+
+PROFILING_CONFIGURED = bool(PROFILING_ADMIN_TOKEN) or PROFILING_SAMPLE_EVERY > 0
+
+ENGINES = ("pyinstrument", "cprofile")
+
+_sample_counts: Dict[Tuple[str, str], int] = {}
+_busy = False
+
+
+def _default_engine() -> str:
+    if PROFILING_ENGINE in ENGINES:
+        return PROFILING_ENGINE
+    return "pyinstrument" if importlib.util.find_spec("pyinstrument") else "cprofile"
+
+
+class RequestProfiler:
+    """
+    One profiling session, rendered to a file artifact when stopped.
+    """
+
+    def __init__(self, engine: str):
+        self.engine = engine
+        if engine == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self._profiler = Profiler(interval=PROFILING_INTERVAL, async_mode="enabled")
+        else:
+            self._profiler = cProfile.Profile()
+
+    @property
+    def extension(self) -> str:
+        return "speedscope.json" if self.engine == "pyinstrument" else "pstats"
+
+    @property
+    def media_type(self) -> str:
+        return "application/json" if self.engine == "pyinstrument" else "application/octet-stream"
+
+    def start(self):
+        if self.engine == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.engine == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def render(self) -> bytes:
+        """
+        Returns:
+            bytes: speedscope JSON (pyinstrument) or marshalled pstats data (cProfile)
+        """
+        if self.engine == "pyinstrument":
+            from pyinstrument.renderers import SpeedscopeRenderer
+
+            return self._profiler.output(SpeedscopeRenderer()).encode("utf-8")
+        self._profiler.create_stats()
+        return marshal.dumps(self._profiler.stats)
+
+
+def _route_path(scope) -> Optional[str]:
+    # Routing has not run yet; match the way the router will
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None)
+    return None
+
+
+def _should_sample(scope) -> bool:
+    if PROFILING_SAMPLE_EVERY <= 0:
+        return False
+    route = _route_path(scope)
+    if route is None:
+        return False
+    key = (scope["method"], route)
+    count = _sample_counts.get(key, 0) + 1
+    _sample_counts[key] = count
+    return count % PROFILING_SAMPLE_EVERY == 0
+
+
+def _admin_request(headers: Dict[str, str]) -> Optional[str]:
+    """
+    The requested mode ("save" or "inline") if the request asks for a
+    profile with a valid admin token, else None.
+    """
+    value = headers.get("x-profile", "").lower()
+    if not value or value in ("0", "false", "off") or not PROFILING_ADMIN_TOKEN:
+        return None
+    if not secrets.compare_digest(headers.get("x-profile-token", ""), PROFILING_ADMIN_TOKEN):
+        logger.warning("Ignoring X-Profile request with a missing or invalid token")
+        return None
+    return "inline" if value == "inline" else "save"
+
+
+def _file_name(scope, extension: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")[:60] or "root"
+    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    return f"{timestamp}-{scope['method']}-{slug}-{uuid.uuid4().hex[:8]}.{extension}"
+
+
+def _prune(directory: str, max_files: int):
+    if max_files <= 0:
+        return
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+    paths = sorted((path for path in paths if os.path.isfile(path)), key=os.path.getmtime)
+    for path in paths[:-max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def save_profile(profiler: RequestProfiler, file_name: str) -> str:
+    """
+    Render a stopped profiler into PROFILING_DIR.
+
+    Returns:
+        str: Path of the written file
+    """
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    path = os.path.join(PROFILING_DIR, file_name)
+    with open(path, "wb") as f:
+        f.write(profiler.render())
+    _prune(PROFILING_DIR, PROFILING_MAX_FILES)
+    return path
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling admin-requested and sampled requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _busy
+        if not PROFILING_CONFIGURED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        mode = _admin_request(headers)
+        if mode is None and (_busy or not _should_sample(scope)):
+            await self.app(scope, receive, send)
+            return
+        if _busy:
+            logger.info(f"Another request is being profiled; not profiling {scope['method']} {scope['path']}")
+            await self.app(scope, receive, send)
+            return
+
+        engine = headers.get("x-profile-engine", "").lower() if mode else ""
+        if engine not in ENGINES:
+            engine = _default_engine()
+        try:
+            profiler = RequestProfiler(engine)
+        except ImportError:
+            logger.error(f"Profiling engine '{engine}' is not installed; falling back to cprofile")
+            profiler = RequestProfiler("cprofile")
+        file_name = _file_name(scope, profiler.extension)
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if mode == "inline":
+                # The profile replaces the handler's response
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                return
+            if mode == "save" and message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-file", file_name.encode("latin-1")),
+                ]
+            await send(message)
+
+        _busy = True
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            _busy = False
+
+        if mode == "inline":
+            body = await asyncio.to_thread(profiler.render)
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", profiler.media_type.encode("latin-1")),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"content-disposition", f'attachment; filename="{file_name}"'.encode("latin-1")),
+                    (b"x-profile-status", str(status).encode("latin-1")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        try:
+            path = await asyncio.to_thread(save_profile, profiler, file_name)
+            logger.info(f"Saved {'requested' if mode else 'sampled'} profile of {scope['method']} {scope['path']} to {path}")
+        except Exception as e:
+            logger.error(f"Failed to save profile {file_name}: {str(e)}")
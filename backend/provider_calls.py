@@ -0,0 +1,319 @@
+"""
+Provider Call Accounting
+
+Every call to Google, Microsoft Graph and Apple passes through one of two
+instrumented paths, both of which report here:
+
+- the shared HTTP clients (http_clients.py): Graph, CalDAV, Apple ID, token
+  endpoints and the caldav library's session
+- ``InstrumentedHttpRequest`` for googleapiclient requests (events.list,
+  events.watch, ...), installed by google_discovery.build_google_service
+
+For each provider and operation this records latency, status, retries and
+request/response bytes as Prometheus metrics (metrics.py) and, when tracing
+is enabled, as a client span (tracing.py), and counts usage
+per user and per project against PROVIDER_QUOTA_* limits. Crossing
+PROVIDER_QUOTA_WARN_RATIO of a limit logs a warning and increments
+``provider_quota_warnings_total``, ahead of the provider answering with
+``rateLimitExceeded`` / 429.
+
+Usage windows are counted per worker process. Project usage in /metrics is
+summed over workers; per-user counts in /health/db are this worker's view.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import (
+    PROVIDER_CALL_DURATION,
+    PROVIDER_CALL_RETRIES,
+    PROVIDER_CALLS,
+    PROVIDER_QUOTA_USAGE,
+    PROVIDER_QUOTA_WARNINGS,
+    PROVIDER_RATE_LIMITED,
+    PROVIDER_REQUEST_BYTES,
+    PROVIDER_RESPONSE_BYTES,
+)
+from tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_QUOTA_WARN_RATIO = float(os.getenv("PROVIDER_QUOTA_WARN_RATIO", "0.8"))
+PROVIDER_QUOTA_MAX_TRACKED_USERS = int(os.getenv("PROVIDER_QUOTA_MAX_TRACKED_USERS", "10000"))
+
+# "limit/window_seconds"; override with PROVIDER_QUOTA_<PROVIDER>_<SCOPE>,
+# e.g. PROVIDER_QUOTA_GOOGLE_USER=600/60. Set to 0 to stop tracking.
+DEFAULT_PROVIDER_QUOTAS = {
+    # Google Calendar API per-user and per-project queries per minute
+    ("google", "user"): "600/60",
+    ("google", "project"): "10000/60",
+    # Graph Outlook resources: 10,000 requests per 10 minutes per app and mailbox
+    ("microsoft", "user"): "10000/600",
+}
+
+QUOTA_SCOPES = ("user", "project")
+
+# Error reasons Google uses for quota and rate limit rejections
+GOOGLE_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+
+# The user the current request or background job acts for
+current_provider_user: ContextVar[Optional[str]] = ContextVar("current_provider_user", default=None)
+
+_ID_SEGMENT = re.compile(r"^(?=.*\d).{8,}$|^.{25,}$|[@=]")
+
+
+def set_provider_user(user_id: Any):
+    """
+    Attribute provider calls made from the current context to a user.
+
+    Args:
+        user_id: The user's id
+    """
+    return current_provider_user.set(str(user_id) if user_id is not None else None)
+
+
+def operation_from_path(method: str, path: str) -> str:
+    """
+    Operation label for a REST call: the method and the path with ids
+    replaced, e.g. "GET /me/events/{id}".
+    """
+    segments = [
+        "{id}" if _ID_SEGMENT.search(segment) else segment
+        for segment in path.split("/") if segment
+    ]
+    return f"{method} /{'/'.join(segments)}"
+
+
+def method_operation(method: str, path: str) -> str:
+    """
+    Operation label for protocols where the method names the operation
+    (CalDAV REPORT, PROPFIND, PUT, ...).
+    """
+    return method
+
+
+def _parse_quota(value: str) -> Optional[Tuple[int, float]]:
+    limit, _, window = value.partition("/")
+    if not limit.strip() or int(limit) <= 0:
+        return None
+    return int(limit), float(window or "60")
+
+
+def _configured_quotas() -> Dict[Tuple[str, str], Tuple[int, float]]:
+    quotas = {}
+    keys = set(DEFAULT_PROVIDER_QUOTAS)
+    for name in os.environ:
+        parts = name.lower().split("_")
+        if len(parts) == 4 and parts[:2] == ["provider", "quota"] and parts[3] in QUOTA_SCOPES:
+            keys.add((parts[2], parts[3]))
+    for provider, scope in keys:
+        value = os.getenv(
+            f"PROVIDER_QUOTA_{provider.upper()}_{scope.upper()}",
+            DEFAULT_PROVIDER_QUOTAS.get((provider, scope), "0"),
+        )
+        try:
+            quota = _parse_quota(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid quota PROVIDER_QUOTA_{provider.upper()}_{scope.upper()}={value}")
+            continue
+        if quota is not None:
+            quotas[(provider, scope)] = quota
+    return quotas
+
+
+class QuotaTracker:
+    """
+    Fixed-window usage counters per (provider, scope, subject).
+
+    The project scope has a single subject; the user scope keeps up to
+    PROVIDER_QUOTA_MAX_TRACKED_USERS users, least recently active evicted.
+    """
+
+    def __init__(self, quotas: Dict[Tuple[str, str], Tuple[int, float]],
+                 warn_ratio: float = PROVIDER_QUOTA_WARN_RATIO,
+                 max_users: int = PROVIDER_QUOTA_MAX_TRACKED_USERS):
+        self.quotas = quotas
+        self.warn_ratio = warn_ratio
+        self.max_users = max_users
+        # (provider, scope, subject) -> [window_start, count]
+        self._windows: "OrderedDict[Tuple[str, str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, provider: str, user_id: Optional[str], units: int = 1):
+        """
+        Count ``units`` calls for the project and, if known, the user.
+        """
+        for scope, subject in (("project", "project"), ("user", user_id)):
+            quota = self.quotas.get((provider, scope))
+            if quota is None or subject is None:
+                continue
+            limit, window = quota
+            count = self._increment((provider, scope, subject), window, units)
+
+            if scope == "project":
+                PROVIDER_QUOTA_USAGE.labels(provider, scope).set(count / limit)
+            warn_at = limit * self.warn_ratio
+            if count - units < warn_at <= count:
+                PROVIDER_QUOTA_WARNINGS.labels(provider, scope).inc()
+                who = "project" if scope == "project" else f"user {subject}"
+                logger.warning(
+                    f"{provider} {who} at {count}/{limit} calls in the current {window:.0f}s quota window"
+                )
+
+    def _increment(self, key: Tuple[str, str, str], window: float, units: int) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is None or now - entry[0] >= window:
+                entry = [now, 0]
+                self._windows[key] = entry
+            entry[1] += units
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.max_users:
+                self._windows.popitem(last=False)
+            return int(entry[1])
+
+    def usage(self, top_users: int = 5) -> Dict[str, Dict[str, Any]]:
+        """
+        Current-window usage per provider: the project and the busiest users.
+        """
+        now = time.monotonic()
+        with self._lock:
+            windows = list(self._windows.items())
+
+        report: Dict[str, Dict[str, Any]] = {}
+        for (provider, scope), (limit, window) in sorted(self.quotas.items()):
+            counts = [
+                (int(count), subject)
+                for (p, s, subject), (started, count) in windows
+                if p == provider and s == scope and now - started < window
+            ]
+            entry = {"limit": limit, "window_seconds": window}
+            if scope == "project":
+                used = counts[0][0] if counts else 0
+                entry.update({"used": used, "ratio": round(used / limit, 3)})
+            else:
+                entry["top_users"] = [
+                    {"user_id": subject, "used": count, "ratio": round(count / limit, 3)}
+                    for count, subject in sorted(counts, reverse=True)[:top_users]
+                ]
+            report.setdefault(provider, {})[scope] = entry
+        return report
+
+
+quota_tracker = QuotaTracker(_configured_quotas())
+
+_GoogleRequest = None
+
+
+def record_provider_call(provider: str, operation: str, status: Optional[int], duration: float,
+                         request_bytes: int = 0, response_bytes: int = 0, retry: bool = False,
+                         rate_limited: Optional[bool] = None, units: int = 1):
+    """
+    Record one provider call.
+
+    Args:
+        provider (str): "google", "microsoft" or "apple"
+        operation (str): Operation label, e.g. "events.list" or "REPORT"
+        status (int): HTTP status, None if no response was received
+        duration (float): Seconds from sending the request to the full response
+        request_bytes (int): Request body size
+        response_bytes (int): Response body size
+        retry (bool): Whether this call repeats an earlier throttled one
+        rate_limited (bool): Provider rejected the call for rate or quota
+            reasons; defaults to status 429
+        units (int): Calls counted against quotas (sub-requests of a batch)
+    """
+    status_label = str(status) if status is not None else "error"
+    PROVIDER_CALLS.labels(provider, operation, status_label).inc()
+    PROVIDER_CALL_DURATION.labels(provider, operation).observe(duration)
+    if request_bytes:
+        PROVIDER_REQUEST_BYTES.labels(provider, operation).inc(request_bytes)
+    if response_bytes:
+        PROVIDER_RESPONSE_BYTES.labels(provider, operation).inc(response_bytes)
+    if retry:
+        PROVIDER_CALL_RETRIES.labels(provider, operation).inc()
+    if rate_limited is None:
+        rate_limited = status == 429
+    if rate_limited:
+        PROVIDER_RATE_LIMITED.labels(provider, operation).inc()
+
+    quota_tracker.add(provider, current_provider_user.get(), units)
+
+    attributes = {
+        "provider": provider,
+        "provider.operation": operation,
+        "provider.retry": retry,
+        "provider.request_bytes": request_bytes,
+        "provider.response_bytes": response_bytes,
+        "provider.rate_limited": rate_limited,
+    }
+    if status is not None:
+        attributes["http.response.status_code"] = status
+    record_span(
+        f"{provider} {operation}", duration, attributes=attributes,
+        error=status is None or status >= 500,
+    )
+
+
+def google_request_class():
+    """
+    Return an ``HttpRequest`` subclass that records every googleapiclient
+    call, for ``build_from_document(requestBuilder=...)``.
+    """
+    global _GoogleRequest
+    if _GoogleRequest is not None:
+        return _GoogleRequest
+
+    # googleapiclient loads lazily (first Google API use)
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import HttpRequest
+
+    class InstrumentedHttpRequest(HttpRequest):
+        """
+        HttpRequest recording latency, status, bytes and rate limiting.
+        """
+
+        def execute(self, http=None, num_retries=0):
+            # "calendar.events.list" -> "events.list"
+            operation = self.methodId.split(".", 1)[-1] if self.methodId else "unknown"
+            request_bytes = len(self.body or b"")
+            outcome = {"status": None, "response_bytes": 0, "rate_limited": False}
+
+            postproc = self.postproc
+
+            def counting_postproc(resp, content):
+                outcome["status"] = resp.status
+                outcome["response_bytes"] = len(content or b"")
+                return postproc(resp, content)
+
+            self.postproc = counting_postproc
+            started = time.perf_counter()
+            try:
+                return super().execute(http=http, num_retries=num_retries)
+            except HttpError as e:
+                outcome["status"] = e.resp.status
+                outcome["response_bytes"] = len(e.content or b"")
+                content = (e.content or b"").decode("utf-8", "replace")
+                outcome["rate_limited"] = e.resp.status == 429 or any(
+                    reason in content for reason in GOOGLE_RATE_LIMIT_REASONS
+                )
+                raise
+            finally:
+                self.postproc = postproc
+                record_provider_call(
+                    "google", operation, outcome["status"], time.perf_counter() - started,
+                    request_bytes=request_bytes,
+                    response_bytes=outcome["response_bytes"],
+                    rate_limited=outcome["rate_limited"],
+                )
+
+    _GoogleRequest = InstrumentedHttpRequest
+    return _GoogleRequest
+
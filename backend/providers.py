@@ -0,0 +1,153 @@
+"""
+Calendar Provider Plug-ins
+
+Each calendar integration (Google, Apple, Microsoft) is a plug-in that can
+be switched on or off with ENABLED_PROVIDERS (comma-separated; unset or
+empty enables all). A disabled provider's modules are never imported, so
+its SDKs (caldav, icalendar, msal, googleapiclient, ...) cost nothing at
+worker start.
+
+Plug-ins are described by ``"module:attribute"`` references and imported
+only when the application mounts an enabled provider. Inside the provider
+modules the heaviest SDK imports are deferred further, to first use.
+"""
+
+import importlib
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ALL_PROVIDERS = ("google", "apple", "microsoft")
+
+
+class ProviderPlugin:
+    """
+    Where a provider's router, startup hooks and background loops live.
+    """
+
+    def __init__(self, name: str, router: str, startup: Optional[List[str]] = None,
+                 warmup: Optional[List[str]] = None,
+                 background: Optional[List[Tuple[str, Optional[str]]]] = None):
+        """
+        Args:
+            name (str): Provider name used in ENABLED_PROVIDERS
+            router (str): "module:attribute" of the provider's APIRouter
+            startup (List[str]): Async callables that must succeed before the
+                worker is ready (e.g. index creation)
+            warmup (List[str]): Async callables priming caches; failures are
+                reported but do not block readiness
+            background (List[Tuple]): Long-running coroutines started on
+                startup, each with an optional env flag that can disable it
+                ("!FLAG" runs the coroutine only while FLAG is off)
+        """
+        self.name = name
+        self.router = router
+        self.startup = startup or []
+        self.warmup = warmup or []
+        self.background = background or []
+
+
+PROVIDER_PLUGINS: Dict[str, ProviderPlugin] = {
+    "google": ProviderPlugin(
+        "google",
+        router="routes.google_calendar:router",
+        warmup=["google_discovery:prewarm_google_discovery"],
+    ),
+    "apple": ProviderPlugin(
+        "apple",
+        router="apple_routes:apple_router",
+        startup=["apple_routes:ensure_apple_event_indexes"],
+        warmup=[
+            "apple_auth_service:prewarm_apple_jwks",
+            "apple_routes:check_legacy_apple_duplicates",
+        ],
+    ),
+    "microsoft": ProviderPlugin(
+        "microsoft",
+        router="microsoft_routes:microsoft_router",
+        startup=["microsoft_routes:ensure_microsoft_event_indexes"],
+        warmup=["microsoft_auth_service:prewarm_msal"],
+        background=[
+            ("microsoft_routes:refresh_microsoft_tokens_periodically", None),
+            ("microsoft_routes:renew_microsoft_subscriptions_periodically", "MICROSOFT_SUBSCRIPTIONS_ENABLED"),
+            # Without change notifications, mirrors are kept current by polling
+            ("microsoft_routes:poll_microsoft_delta_sync_periodically", "!MICROSOFT_SUBSCRIPTIONS_ENABLED"),
+        ],
+    ),
+}
+
+
+def enabled_providers() -> List[str]:
+    """
+    Providers switched on by ENABLED_PROVIDERS, in a stable order.
+    """
+    configured = os.getenv("ENABLED_PROVIDERS", "").strip()
+    if not configured:
+        return list(ALL_PROVIDERS)
+
+    names = [name.strip().lower() for name in configured.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PROVIDER_PLUGINS]
+    if unknown:
+        logger.warning(f"Ignoring unknown providers in ENABLED_PROVIDERS: {', '.join(unknown)}")
+    return [name for name in ALL_PROVIDERS if name in names]
+
+
+def is_provider_enabled(name: str) -> bool:
+    return name in enabled_providers()
+
+
+def load_plugin_attr(reference: str) -> Any:
+    """
+    Import ``module:attribute`` and return the attribute.
+    """
+    module_name, attr = reference.split(":", 1)
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def include_provider_routers(app):
+    """
+    Mount the routers of every enabled provider on the application.
+    """
+    for name in enabled_providers():
+        app.include_router(load_plugin_attr(PROVIDER_PLUGINS[name].router))
+    logger.info(f"Enabled calendar providers: {', '.join(enabled_providers()) or 'none'}")
+
+
+def provider_hooks(kind: str) -> List[str]:
+    """
+    ``startup`` or ``warmup`` hook references of every enabled provider.
+    """
+    return [
+        reference
+        for name in enabled_providers()
+        for reference in getattr(PROVIDER_PLUGINS[name], kind)
+    ]
+
+
+def env_flag_enabled(flag: str) -> bool:
+    """
+    Whether an on/off env flag (default on) is set; "!FLAG" negates it.
+    """
+    negate = flag.startswith("!")
+    enabled = os.getenv(flag.lstrip("!"), "true").lower() in ("1", "true", "yes", "on")
+    return enabled != negate
+
+
+def start_provider_background_tasks():
+    """
+    Start enabled providers' background loops. Each loop runs in a single
+    worker across the deployment, whichever holds its leader lease.
+    """
+    from leader_lease import start_leader_task
+
+    for name in enabled_providers():
+        for reference, flag in PROVIDER_PLUGINS[name].background:
+            if flag and not env_flag_enabled(flag):
+                logger.info(f"{reference} disabled via {flag}")
+                continue
+            try:
+                start_leader_task(reference, load_plugin_attr(reference))
+            except Exception as e:
+                logger.error(f"Failed to start {reference}: {str(e)}")
@@ -0,0 +1,268 @@
+"""
+Recurrence Expansion Engine
+
+Recurring events are stored once, as a master document carrying the series
+``rrule``, ``exdates`` and per-occurrence ``overrides`` (keyed by the UTC
+original start, see occurrence_key). This module expands masters into
+occurrences for a requested window on read.
+
+Expanded windows are kept in a process-wide LRU cache keyed by series,
+``series_version`` (a provider etag) and window. Writers call ``occurrence_cache.invalidate`` when
+a master changes; the version in the key also protects other worker
+processes, which never see that call.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil.rrule import rrulestr
+
+logger = logging.getLogger(__name__)
+
+RECURRENCE_CACHE_SIZE = int(os.getenv("RECURRENCE_CACHE_SIZE", "4096"))
+RECURRENCE_MAX_OCCURRENCES = int(os.getenv("RECURRENCE_MAX_OCCURRENCES", "1000"))
+
+# Fields that describe the series and are not copied onto occurrences
+SERIES_FIELDS = {"rrule", "exdates", "overrides", "series_version"}
+
+
+class OccurrenceCache:
+    """
+    Thread-safe LRU cache of expanded occurrence windows.
+    """
+
+    def __init__(self, max_entries: int = RECURRENCE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, List[Dict[str, Any]]]" = OrderedDict()
+        self._keys_by_series: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Tuple, value: List[Dict[str, Any]]):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._keys_by_series.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._discard_series_key(evicted)
+
+    def invalidate(self, series: str):
+        """
+        Drop every cached window of a series.
+        """
+        with self._lock:
+            for key in self._keys_by_series.pop(series, set()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_series.clear()
+
+    def _discard_series_key(self, key: Tuple):
+        keys = self._keys_by_series.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_series[key[0]]
+
+
+occurrence_cache = OccurrenceCache()
+
+
+def series_key(user_id: Any, calendar_source: str, external_id: Any) -> str:
+    """
+    Identify a series across stores; used as the cache invalidation key.
+    """
+    return f"{user_id}:{calendar_source}:{external_id}"
+
+
+def series_key_for_doc(doc: Dict[str, Any]) -> str:
+    # Live Apple search results only carry the UID as 'id'
+    external_id = doc.get("apple_event_id") or doc.get("external_id") or doc.get("id") or doc.get("_id")
+    return series_key(doc.get("user_id"), doc.get("calendar_source"), external_id)
+
+
+def parse_event_time(value: Any) -> Tuple[Optional[datetime], bool]:
+    """
+    Parse a stored start/end value.
+
+    Returns:
+        Tuple: (datetime or None, is_all_day). Naive datetimes are treated as UTC.
+    """
+    if value is None or value == "":
+        return None, False
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)), False
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day), True
+    if isinstance(value, dict):
+        # Google-style {"dateTime": ..., "date": ...}
+        return parse_event_time(value.get("dateTime") or value.get("date"))
+
+    text = str(value)
+    if len(text) == 10:
+        return datetime.strptime(text, "%Y-%m-%d"), True
+    parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)), False
+
+
+def occurrence_key(value: Any) -> str:
+    """
+    Key an occurrence by its original start: UTC ``YYYYMMDDTHHMMSSZ``,
+    or ``YYYYMMDD`` for all-day occurrences.
+    """
+    parsed, all_day = parse_event_time(value) if not isinstance(value, datetime) else (value, value.tzinfo is None)
+    if parsed is None:
+        return ""
+    if all_day:
+        return parsed.strftime("%Y%m%d")
+    return parsed.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _format_time(value: datetime, all_day: bool) -> str:
+    return value.date().isoformat() if all_day else value.isoformat()
+
+
+def _window_bound(value: datetime, all_day: bool) -> datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    if all_day:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def expand_series(master: Dict[str, Any], window_start: datetime,
+                  window_end: datetime) -> List[Dict[str, Any]]:
+    """
+    Expand a recurring master into the occurrences overlapping a window.
+
+    Args:
+        master (Dict): Stored master document with 'rrule'
+        window_start (datetime): Window start
+        window_end (datetime): Window end
+
+    Returns:
+        List[Dict]: Occurrence documents, with overrides applied and
+        cancelled/excluded occurrences removed
+    """
+    start, all_day = parse_event_time(master.get("start_time"))
+    if start is None:
+        return []
+    end, _ = parse_event_time(master.get("end_time"))
+    duration = (end - start) if end else timedelta(0)
+
+    # Expand in the series' own zone so occurrences keep wall-clock time across DST
+    tz_name = master.get("timezone")
+    if tz_name and not all_day:
+        try:
+            start = start.astimezone(ZoneInfo(tz_name))
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+
+    range_start = _window_bound(window_start, all_day)
+    range_end = _window_bound(window_end, all_day)
+
+    rule = rrulestr(master["rrule"], dtstart=start, forceset=True)
+    for exdate in master.get("exdates") or []:
+        excluded, _ = parse_event_time(exdate)
+        if excluded is not None:
+            rule.exdate(excluded.replace(tzinfo=None) if all_day else excluded)
+
+    overrides = master.get("overrides") or {}
+    base_id = master.get("id") or master.get("apple_event_id") or master.get("external_id") or str(master.get("_id"))
+    template = {k: v for k, v in master.items() if k not in SERIES_FIELDS}
+
+    occurrences = []
+    seen_keys = set()
+    for occurrence_start in rule.xafter(range_start - duration, count=RECURRENCE_MAX_OCCURRENCES, inc=True):
+        if occurrence_start > range_end:
+            break
+        key = occurrence_key(occurrence_start.replace(tzinfo=None) if all_day else occurrence_start)
+        seen_keys.add(key)
+        override = overrides.get(key)
+        if override and override.get("cancelled"):
+            continue
+
+        instance = dict(template)
+        instance.update({
+            "id": f"{base_id}_{key}",
+            "start_time": _format_time(occurrence_start, all_day),
+            "end_time": _format_time(occurrence_start + duration, all_day),
+            "recurring_event_id": base_id,
+            "original_start_time": _format_time(occurrence_start, all_day),
+        })
+        if override:
+            instance.update({k: v for k, v in override.items() if k != "cancelled"})
+        occurrences.append(instance)
+
+    # Overrides that moved an occurrence into the window from outside it
+    for key, override in overrides.items():
+        if key in seen_keys or override.get("cancelled"):
+            continue
+        moved_start, moved_all_day = parse_event_time(override.get("start_time"))
+        if moved_start is None:
+            continue
+        if _window_bound(window_start, moved_all_day) <= moved_start <= _window_bound(window_end, moved_all_day):
+            instance = dict(template)
+            instance.update({"id": f"{base_id}_{key}", "recurring_event_id": base_id})
+            instance.update({k: v for k, v in override.items() if k != "cancelled"})
+            occurrences.append(instance)
+
+    return occurrences
+
+
+def expand_events(docs: List[Dict[str, Any]], window_start: datetime,
+                  window_end: datetime) -> List[Dict[str, Any]]:
+    """
+    Replace recurring masters in a listing by their occurrences in a window.
+
+    Non-recurring documents are returned unchanged. Expansions are served
+    from the occurrence cache when the series has not changed.
+
+    Args:
+        docs (List[Dict]): Event documents as read from the database
+        window_start (datetime): Window start
+        window_end (datetime): Window end
+
+    Returns:
+        List[Dict]: Events with recurring series expanded
+    """
+    results = []
+    for doc in docs:
+        if not doc.get("rrule"):
+            results.append(doc)
+            continue
+
+        series = series_key_for_doc(doc)
+        version = doc.get("series_version") or doc.get("updated_at")
+        cache_key = (series, str(version), window_start.isoformat(), window_end.isoformat())
+
+        # Unversioned series cannot be told apart from an edited one: never cache them
+        occurrences = occurrence_cache.get(cache_key) if version else None
+        if occurrences is None:
+            try:
+                occurrences = expand_series(doc, window_start, window_end)
+            except Exception as e:
+                logger.warning(f"Could not expand recurring event {series}: {str(e)}")
+                results.append(doc)
+                continue
+            if version:
+                occurrence_cache.put(cache_key, occurrences)
+
+        # Callers mutate listing entries, so hand out copies
+        results.extend(dict(occurrence) for occurrence in occurrences)
+
+    return results
@@ -1,16 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from google.auth.transport.requests import Request as GoogleRequest
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from pydantic import BaseModel
 from datetime import datetime
 import os
 import pytz
 
 from dependencies import get_current_user
+from google_discovery import build_google_service
+from http_clients import get_session, register_session
 
 
 router = APIRouter()
 
+register_session("google", provider="google")
+
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -33,14 +37,9 @@ def get_google_service(access_token: str | None, refresh_token: str | None):
 
     # Ensure we have a valid access token
     if not creds.valid:
-        try:
-            creds.refresh(request=None)  # google-auth will create a Request internally if None is provided in some versions
-        except Exception:
-            # Fallback: explicitly use google.auth.transport.requests.Request
-            from google.auth.transport.requests import Request as GoogleRequest
-            creds.refresh(GoogleRequest())
-
-    return build("calendar", "v3", credentials=creds)
+        creds.refresh(GoogleRequest(session=get_session("google")))
+
+    return build_google_service("calendar", "v3", credentials=creds)
 
 
 class EventData(BaseModel):
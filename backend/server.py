@@ -7,7 +7,7 @@ import os,json
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, BackgroundTasks
 from fastapi.requests import Request as FastAPIRequest
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
@@ -18,8 +18,6 @@ from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from bson import ObjectId
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials as GoogleCredentials
 from google.auth.transport.requests import Request as GoogleRequest
 from googleapiclient.errors import HttpError
@@ -29,26 +27,37 @@ import json
 import asyncio
 import uuid
 
-google_client = {
-    "web": {
-        "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-        "project_id": "unified-calendar",
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-        "redirect_uris": [
-            "http://localhost:8000/api/google/callback",
-            "https://unified-calendar-zflg.onrender.com/api/google/callback",
-            "https://auth.expo.io/@anand9100/unified-calendar"
-        ],
-        "javascript_origins": ["https://unified-calendar-zflg.onrender.com"]
-    }
-}
+from http_clients import (
+    close_http_clients,
+    get_session,
+    http_client_stats,
+    open_http_clients,
+    register_session,
+)
+from metrics import MetricsMiddleware, render_metrics
+from provider_calls import set_provider_user
+from tracing import TracingMiddleware, setup_tracing, shutdown_tracing, traced
+from profiling import ProfilingMiddleware
+
+from google_discovery import build_google_service
+
+register_session("google", provider="google")
+
+
+def build(service_name: str, version: str, credentials=None):
+    """
+    Build a Google API service from the cached discovery document.
+    """
+    return build_google_service(service_name, version, credentials=credentials)
+
+
+def _google_auth_request() -> GoogleRequest:
+    """
+    google-auth transport on the shared "google" session (token refresh).
+    """
+    return GoogleRequest(session=get_session("google"))
+
 
-# Write to a temporary file (so Flow.from_client_secrets_file can use it)
-with open("client_secret.json", "w") as f:
-    json.dump(google_client, f)
 # ───────────────────────────────────────────────
 # Load environment
 ROOT_DIR = Path(__file__).parent
@@ -57,6 +66,8 @@ load_dotenv(ROOT_DIR / ".env")
 # ───────────────────────────────────────────────
 # Import shared dependencies
 from dependencies import db, get_current_user, security, SECRET_KEY, ALGORITHM
+from ical_stream_parser import parse_exdate_line
+from recurrence import expand_events, occurrence_cache, occurrence_key, series_key
 
 # ───────────────────────────────────────────────
 # Security
@@ -80,6 +91,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request count/latency by route template for /metrics
+app.add_middleware(MetricsMiddleware)
+# Server spans (and trace context for background jobs) when TRACING_EXPORTER is set
+app.add_middleware(TracingMiddleware)
+# Admin X-Profile requests and 1-in-N sampled requests (PROFILING_*)
+app.add_middleware(ProfilingMiddleware)
 
 # Basic logging configuration
 logging.basicConfig(level=logging.INFO)
@@ -96,6 +113,9 @@ SCOPES = [
     "https://www.googleapis.com/auth/userinfo.profile",
     "openid",
 ]
+# Stored shape of synced Google events; bumping it forces a full resync.
+# "series": one document per recurring series, expanded on read.
+GOOGLE_SYNC_MODE = "series"
 
 # ───────────────────────────────────────────────
 # Models
@@ -172,63 +192,73 @@ def create_access_token(data: dict):
 # Health check routes
 @app.get("/health")
 async def health_check():
-    """Check if the server and database are running properly"""
-    try:
-        # Test database connection
-        await db.command("ping")
-        return {
-            "status": "healthy",
-            "database": "connected",
-            "timestamp": datetime.utcnow().isoformat()
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "database": "disconnected",
-            "error": str(e),
-            "timestamp": datetime.utcnow().isoformat()
-        }
+    """Liveness probe: the process is up and serving (no database or provider calls)"""
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """Ready once startup warmup (connection pool, indexes, caches) has finished"""
+    body = {
+        "status": "ready" if warmup_state.ready else "warming_up",
+        **warmup_state.as_dict(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    return JSONResponse(body, status_code=200 if warmup_state.ready else 503)
+
+@app.get("/health/http")
+async def http_clients_health_check():
+    """Request and connection counters of the shared outbound HTTP clients"""
+    return {
+        "clients": http_client_stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics (request latency, MongoDB commands, background work)"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/health/db")
 async def database_health_check():
-    """Detailed database connection health check"""
+    """Detailed database and provider health; expensive stats and probes are cached"""
     try:
-        # Test database connection with ping
+        # Test database connection with ping (cheap, always live)
         ping_result = await db.command("ping")
-        
-        # Get database stats
-        stats = await db.command("dbStats")
-        
-        # Get collection count
-        collections = await db.list_collection_names()
-        
-        return {
+        database_stats = await database_stats_cache.get()
+        body = {
             "status": "healthy",
             "database": "connected",
             "ping_result": ping_result,
-            "database_name": stats.get("db"),
-            "collections": collections,
-            "collections_count": len(collections),
-            "timestamp": datetime.utcnow().isoformat()
+            **database_stats["value"],
+            "stats_checked_at": database_stats["checked_at"],
+            "stats_age_seconds": database_stats["age_seconds"],
         }
     except Exception as e:
-        return {
+        body = {
             "status": "unhealthy",
             "database": "disconnected",
             "error": str(e),
-            "timestamp": datetime.utcnow().isoformat()
         }
 
+    try:
+        body["providers"] = await provider_health()
+    except Exception as e:
+        logging.error("Provider health check failed: %s", str(e))
+        body["providers"] = {"error": str(e)}
+
+    body["timestamp"] = datetime.utcnow().isoformat()
+    return body
+
 # ───────────────────────────────────────────────
 # Google OAuth routes
 @app.get("/api/google/login")
 async def google_login(frontend_redirect_uri: str = None):
     logging.info("/api/google/login called with frontend_redirect_uri=%s", frontend_redirect_uri)
-    flow = Flow.from_client_secrets_file(
-        "client_secret.json",
-        scopes=SCOPES,
-        redirect_uri=GOOGLE_REDIRECT_URI,
-    )
+    flow = create_google_flow(SCOPES, GOOGLE_REDIRECT_URI)
 
     # Store the frontend redirect URI in state
     state_data = {"frontend_redirect_uri": frontend_redirect_uri}
@@ -251,19 +281,7 @@ async def google_callback(request: Request):
 
     try:
         # Google OAuth flow
-        flow = Flow.from_client_config(
-            {
-                "web": {
-                    "client_id": GOOGLE_CLIENT_ID,
-                    "client_secret": GOOGLE_CLIENT_SECRET,
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                    "redirect_uris": [GOOGLE_REDIRECT_URI],
-                }
-            },
-            scopes=SCOPES,
-        )
-        flow.redirect_uri = GOOGLE_REDIRECT_URI
+        flow = create_google_flow(SCOPES, GOOGLE_REDIRECT_URI)
         # Log redirect URIs to help diagnose mismatches
         logging.info("🔐 OAuth redirect: expected=%s, flow.redirect_uri=%s", GOOGLE_REDIRECT_URI, getattr(flow, 'redirect_uri', None))
 
@@ -349,7 +367,7 @@ async def google_callback(request: Request):
                         scopes=stored_scopes
                     )
                     # Refresh token to get access token
-                    creds.refresh(GoogleRequest())
+                    creds.refresh(_google_auth_request())
                     service = build("calendar", "v3", credentials=creds)
                     
                     # Create watch channel
@@ -460,7 +478,7 @@ async def get_google_events(current_user: dict = Depends(get_current_user)):
             token_uri="https://oauth2.googleapis.com/token",
             scopes=stored_scopes,
         )
-        creds.refresh(GoogleRequest())
+        creds.refresh(_google_auth_request())
         service = build("calendar", "v3", credentials=creds)
 
         now_iso = datetime.utcnow().isoformat() + "Z"
@@ -495,16 +513,33 @@ async def get_google_events(current_user: dict = Depends(get_current_user)):
 # ───────────────────────────────────────────────
 # Combined Events API
 @app.get("/api/events")
-async def api_get_events(calendar_sources: str = "", current_user: dict = Depends(get_current_user)):
+async def api_get_events(
+    calendar_sources: str = "",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user),
+):
     try:
         sources = [s.strip().lower() for s in calendar_sources.split(",") if s.strip()] if calendar_sources else []
+        # Window recurring series are expanded into; day-aligned so expansions stay cacheable
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        window_start = start or today - timedelta(days=30)
+        window_end = end or today + timedelta(days=365)
 
         # Local events
         local_events = []
         try:
             user_id = str(current_user.get("_id")) if current_user and current_user.get("_id") else None
             if user_id and (not sources or "local" in sources):
-                cursor = db.events.find({"user_id": {"$in": [user_id, ObjectId(user_id)]}})
+                # Mirrored Outlook events are not local events
+                cursor = db.events.find(
+                    {
+                        "user_id": {"$in": [user_id, ObjectId(user_id)]},
+                        "calendar_source": {"$ne": "microsoft"},
+                        "pending_master": {"$ne": True},
+                    },
+                    {"raw_data": 0},
+                )
                 async for ev in cursor:
                     ev_copy = dict(ev)
                     ev_copy["id"] = str(ev_copy.get("_id"))
@@ -512,6 +547,7 @@ async def api_get_events(calendar_sources: str = "", current_user: dict = Depend
                     if isinstance(ev_copy.get("user_id"), ObjectId):
                         ev_copy["user_id"] = str(ev_copy["user_id"])
                     local_events.append(ev_copy)
+                local_events = expand_events(local_events, window_start, window_end)
         except Exception as e:
             logging.warning("Local events fetch failed in /api/events: %s", str(e))
 
@@ -568,7 +604,7 @@ def _get_calendar_service_from_refresh_token(current_user: dict):
         token_uri="https://oauth2.googleapis.com/token",
         scopes=stored_scopes,
     )
-    creds.refresh(GoogleRequest())
+    creds.refresh(_google_auth_request())
     return build("calendar", "v3", credentials=creds)
 
 
@@ -656,6 +692,8 @@ async def create_event_api(event: dict, current_user: dict = Depends(get_current
 # ----------------------------------------------
 @app.post("/api/apple/add_event")
 async def add_apple_event(event: dict, current_user: dict = Depends(get_current_user)):
+    if not is_provider_enabled("apple"):
+        raise HTTPException(status_code=404, detail="Apple Calendar integration is disabled")
     try:
         from apple_calendar_service import AppleCalendarService  # local import to avoid circular
         from bson import ObjectId as _ObjectId
@@ -696,18 +734,21 @@ async def add_apple_event(event: dict, current_user: dict = Depends(get_current_
 # ----------------------------------------------
 @app.post("/api/microsoft/add_event")
 async def add_microsoft_event(event: dict, current_user: dict = Depends(get_current_user)):
+    if not is_provider_enabled("microsoft"):
+        raise HTTPException(status_code=404, detail="Microsoft Calendar integration is disabled")
     try:
         from microsoft_calendar_service import MicrosoftCalendarService  # local import
+        from microsoft_routes import get_valid_microsoft_access_token
 
         if not current_user.get("microsoft_calendar_connected"):
             raise HTTPException(status_code=400, detail="Microsoft Calendar not connected")
 
-        access_token = current_user.get("microsoft_access_token")
+        access_token = await get_valid_microsoft_access_token(current_user)
         if not access_token:
             raise HTTPException(status_code=400, detail="Microsoft access token not found")
 
         svc = MicrosoftCalendarService(access_token)
-        created = svc.create_event(event)
+        created = await svc.create_event(event)
         return {"status": "success", "event": created}
     except HTTPException:
         raise
@@ -884,6 +925,8 @@ async def google_watch(body: WatchRequest, current_user: dict = Depends(get_curr
 
 
 async def _build_google_service_for_user_id(user_id: str):
+    # Webhook and renewal paths have no request user; attribute calls here
+    set_provider_user(user_id)
     user = await db.users.find_one({"_id": ObjectId(user_id)})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -899,11 +942,15 @@ async def _build_google_service_for_user_id(user_id: str):
         token_uri="https://oauth2.googleapis.com/token",
         scopes=stored_scopes,
     )
-    creds.refresh(GoogleRequest())
+    creds.refresh(_google_auth_request())
     return build("calendar", "v3", credentials=creds)
 
 
 async def _upsert_google_event_for_user(user_id: str, item: dict):
+    if item.get("recurringEventId"):
+        await _upsert_google_override_for_user(user_id, item)
+        return
+
     start = item.get("start", {})
     end = item.get("end", {})
     start_iso = start.get("dateTime") or start.get("date")
@@ -920,15 +967,71 @@ async def _upsert_google_event_for_user(user_id: str, item: dict):
         "user_id": user_id,
         "external_id": item.get("id"),
     }
+    # Recurring masters keep the rule; occurrences are expanded on read
+    recurrence = item.get("recurrence") or []
+    rrule = next((line[len("RRULE:"):] for line in recurrence if line.upper().startswith("RRULE:")), None)
+    # Clears the placeholder mark left by an override that arrived first
+    unset_doc = {"pending_master": ""}
+    if rrule:
+        update_doc.update({
+            "rrule": rrule,
+            "exdates": [
+                exdate
+                for line in recurrence if line.upper().startswith("EXDATE")
+                for exdate in parse_exdate_line(line)
+            ],
+            "timezone": start.get("timeZone"),
+            "series_version": item.get("etag"),
+        })
+    else:
+        # A series turned into a single event: drop the old rule and overrides
+        unset_doc.update({"rrule": "", "exdates": "", "overrides": "", "timezone": "", "series_version": ""})
+    occurrence_cache.invalidate(series_key(user_id, "google", item.get("id")))
     # Remove None values to avoid overwriting with nulls
     update_doc = {k: v for k, v in update_doc.items() if v is not None}
     await db.events.update_one(
         {"user_id": user_id, "calendar_source": "google", "external_id": item.get("id")},
-        {"$set": update_doc},
+        {"$set": update_doc, "$unset": unset_doc},
         upsert=True,
     )
 
 
+async def _upsert_google_override_for_user(user_id: str, item: dict):
+    """Store a modified or cancelled occurrence as an override on its series master."""
+    master_id = item.get("recurringEventId")
+    key = occurrence_key(item.get("originalStartTime"))
+    if not key:
+        return
+
+    cancelled = item.get("status") == "cancelled"
+    if cancelled:
+        override = {"cancelled": True}
+    else:
+        start = item.get("start", {})
+        end = item.get("end", {})
+        override = {
+            "title": item.get("summary") or "(No title)",
+            "description": item.get("description"),
+            "location": item.get("location"),
+            "start_time": start.get("dateTime") or start.get("date"),
+            "end_time": end.get("dateTime") or end.get("date"),
+        }
+        override = {k: v for k, v in override.items() if v is not None}
+
+    # A modified occurrence of a master outside the sync window is kept on a
+    # placeholder, hidden from listings until the master arrives. Cancelling an
+    # occurrence of an unknown master has nothing to hide.
+    await db.events.update_one(
+        {"user_id": user_id, "calendar_source": "google", "external_id": master_id},
+        {
+            "$set": {f"overrides.{key}": override, "series_version": item.get("etag") or key},
+            "$setOnInsert": {"pending_master": True},
+        },
+        upsert=not cancelled,
+    )
+    occurrence_cache.invalidate(series_key(user_id, "google", master_id))
+
+
 async def _delete_google_event_for_user(user_id: str, external_id: str):
     await db.events.delete_one({
         "user_id": user_id,
@@ -937,14 +1040,24 @@ async def _delete_google_event_for_user(user_id: str, external_id: str):
     })
 
 
+@traced("job google.incremental_sync")
 async def _perform_google_incremental_sync(user_id: str):
     """Fetch deltas using syncToken if available, otherwise do a windowed full sync."""
     try:
         service = await _build_google_service_for_user_id(user_id)
         state = await db.google_sync_state.find_one({"user_id": user_id})
+        if state and state.get("mode") != GOOGLE_SYNC_MODE:
+            # Tokens and documents from the per-occurrence mode cannot be reused
+            logging.info("🔁 Resyncing Google events for user %s as recurring series", user_id)
+            await db.events.delete_many({"user_id": user_id, "calendar_source": "google"})
+            await db.google_sync_state.update_one(
+                {"user_id": user_id},
+                {"$unset": {"sync_token": ""}, "$set": {"mode": GOOGLE_SYNC_MODE, "updated_at": datetime.utcnow()}},
+            )
+            state = None
         params = {
             "calendarId": "primary",
-            "singleEvents": True,
+            "singleEvents": False,
         }
         if state and state.get("sync_token"):
             params["syncToken"] = state["sync_token"]
@@ -957,6 +1070,8 @@ async def _perform_google_incremental_sync(user_id: str):
         next_page = None
         next_sync_token = None
         invalid_sync_handled = False
+        # Applied after the last page, once their masters have been stored
+        override_items = []
         while True:
             if next_page:
                 params["pageToken"] = next_page
@@ -997,7 +1112,9 @@ async def _perform_google_incremental_sync(user_id: str):
 
             items = resp.get("items", [])
             for item in items:
-                if item.get("status") == "cancelled":
+                if item.get("recurringEventId"):
+                    override_items.append(item)
+                elif item.get("status") == "cancelled":
                     await _delete_google_event_for_user(user_id, item.get("id"))
                 else:
                     await _upsert_google_event_for_user(user_id, item)
@@ -1007,10 +1124,13 @@ async def _perform_google_incremental_sync(user_id: str):
                 next_sync_token = resp.get("nextSyncToken") or next_sync_token
                 break
 
+        for item in override_items:
+            await _upsert_google_override_for_user(user_id, item)
+
         if next_sync_token:
             await db.google_sync_state.update_one(
                 {"user_id": user_id},
-                {"$set": {"sync_token": next_sync_token, "updated_at": datetime.utcnow()}},
+                {"$set": {"sync_token": next_sync_token, "mode": GOOGLE_SYNC_MODE, "updated_at": datetime.utcnow()}},
                 upsert=True,
             )
         logging.info("✅ Incremental Google sync complete for user %s", user_id)
@@ -1106,6 +1226,7 @@ async def stop_google_watch(body: StopWatchRequest, current_user: dict = Depends
         raise HTTPException(status_code=500, detail="Failed to stop Google watch")
 
 
+@traced("job google.renew_channel")
 async def _renew_channel_for_user(user_id: str, channel_doc: dict):
     """Stop an existing channel and create a new one with the same address/token."""
     try:
@@ -1289,10 +1410,16 @@ async def get_events(current_user: dict = Depends(get_current_user)):
     user_id = str(current_user["_id"])
 
     # Fetch events from local DB
-    db_events = await db.events.find({"user_id": user_id}).to_list(100)
+    # Mirrored Outlook events are returned under microsoft_events below
+    db_events = await db.events.find(
+        {"user_id": user_id, "calendar_source": {"$ne": "microsoft"}, "pending_master": {"$ne": True}},
+        {"raw_data": 0},
+    ).to_list(100)
     for e in db_events:
         e["id"] = str(e["_id"])
         e["_id"] = str(e["_id"])
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    db_events = expand_events(db_events, today - timedelta(days=30), today + timedelta(days=365))
 
     # Fetch Google events if available
     google_events = []
@@ -1332,8 +1459,7 @@ async def get_events(current_user: dict = Depends(get_current_user)):
                 
                 # Refresh the access token
                 try:
-                    from google.auth.transport.requests import Request as GoogleRequest
-                    creds.refresh(GoogleRequest())
+                    creds.refresh(_google_auth_request())
                     service = build("calendar", "v3", credentials=creds)
                     events_result = service.events().list(
                         calendarId="primary",
@@ -1365,7 +1491,7 @@ async def get_events(current_user: dict = Depends(get_current_user)):
 
     # Fetch Apple events if available
     apple_events = []
-    if current_user.get("apple_calendar_connected"):
+    if current_user.get("apple_calendar_connected") and is_provider_enabled("apple"):
         try:
             from apple_calendar_service import AppleCalendarService
             credentials = current_user.get("apple_calendar_credentials", {})
@@ -1381,20 +1507,27 @@ async def get_events(current_user: dict = Depends(get_current_user)):
 
     # Fetch Microsoft events if available
     microsoft_events = []
-    if current_user.get("microsoft_calendar_connected"):
+    if current_user.get("microsoft_calendar_connected") and is_provider_enabled("microsoft"):
         try:
             from microsoft_calendar_service import MicrosoftCalendarService
-            access_token = current_user.get("microsoft_access_token")
-            if access_token:
-                from datetime import timedelta
-                microsoft_calendar = MicrosoftCalendarService(access_token)
-                start_date = datetime.utcnow()
-                end_date = datetime.utcnow() + timedelta(days=30)
-                microsoft_events = microsoft_calendar.get_events(
-                    start_date=start_date,
-                    end_date=end_date,
-                    max_results=20
-                )
+            from microsoft_routes import (
+                get_mirrored_microsoft_events,
+                get_valid_microsoft_access_token,
+                has_active_microsoft_subscription,
+            )
+            start_date = datetime.utcnow()
+            end_date = datetime.utcnow() + timedelta(days=30)
+            if await has_active_microsoft_subscription(user_id):
+                # Kept current by change notifications; no Graph call needed
+                microsoft_events = await get_mirrored_microsoft_events(user_id, start_date, end_date)
+            else:
+                access_token = await get_valid_microsoft_access_token(current_user)
+                if access_token:
+                    microsoft_calendar = MicrosoftCalendarService(access_token)
+                    microsoft_events = await microsoft_calendar.get_events(
+                        start_date=start_date,
+                        end_date=end_date
+                    )
         except Exception as e:
             logger.error(f"Error fetching Microsoft events: {str(e)}")
 
@@ -1473,28 +1606,41 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ───────────────────────────────────────────────
-# Import Apple Calendar routes (after all other definitions to avoid circular imports)
-from apple_routes import apple_router
-app.include_router(apple_router)
-
-# Import Microsoft Calendar routes
-from microsoft_routes import microsoft_router
-app.include_router(microsoft_router)
-
-# Import Google Calendar routes
-from routes.google_calendar import router as google_router
-app.include_router(google_router)
+# Provider routers (only enabled providers are imported)
+from google_oauth import create_google_flow
+from providers import include_provider_routers, is_provider_enabled, start_provider_background_tasks
+from health import database_stats_cache, provider_health
+from leader_lease import start_leader_task, stop_leader_tasks
+from warmup import run_warmup, warmup_state
+include_provider_routers(app)
 
 # ───────────────────────────────────────────────
 # Startup
 @app.on_event("startup")
 async def _startup_tasks():
     try:
-        watch_enabled = os.getenv("GOOGLE_WATCH_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+        setup_tracing()
+    except Exception as e:
+        logging.error("Failed to set up tracing: %s", str(e))
+
+    try:
+        await open_http_clients()
+    except Exception as e:
+        logging.error("Failed to open HTTP clients: %s", str(e))
+
+    try:
+        # Runs in the background; /ready reports 503 until it finishes
+        asyncio.create_task(run_warmup())
+    except Exception as e:
+        logging.error("Failed to start warmup: %s", str(e))
+
+    try:
+        watch_enabled = is_provider_enabled("google") and \
+            os.getenv("GOOGLE_WATCH_ENABLED", "true").lower() in ("1", "true", "yes", "on")
         if watch_enabled:
             logging.info("✅ Google watch-channel renewal enabled")
-            # Kick off renewal loop
-            asyncio.create_task(_renew_google_channels_periodically())
+            # Kick off renewal loop (in one worker only)
+            start_leader_task("google_watch_renewal", _renew_google_channels_periodically)
             # Log effective webhook URL (forced)
             logging.info("🌐 Google webhook URL: https://unified-calendar-zflg.onrender.com/api/google/notifications")
             # Load last saved channel for observability
@@ -1517,6 +1663,19 @@ async def _startup_tasks():
     except Exception as e:
         logging.error("Failed during startup task setup: %s", str(e))
 
+    try:
+        start_provider_background_tasks()
+    except Exception as e:
+        logging.error("Failed to start calendar provider tasks: %s", str(e))
+
+@app.on_event("shutdown")
+async def _shutdown_tasks():
+    from ical_stream_parser import shutdown_parse_pool
+    shutdown_parse_pool()
+    await stop_leader_tasks()
+    await close_http_clients()
+    shutdown_tracing()
+
 if __name__ == "__main__":
     import uvicorn
     
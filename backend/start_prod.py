@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Production startup script for the unified calendar backend server.
+Runs gunicorn with uvicorn workers (one per CPU core, uvloop + httptools)
+using gunicorn.conf.py. Linux/macOS only; on Windows use start_server.py.
+"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+if __name__ == "__main__":
+    if sys.platform == "win32":
+        print("The production profile needs gunicorn, which does not run on Windows.")
+        print("Use start_server.py instead.")
+        sys.exit(1)
+
+    from gunicorn.app.wsgiapp import run
+
+    os.chdir(BACKEND_DIR)
+    sys.argv = [
+        "gunicorn",
+        "--config", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+        *sys.argv[1:],  # e.g. --workers 4 --bind 0.0.0.0:10000
+        "server:app",
+    ]
+    run()
@@ -0,0 +1,116 @@
+"""
+Tests for in-place Apple event updates: changes are merged into the stored
+VCALENDAR instead of replacing it.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from icalendar import Calendar
+
+from apple_calendar_service import AppleCalendarService, EtagMismatchError
+
+HREF = "https://caldav.icloud.com/123/calendars/home/series-1.ics"
+
+SERIES = (
+    "BEGIN:VCALENDAR\r\n"
+    "VERSION:2.0\r\n"
+    "PRODID:-//Test//EN\r\n"
+    "BEGIN:VTIMEZONE\r\n"
+    "TZID:Europe/Berlin\r\n"
+    "BEGIN:STANDARD\r\n"
+    "DTSTART:19701025T030000\r\n"
+    "TZOFFSETFROM:+0200\r\n"
+    "TZOFFSETTO:+0100\r\n"
+    "RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU\r\n"
+    "END:STANDARD\r\n"
+    "BEGIN:DAYLIGHT\r\n"
+    "DTSTART:19700329T020000\r\n"
+    "TZOFFSETFROM:+0100\r\n"
+    "TZOFFSETTO:+0200\r\n"
+    "RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU\r\n"
+    "END:DAYLIGHT\r\n"
+    "END:VTIMEZONE\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:series-1\r\n"
+    "SUMMARY:Review\r\n"
+    "DTSTART;TZID=Europe/Berlin:20240108T150000\r\n"
+    "DTEND;TZID=Europe/Berlin:20240108T160000\r\n"
+    "RRULE:FREQ=WEEKLY;COUNT=4\r\n"
+    "EXDATE;TZID=Europe/Berlin:20240115T150000\r\n"
+    "SEQUENCE:2\r\n"
+    "END:VEVENT\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:series-1\r\n"
+    "RECURRENCE-ID;TZID=Europe/Berlin:20240122T150000\r\n"
+    "SUMMARY:Review (moved)\r\n"
+    "DTSTART;TZID=Europe/Berlin:20240123T150000\r\n"
+    "DTEND;TZID=Europe/Berlin:20240123T160000\r\n"
+    "END:VEVENT\r\n"
+    "END:VCALENDAR\r\n"
+)
+
+
+@pytest.fixture
+def service():
+    return AppleCalendarService("user@example.com", "app-password", "user-1")
+
+
+def master_and_override(ical_data):
+    vevents = Calendar.from_ical(ical_data).walk("VEVENT")
+    master = next(v for v in vevents if v.get("recurrence-id") is None)
+    override = next(v for v in vevents if v.get("recurrence-id") is not None)
+    return master, override
+
+
+def test_merge_keeps_series_properties(service):
+    merged = service._merge_ical_event(SERIES, {"title": "Design review"})
+
+    master, override = master_and_override(merged)
+    assert str(master["summary"]) == "Design review"
+    assert master["rrule"]["FREQ"] == ["WEEKLY"]
+    assert "EXDATE" in master
+    assert int(master["sequence"]) == 3
+    assert str(override["summary"]) == "Review (moved)"
+
+
+def test_merge_keeps_series_timezone(service):
+    merged = service._merge_ical_event(SERIES, {"start_time": "2024-01-08T13:00:00Z"})
+
+    master, _ = master_and_override(merged)
+    assert master["dtstart"].params["TZID"] == "Europe/Berlin"
+    assert master["dtstart"].dt.hour == 14
+
+
+def test_update_event_resource_puts_merged_calendar(service, monkeypatch):
+    requests = []
+
+    async def fake_dav_request(method, url, body=None, headers=None):
+        requests.append((method, url, body, headers))
+        request = httpx.Request(method, url)
+        if method == "GET":
+            return httpx.Response(200, text=SERIES, headers={"ETag": '"server-etag"'}, request=request)
+        return httpx.Response(204, headers={"ETag": '"new-etag"'}, request=request)
+
+    monkeypatch.setattr(service, "_dav_request", fake_dav_request)
+
+    result = asyncio.run(service.update_event_resource(HREF, {"location": "Room 2"}, etag='"stored-etag"'))
+
+    assert result == {"etag": '"new-etag"'}
+    method, url, body, headers = requests[-1]
+    assert (method, url) == ("PUT", HREF)
+    assert headers["If-Match"] == '"stored-etag"'
+    master, _ = master_and_override(body)
+    assert str(master["location"]) == "Room 2"
+    assert "RRULE" in master
+
+
+def test_update_event_resource_rejects_missing_resource(service, monkeypatch):
+    async def fake_dav_request(method, url, body=None, headers=None):
+        return httpx.Response(404, request=httpx.Request(method, url))
+
+    monkeypatch.setattr(service, "_dav_request", fake_dav_request)
+
+    with pytest.raises(EtagMismatchError):
+        asyncio.run(service.update_event_resource(HREF, {"title": "Gone"}))
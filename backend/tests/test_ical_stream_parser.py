@@ -0,0 +1,231 @@
+"""
+Tests for the CalDAV response parsers: the line-scanning VEVENT parser
+against the icalendar fallback, and multistatus / sync-collection bodies.
+"""
+
+import pytest
+
+import ical_stream_parser
+from ical_stream_parser import (
+    iter_multistatus,
+    parse_exdate_line,
+    parse_ical_event,
+    parse_multistatus_events,
+    parse_sync_collection,
+    parse_with_icalendar,
+)
+
+CALENDAR_URL = "https://caldav.icloud.com/123/calendars/home/"
+
+SIMPLE_EVENT = (
+    "BEGIN:VCALENDAR\r\n"
+    "VERSION:2.0\r\n"
+    "PRODID:-//Test//EN\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:simple-1@example.com\r\n"
+    "SUMMARY:Team sync\\, weekly\r\n"
+    "DESCRIPTION:Line one\\nLine two with a folded\r\n"
+    "  continuation\r\n"
+    "LOCATION:Room 4\r\n"
+    "DTSTART:20240108T100000Z\r\n"
+    "DTEND:20240108T110000Z\r\n"
+    "CREATED:20240101T090000Z\r\n"
+    "LAST-MODIFIED:20240102T090000Z\r\n"
+    "BEGIN:VALARM\r\n"
+    "ACTION:DISPLAY\r\n"
+    "DESCRIPTION:Reminder text\r\n"
+    "TRIGGER:-PT15M\r\n"
+    "END:VALARM\r\n"
+    "END:VEVENT\r\n"
+    "END:VCALENDAR\r\n"
+)
+
+RECURRING_EVENT = (
+    "BEGIN:VCALENDAR\r\n"
+    "VERSION:2.0\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:series-1@example.com\r\n"
+    "SUMMARY:Standup\r\n"
+    "DTSTART;TZID=Europe/Berlin:20240108T090000\r\n"
+    "DTEND;TZID=Europe/Berlin:20240108T091500\r\n"
+    "RRULE:FREQ=DAILY;COUNT=5\r\n"
+    "EXDATE;TZID=Europe/Berlin:20240109T090000,20240110T090000\r\n"
+    "EXDATE;TZID=Europe/Berlin:20240111T090000\r\n"
+    "END:VEVENT\r\n"
+    "END:VCALENDAR\r\n"
+)
+
+SERIES_WITH_OVERRIDE = (
+    "BEGIN:VCALENDAR\r\n"
+    "VERSION:2.0\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:series-2@example.com\r\n"
+    "SUMMARY:Review\r\n"
+    "DTSTART:20240108T140000Z\r\n"
+    "DTEND:20240108T150000Z\r\n"
+    "RRULE:FREQ=WEEKLY;COUNT=3\r\n"
+    "END:VEVENT\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:series-2@example.com\r\n"
+    "RECURRENCE-ID:20240115T140000Z\r\n"
+    "SUMMARY:Review (moved)\r\n"
+    "DTSTART:20240116T160000Z\r\n"
+    "DTEND:20240116T170000Z\r\n"
+    "END:VEVENT\r\n"
+    "END:VCALENDAR\r\n"
+)
+
+ALL_DAY_EVENT = (
+    "BEGIN:VCALENDAR\r\n"
+    "VERSION:2.0\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:allday-1@example.com\r\n"
+    "SUMMARY:Holiday\r\n"
+    "DTSTART;VALUE=DATE:20240301\r\n"
+    "DTEND;VALUE=DATE:20240302\r\n"
+    "END:VEVENT\r\n"
+    "END:VCALENDAR\r\n"
+)
+
+REPORT_BODY = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<d:multistatus xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">'
+    '<d:response>'
+    '<d:href>/123/calendars/home/simple-1.ics</d:href>'
+    '<d:propstat><d:prop><d:getetag>"etag-1"</d:getetag>'
+    f'<c:calendar-data>{SIMPLE_EVENT}</c:calendar-data></d:prop>'
+    '<d:status>HTTP/1.1 200 OK</d:status></d:propstat>'
+    '</d:response>'
+    '<d:response>'
+    '<d:href>/123/calendars/home/missing.ics</d:href>'
+    '<d:status>HTTP/1.1 404 Not Found</d:status>'
+    '</d:response>'
+    '</d:multistatus>'
+).encode("utf-8")
+
+SYNC_COLLECTION_BODY = (
+    b'<?xml version="1.0" encoding="utf-8"?>'
+    b'<d:multistatus xmlns:d="DAV:">'
+    b'<d:response><d:href>/123/calendars/home/</d:href>'
+    b'<d:status>HTTP/1.1 507 Insufficient Storage</d:status></d:response>'
+    b'<d:response><d:href>/123/calendars/home/changed.ics</d:href>'
+    b'<d:propstat><d:prop><d:getetag>"etag-2"</d:getetag></d:prop>'
+    b'<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>'
+    b'<d:response><d:href>/123/calendars/home/removed.ics</d:href>'
+    b'<d:status>HTTP/1.1 404 Not Found</d:status></d:response>'
+    b'<d:sync-token>https://caldav.icloud.com/sync/42</d:sync-token>'
+    b'</d:multistatus>'
+)
+
+
+@pytest.fixture
+def no_fallback(monkeypatch):
+    """Fail the test if the icalendar fallback is used."""
+    def fail(ical_data):
+        raise AssertionError("icalendar fallback used")
+    monkeypatch.setattr(ical_stream_parser, "parse_with_icalendar", fail)
+
+
+def test_fast_path_parses_simple_event(no_fallback):
+    event = parse_ical_event(SIMPLE_EVENT)
+
+    assert event["id"] == "simple-1@example.com"
+    assert event["title"] == "Team sync, weekly"
+    assert event["description"] == "Line one\nLine two with a folded continuation"
+    assert event["location"] == "Room 4"
+    assert event["start_time"] == "2024-01-08T10:00:00+00:00"
+    assert event["end_time"] == "2024-01-08T11:00:00+00:00"
+    assert event["rrule"] is None
+    assert "exdates" not in event
+
+
+def test_fast_path_matches_icalendar():
+    assert parse_ical_event(SIMPLE_EVENT) == parse_with_icalendar(SIMPLE_EVENT)
+
+
+def test_fast_path_reads_series_fields(no_fallback):
+    event = parse_ical_event(RECURRING_EVENT)
+
+    assert event["rrule"] == "FREQ=DAILY;COUNT=5"
+    assert event["timezone"] == "Europe/Berlin"
+    assert event["start_time"] == "2024-01-08T09:00:00+01:00"
+    assert event["exdates"] == [
+        "2024-01-09T09:00:00+01:00",
+        "2024-01-10T09:00:00+01:00",
+        "2024-01-11T09:00:00+01:00",
+    ]
+    assert event["overrides"] == {}
+
+
+def test_recurring_event_matches_icalendar():
+    assert parse_ical_event(RECURRING_EVENT) == parse_with_icalendar(RECURRING_EVENT)
+
+
+def test_overrides_fall_back_to_icalendar():
+    event = parse_ical_event(SERIES_WITH_OVERRIDE)
+
+    assert event["title"] == "Review"
+    assert event["rrule"] == "FREQ=WEEKLY;COUNT=3"
+    override = event["overrides"]["20240115T140000Z"]
+    assert override["title"] == "Review (moved)"
+    assert override["start_time"] == "2024-01-16T16:00:00+00:00"
+    assert override["cancelled"] is False
+
+
+def test_date_only_values_fall_back_to_icalendar():
+    assert parse_ical_event(ALL_DAY_EVENT) == parse_with_icalendar(ALL_DAY_EVENT)
+
+
+def test_payload_without_vevent():
+    assert parse_ical_event("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nEND:VCALENDAR\r\n") is None
+
+
+def test_parse_exdate_line():
+    assert parse_exdate_line("EXDATE;TZID=Europe/Berlin:20240108T100000,20240115T100000") == [
+        "2024-01-08T10:00:00+01:00",
+        "2024-01-15T10:00:00+01:00",
+    ]
+    assert parse_exdate_line("EXDATE;VALUE=DATE:20240301") == ["2024-03-01"]
+    assert parse_exdate_line("EXDATE") == []
+
+
+def test_multistatus_is_parsed_across_chunks():
+    chunks = [REPORT_BODY[i:i + 37] for i in range(0, len(REPORT_BODY), 37)]
+
+    responses = list(iter_multistatus(chunks))
+
+    assert [(href, etag, status) for href, etag, _, status in responses] == [
+        ("/123/calendars/home/simple-1.ics", '"etag-1"', "HTTP/1.1 200 OK"),
+        ("/123/calendars/home/missing.ics", None, "HTTP/1.1 404 Not Found"),
+    ]
+
+
+def test_parse_multistatus_events():
+    events = parse_multistatus_events(REPORT_BODY, CALENDAR_URL)
+
+    assert len(events) == 1
+    assert events[0]["id"] == "simple-1@example.com"
+    assert events[0]["href"] == "https://caldav.icloud.com/123/calendars/home/simple-1.ics"
+    assert events[0]["etag"] == '"etag-1"'
+    # XML parsing normalizes CRLF line endings
+    assert events[0]["ical_data"] == SIMPLE_EVENT.replace("\r\n", "\n")
+
+
+def test_parse_sync_collection():
+    entries, sync_token, truncated = parse_sync_collection(SYNC_COLLECTION_BODY, CALENDAR_URL)
+
+    assert entries == [
+        ("https://caldav.icloud.com/123/calendars/home/changed.ics", '"etag-2"', False),
+        ("https://caldav.icloud.com/123/calendars/home/removed.ics", None, True),
+    ]
+    assert sync_token == "https://caldav.icloud.com/sync/42"
+    assert truncated is True
+
+
+def test_parse_sync_collection_without_changes():
+    body = (
+        b'<?xml version="1.0" encoding="utf-8"?>'
+        b'<d:multistatus xmlns:d="DAV:"><d:sync-token>tok-1</d:sync-token></d:multistatus>'
+    )
+
+    assert parse_sync_collection(body, CALENDAR_URL) == ([], "tok-1", False)
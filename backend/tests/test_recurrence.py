@@ -0,0 +1,243 @@
+"""
+Tests for recurring series expansion and the occurrence cache.
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+import recurrence
+from recurrence import (
+    OccurrenceCache,
+    expand_events,
+    expand_series,
+    occurrence_key,
+    series_key,
+)
+
+WINDOW_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+WINDOW_END = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+
+def weekly_master(**fields):
+    master = {
+        "id": "series-1",
+        "apple_event_id": "series-1",
+        "user_id": "user-1",
+        "calendar_source": "apple",
+        "title": "Review",
+        "start_time": "2024-01-08T14:00:00+00:00",
+        "end_time": "2024-01-08T15:00:00+00:00",
+        "rrule": "FREQ=WEEKLY;COUNT=4",
+        "exdates": [],
+        "overrides": {},
+        "series_version": "etag-1",
+    }
+    master.update(fields)
+    return master
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    recurrence.occurrence_cache.clear()
+    yield
+    recurrence.occurrence_cache.clear()
+
+
+def test_occurrence_key():
+    assert occurrence_key("2024-01-08T15:00:00+01:00") == "20240108T140000Z"
+    assert occurrence_key("2024-03-01") == "20240301"
+    assert occurrence_key(None) == ""
+
+
+def test_expand_series_within_window():
+    occurrences = expand_series(weekly_master(), WINDOW_START, WINDOW_END)
+
+    assert [o["start_time"] for o in occurrences] == [
+        "2024-01-08T14:00:00+00:00",
+        "2024-01-15T14:00:00+00:00",
+        "2024-01-22T14:00:00+00:00",
+        "2024-01-29T14:00:00+00:00",
+    ]
+    first = occurrences[0]
+    assert first["id"] == "series-1_20240108T140000Z"
+    assert first["end_time"] == "2024-01-08T15:00:00+00:00"
+    assert first["recurring_event_id"] == "series-1"
+    assert first["title"] == "Review"
+    assert "rrule" not in first and "overrides" not in first
+
+
+def test_expand_series_clips_to_window():
+    occurrences = expand_series(
+        weekly_master(),
+        datetime(2024, 1, 14, tzinfo=timezone.utc),
+        datetime(2024, 1, 23, tzinfo=timezone.utc),
+    )
+
+    assert [o["id"] for o in occurrences] == [
+        "series-1_20240115T140000Z",
+        "series-1_20240122T140000Z",
+    ]
+
+
+def test_exdates_remove_occurrences():
+    master = weekly_master(exdates=["2024-01-15T15:00:00+01:00"])
+
+    occurrences = expand_series(master, WINDOW_START, WINDOW_END)
+
+    assert "series-1_20240115T140000Z" not in [o["id"] for o in occurrences]
+    assert len(occurrences) == 3
+
+
+def test_overrides_modify_and_cancel_occurrences():
+    master = weekly_master(overrides={
+        "20240115T140000Z": {"title": "Review (room change)", "location": "Room 2"},
+        "20240122T140000Z": {"cancelled": True},
+    })
+
+    occurrences = {o["id"]: o for o in expand_series(master, WINDOW_START, WINDOW_END)}
+
+    assert occurrences["series-1_20240115T140000Z"]["title"] == "Review (room change)"
+    assert occurrences["series-1_20240115T140000Z"]["location"] == "Room 2"
+    assert "series-1_20240122T140000Z" not in occurrences
+    assert len(occurrences) == 3
+
+
+def test_override_moved_into_window():
+    # The 2024-02-05 occurrence is moved to 2024-01-31, inside the window
+    master = weekly_master(
+        rrule="FREQ=WEEKLY;COUNT=5",
+        overrides={"20240205T140000Z": {
+            "start_time": "2024-01-31T10:00:00+00:00",
+            "end_time": "2024-01-31T11:00:00+00:00",
+        }},
+    )
+
+    occurrences = {o["id"]: o for o in expand_series(master, WINDOW_START, WINDOW_END)}
+
+    moved = occurrences["series-1_20240205T140000Z"]
+    assert moved["start_time"] == "2024-01-31T10:00:00+00:00"
+    assert moved["recurring_event_id"] == "series-1"
+
+
+def test_all_day_override_moved_into_window():
+    master = weekly_master(
+        start_time="2024-01-08",
+        end_time="2024-01-09",
+        rrule="FREQ=WEEKLY;COUNT=5",
+        overrides={"20240205": {"start_time": "2024-01-31", "end_time": "2024-02-01"}},
+    )
+
+    occurrences = {o["id"]: o for o in expand_series(master, WINDOW_START, WINDOW_END)}
+
+    assert occurrences["series-1_20240205"]["start_time"] == "2024-01-31"
+    assert len(occurrences) == 5
+
+
+def test_timezone_keeps_wall_clock_time_across_dst():
+    # Berlin switches to CEST on 2024-03-31; the series starts the day before
+    master = weekly_master(
+        start_time="2024-03-30T09:00:00+01:00",
+        end_time="2024-03-30T09:30:00+01:00",
+        timezone="Europe/Berlin",
+        rrule="FREQ=DAILY;COUNT=2",
+    )
+
+    occurrences = expand_series(
+        master, datetime(2024, 3, 29, tzinfo=timezone.utc), datetime(2024, 4, 2, tzinfo=timezone.utc)
+    )
+
+    assert [o["start_time"] for o in occurrences] == [
+        "2024-03-30T09:00:00+01:00",
+        "2024-03-31T09:00:00+02:00",
+    ]
+
+
+def test_all_day_series():
+    master = weekly_master(start_time="2024-01-08", end_time="2024-01-09", rrule="FREQ=DAILY;COUNT=3")
+
+    occurrences = expand_series(master, WINDOW_START, WINDOW_END)
+
+    assert [(o["start_time"], o["end_time"]) for o in occurrences] == [
+        ("2024-01-08", "2024-01-09"),
+        ("2024-01-09", "2024-01-10"),
+        ("2024-01-10", "2024-01-11"),
+    ]
+    assert occurrences[0]["id"] == "series-1_20240108"
+
+
+def test_expand_events_passes_single_events_through():
+    single = {"id": "single-1", "title": "Lunch", "start_time": "2024-01-10T12:00:00+00:00"}
+
+    results = expand_events([single, weekly_master()], WINDOW_START, WINDOW_END)
+
+    assert results[0] is single
+    assert len(results) == 5
+
+
+def test_expand_events_caches_by_series_version_and_window():
+    master = weekly_master()
+    expand_events([master], WINDOW_START, WINDOW_END)
+
+    series = series_key("user-1", "apple", "series-1")
+    expected_key = (series, "etag-1", WINDOW_START.isoformat(), WINDOW_END.isoformat())
+    assert recurrence.occurrence_cache.get(expected_key) is not None
+
+    # A new version is a different key, so the edit is picked up
+    edited = weekly_master(series_version="etag-2", title="Review v2")
+    results = expand_events([edited], WINDOW_START, WINDOW_END)
+    assert {o["title"] for o in results} == {"Review v2"}
+
+
+def test_expand_events_keys_live_docs_by_id():
+    # Live search results carry neither apple_event_id nor series_version
+    first = weekly_master(apple_event_id=None, series_version=None, updated_at="20240101T000000Z")
+    second = weekly_master(id="series-2", apple_event_id=None, series_version=None,
+                           updated_at="20240101T000000Z", title="Standup")
+
+    expand_events([first], WINDOW_START, WINDOW_END)
+    results = expand_events([second], WINDOW_START, WINDOW_END)
+
+    assert {o["title"] for o in results} == {"Standup"}
+    assert {o["recurring_event_id"] for o in results} == {"series-2"}
+
+
+def test_expand_events_returns_copies():
+    results = expand_events([weekly_master()], WINDOW_START, WINDOW_END)
+    results[0]["title"] = "mutated"
+
+    again = expand_events([weekly_master()], WINDOW_START, WINDOW_END)
+
+    assert again[0]["title"] == "Review"
+
+
+def test_unversioned_series_are_not_cached():
+    expand_events([weekly_master(series_version=None)], WINDOW_START, WINDOW_END)
+
+    assert recurrence.occurrence_cache._entries == {}
+
+
+def test_cache_invalidate_drops_every_window_of_a_series():
+    cache = OccurrenceCache(max_entries=10)
+    cache.put(("a", "v1", "w1", "w2"), [{"id": 1}])
+    cache.put(("a", "v1", "w3", "w4"), [{"id": 2}])
+    cache.put(("b", "v1", "w1", "w2"), [{"id": 3}])
+
+    cache.invalidate("a")
+
+    assert cache.get(("a", "v1", "w1", "w2")) is None
+    assert cache.get(("a", "v1", "w3", "w4")) is None
+    assert cache.get(("b", "v1", "w1", "w2")) == [{"id": 3}]
+
+
+def test_cache_evicts_least_recently_used():
+    cache = OccurrenceCache(max_entries=2)
+    cache.put(("a", "v", "w", "w"), [])
+    cache.put(("b", "v", "w", "w"), [])
+    cache.get(("a", "v", "w", "w"))
+    cache.put(("c", "v", "w", "w"), [])
+
+    assert cache.get(("b", "v", "w", "w")) is None
+    assert cache.get(("a", "v", "w", "w")) == []
+    # Evicted keys are no longer tracked for their series
+    assert "b" not in cache._keys_by_series
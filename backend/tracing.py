@@ -0,0 +1,285 @@
+"""
+Distributed Tracing (OpenTelemetry)
+
+Spans cover HTTP handlers (TracingMiddleware), calls to Google, Graph and
+CalDAV (recorded by provider_calls.py), MongoDB commands (a pymongo
+CommandListener) and background jobs (the ``traced`` decorator). Jobs
+queued with FastAPI BackgroundTasks or asyncio tasks inherit the request's
+trace context, so a webhook, the sync it triggers, the provider pages it
+fetches and the upserts it makes end up in one trace.
+
+Configuration:
+
+- TRACING_EXPORTER: ``none`` (default), ``file``, ``otlp`` or ``console``
+- TRACING_FILE: JSON-lines file for the file exporter; ``{pid}`` is
+  replaced by the worker's process id
+- TRACING_SAMPLE_RATIO: share of new traces recorded (0.0-1.0); requests
+  carrying a ``traceparent`` header follow the caller's decision
+- OTEL_SERVICE_NAME and the standard OTEL_EXPORTER_OTLP_* variables
+
+The OpenTelemetry SDK is imported only when tracing is enabled; with
+``none`` every helper here is a no-op.
+"""
+
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from pymongo import monitoring
+
+from metrics import command_labels, route_template
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces-{pid}.jsonl")
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "unified-calendar-backend")
+
+TRACING_CONFIGURED = TRACING_EXPORTER not in ("", "none")
+
+_tracer = None
+_provider = None
+_trace = None
+_context = None
+_propagate = None
+
+
+def setup_tracing():
+    """
+    Create the tracer provider and exporter for this worker (called on
+    application startup, after gunicorn has forked the worker).
+    """
+    global _tracer, _provider, _trace, _context, _propagate
+    if not TRACING_CONFIGURED or _tracer is not None:
+        return
+
+    try:
+        from opentelemetry import context, propagate, trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        logger.error("TRACING_EXPORTER is set but opentelemetry-sdk is not installed; tracing disabled")
+        return
+
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        exporter = OTLPSpanExporter()
+    elif TRACING_EXPORTER == "file":
+        path = TRACING_FILE.format(pid=os.getpid())
+        exporter = ConsoleSpanExporter(
+            out=open(path, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + os.linesep,
+        )
+    elif TRACING_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+    else:
+        logger.error(f"Unknown TRACING_EXPORTER '{TRACING_EXPORTER}'; tracing disabled")
+        return
+
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _trace, _context, _propagate = trace, context, propagate
+    _tracer = _provider.get_tracer(__name__)
+    logger.info(f"Tracing enabled: exporter={TRACING_EXPORTER} sample_ratio={TRACING_SAMPLE_RATIO}")
+
+
+def shutdown_tracing():
+    """
+    Flush and stop the exporter (called on application shutdown).
+    """
+    global _tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer = None
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None):
+    """
+    Run a block in a span that is a child of the current one.
+
+    Args:
+        name (str): Span name
+        kind (str): "internal", "server" or "client"
+        attributes (Dict): Span attributes
+
+    Yields:
+        Span: The span, or None when tracing is disabled
+    """
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(
+        name, kind=_span_kind(kind), attributes=attributes
+    ) as span:
+        yield span
+
+
+def record_span(name: str, duration: float, kind: str = "client",
+                attributes: Optional[Dict[str, Any]] = None, error: bool = False):
+    """
+    Record a span for an operation that has just finished, as a child of
+    the current span. Used where only the end of the operation is observed
+    (provider call accounting, MongoDB command events).
+
+    Args:
+        name (str): Span name
+        duration (float): Seconds the operation took
+        kind (str): "internal", "server" or "client"
+        attributes (Dict): Span attributes
+        error (bool): Mark the span as failed
+    """
+    if _tracer is None:
+        return
+    end = time.time_ns()
+    span = _tracer.start_span(
+        name,
+        kind=_span_kind(kind),
+        attributes=attributes,
+        start_time=end - int(duration * 1e9),
+    )
+    if error:
+        span.set_status(_trace.Status(_trace.StatusCode.ERROR))
+    span.end(end_time=end)
+
+
+def traced(name: str):
+    """
+    Decorator running an async job in its own span. Jobs started from a
+    request (BackgroundTasks) become part of the request's trace; jobs run
+    by background loops start new traces.
+
+    Args:
+        name (str): Span name, e.g. "job google.incremental_sync"
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with start_span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _span_kind(kind: str):
+    return {
+        "server": _trace.SpanKind.SERVER,
+        "client": _trace.SpanKind.CLIENT,
+    }.get(kind, _trace.SpanKind.INTERNAL)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a server span per request.
+
+    Incoming ``traceparent`` headers are honored. The span ends when the
+    response has been sent, but its context stays active for the rest of
+    the request, so BackgroundTasks run as children of it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _tracer is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        parent = _propagate.extract(headers)
+        span = _tracer.start_span(
+            f"{scope['method']} {scope['path']}",
+            context=parent,
+            kind=_trace.SpanKind.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+        )
+        token = _context.attach(_trace.set_span_in_context(span, parent))
+        ended = False
+
+        def finish(status: Optional[int]):
+            nonlocal ended
+            if ended:
+                return
+            ended = True
+            route = route_template(scope)
+            span.update_name(f"{scope['method']} {route}")
+            span.set_attribute("http.route", route)
+            if status is not None:
+                span.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    span.set_status(_trace.Status(_trace.StatusCode.ERROR))
+            span.end()
+
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish(status)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            span.record_exception(e)
+            finish(500)
+            raise
+        finally:
+            finish(status)
+            _context.detach(token)
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """
+    pymongo CommandListener recording a client span per command. Motor
+    runs commands in threads with a copy of the caller's context, so the
+    spans nest under the request or job that issued them.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Any, Any] = {}
+
+    def started(self, event):
+        if _tracer is not None:
+            self._pending[(event.connection_id, event.request_id)] = command_labels(event)
+
+    def succeeded(self, event):
+        self._record(event, error=False)
+
+    def failed(self, event):
+        self._record(event, error=True)
+
+    def _record(self, event, error: bool):
+        labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels is None:
+            return
+        collection, command = labels
+        record_span(
+            f"mongodb {command} {collection}".rstrip(),
+            event.duration_micros / 1e6,
+            attributes={
+                "db.system": "mongodb",
+                "db.operation.name": command,
+                "db.collection.name": collection,
+            },
+            error=error,
+        )
+
+
+def tracing_command_listeners():
+    """
+    Listeners to attach to the MongoDB client; none unless tracing is configured.
+    """
+    return [MongoCommandTracer()] if TRACING_CONFIGURED else []
@@ -0,0 +1,130 @@
+"""
+Startup Warmup
+
+After a restart the first requests would otherwise pay for opening MongoDB
+connections, parsing Google discovery documents, downloading Apple's JWKS
+and MSAL authority discovery. run_warmup does that work once per worker,
+in the background, while /health already answers.
+
+Steps marked required (connection pool, indexes) must succeed before the
+worker reports ready on /ready; they are retried until they do. Cache
+priming steps are best effort: a failure is reported and the cache fills
+on first use instead.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dependencies import db
+from google_oauth import get_google_client_config
+from metrics import WARMUP_READY
+from oauth_state_store import get_oauth_state_store
+from providers import load_plugin_attr, provider_hooks
+
+logger = logging.getLogger(__name__)
+
+# Connections opened up front (concurrent pings each check one out)
+WARMUP_MONGO_CONNECTIONS = int(os.getenv("WARMUP_MONGO_CONNECTIONS", "4"))
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))
+
+
+class WarmupState:
+    """
+    Progress of the warmup phase, reported by /ready.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[datetime] = None
+        self.completed_at: Optional[datetime] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "steps": self.steps,
+        }
+
+
+warmup_state = WarmupState()
+
+WarmupStep = Tuple[str, Callable[[], Awaitable[Any]], bool]
+
+
+async def _open_mongo_pool():
+    await asyncio.gather(*[db.command("ping") for _ in range(max(WARMUP_MONGO_CONNECTIONS, 1))])
+
+
+async def _build_google_oauth_config():
+    get_google_client_config()
+
+
+def _plugin_step(reference: str, required: bool) -> WarmupStep:
+    async def run():
+        await load_plugin_attr(reference)()
+    return (reference, run, required)
+
+
+def warmup_steps() -> List[WarmupStep]:
+    """
+    Warmup steps for this worker as (name, coroutine function, required).
+    """
+    steps: List[WarmupStep] = [
+        ("mongo_pool", _open_mongo_pool, True),
+        ("oauth_state_indexes", get_oauth_state_store().ensure_indexes, True),
+        ("google_oauth_config", _build_google_oauth_config, False),
+    ]
+    steps.extend(_plugin_step(reference, True) for reference in provider_hooks("startup"))
+    steps.extend(_plugin_step(reference, False) for reference in provider_hooks("warmup"))
+    return steps
+
+
+async def _run_step(name: str, step: Callable[[], Awaitable[Any]], required: bool) -> bool:
+    started = time.perf_counter()
+    try:
+        await step()
+        ok, error = True, None
+    except Exception as e:
+        ok, error = False, str(e)
+        log = logger.error if required else logger.warning
+        log(f"Warmup step {name} failed: {error}")
+
+    warmup_state.steps[name] = {
+        "status": "ok" if ok else "failed",
+        "required": required,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "error": error,
+    }
+    return ok
+
+
+async def run_warmup(steps: Optional[List[WarmupStep]] = None):
+    """
+    Run all warmup steps concurrently, retrying failed required steps, then
+    mark the worker ready.
+    """
+    warmup_state.started_at = datetime.utcnow()
+    WARMUP_READY.set(0)
+    pending = steps if steps is not None else warmup_steps()
+
+    while True:
+        results = await asyncio.gather(*[_run_step(*step) for step in pending])
+        pending = [step for step, ok in zip(pending, results) if not ok and step[2]]
+        if not pending:
+            break
+        logger.warning(
+            f"Warmup: {len(pending)} required steps failed; retrying in {WARMUP_RETRY_SECONDS:.0f}s"
+        )
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+    warmup_state.ready = True
+    WARMUP_READY.set(1)
+    warmup_state.completed_at = datetime.utcnow()
+    elapsed = (warmup_state.completed_at - warmup_state.started_at).total_seconds()
+    logger.info(f"Warmup complete in {elapsed:.2f}s")
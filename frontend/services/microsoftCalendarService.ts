@@ -18,7 +18,7 @@ export interface MicrosoftEvent {
   start_time: string;
   end_time: string;
   location?: string;
-  calendar_source: 'Microsoft';
+  calendar_source: 'microsoft';
   microsoft_event_id?: string;
   microsoft_calendar_id?: string;
   created_at?: string;